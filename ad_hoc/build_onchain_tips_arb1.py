@@ -2,26 +2,27 @@ import json
 import logging
 import os
 import random
-import sqlite3
 import sys
-import urllib.request
-from decimal import Decimal
 from logging.handlers import RotatingFileHandler
 from datetime import datetime
 from time import strftime, localtime
-from urllib import request
 
 import praw
 from dotenv import load_dotenv
-from web3 import Web3
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(os.path.dirname(SCRIPT_DIR))
+from cache.user_registry import UserRegistry
+from chain.client_pool import ChainClientPool
+from chain.tip_indexer import TipIndexer
 from database import database
 
 ARB1_TIPPING_CONTRACT = "0x403EB731A37cf9e41d72b9A97aE6311ab44bE7b9"
 ARB1_DONUT = "0xF42e2B8bc2aF8B110b65be98dB1321B1ab8D44f5"
 
+# the last block scanned for Tip events
+CURSOR_SETTING = "onchain_tip_arb1_block"
+
 if __name__ == '__main__':
     # load environment variables
     load_dotenv()
@@ -30,11 +31,6 @@ if __name__ == '__main__':
     with open(os.path.normpath("../config.json"), 'r') as f:
         config = json.load(f)
 
-    # locate database
-    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-    db_path = os.path.join(BASE_DIR, "../database/donut-bot.db")
-    db_path = os.path.normpath(db_path)
-
     # set up logging
     formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
     log_name = os.path.basename(__file__)[:-3]
@@ -59,38 +55,36 @@ if __name__ == '__main__':
     with open(os.path.normpath("../contracts/tipping_contract_abi.json"), 'r') as f:
         tip_abi = json.load(f)
 
-    w3 = Web3(Web3.HTTPProvider(os.getenv('INFURA_ARB1_PROVIDER')))
-    tipping_contract = w3.eth.contract(address=Web3.to_checksum_address(ARB1_TIPPING_CONTRACT), abi=tip_abi)
+    chains = ChainClientPool(providers={"arb1": os.getenv('INFURA_ARB1_PROVIDER')})
+    w3 = chains.web3("arb1")
+    tipping_contract = chains.contract("arb1", ARB1_TIPPING_CONTRACT, tip_abi)
 
     if not w3.is_connected():
         exit(4)
 
-    block = w3.eth.get_block('latest')
-    starting_block = block["number"] - 5000
-
-    tips = []
-    events = tipping_contract.events.Tip().get_logs(fromBlock=starting_block)
+    # only the blocks after the last run are scanned, so this can run every minute
+    indexer = TipIndexer(w3, tipping_contract, CURSOR_SETTING)
+    to_block = w3.eth.block_number
+    events = indexer.scan(to_block)
 
     if not events:
+        indexer.save_cursor(to_block)
         exit(0)
 
     print("tips detected, grabbing users.json file...")
-    users = json.load(request.urlopen(f"https://ethtrader.github.io/donut.distribution/users.json"))
-
-    for event in events:
-        receipt = w3.eth.get_transaction_receipt(event.transactionHash)
-
-        if not receipt['status']:
-            continue
+    users = UserRegistry()
+    if not users.refresh():
+        exit(4)
 
+    tips = []
+    for event, timestamp in events:
         block = event.blockNumber
         tx_hash = event.transactionHash.hex()
-        timestamp = w3.eth.get_block(event.blockNumber).timestamp
         from_address = event.args["from"]
         to_address = event.args["to"]
         amount = w3.from_wei(int(event.args["amount"]), "ether")
 
-        user = next((u for u in users if u['address'].lower() == from_address.lower()), None)
+        user = users.by_address(from_address)
         if not user or int(amount) < 1:
             weight = 0
         else:
@@ -116,10 +110,6 @@ if __name__ == '__main__':
             datetime.fromtimestamp(timestamp), weight
         ))
 
-    if not tips:
-        logger.info("No tips found")
-        exit(0)
-
     logger.info("notify about new tips")
 
     sig = f'\n\n^(donut-bot v0.1.20240411-onchain-tip)'
@@ -132,17 +122,23 @@ if __name__ == '__main__':
     tx_hash_index = 2
 
     for tip in tips:
-        if 't1_' in tip[content_id_index]:
-            # get the submission that the comment was made on
-            submission_id = reddit.comment(tip[content_id_index]).submission.fullname
-            tip_thread_id = database.get_comment_thread_for_submission(submission_id)
-        else:
-            tip_thread_id = database.get_comment_thread_for_submission(tip[content_id_index])
+        if not tip[content_id_index]:
+            continue
+
+        sender = users.by_address(tip[from_address_index])
+        receiver = users.by_address(tip[to_address_index])
+
+        if not sender or not receiver:
+            continue
 
-        sender = next((u for u in users if u['address'] == tip[from_address_index]), None)
-        receiver = next((u for u in users if u['address'] == tip[to_address_index]), None)
+        try:
+            if 't1_' in tip[content_id_index]:
+                # get the submission that the comment was made on
+                submission_id = reddit.comment(tip[content_id_index]).submission.fullname
+                tip_thread_id = database.get_comment_thread_for_submission(submission_id)
+            else:
+                tip_thread_id = database.get_comment_thread_for_submission(tip[content_id_index])
 
-        if sender and receiver:
             reply = f"u/{sender['username']} has tipped u/{receiver['username']} {round(float(tip[amount_index]), 5)} {tip[token_index]}"
             link = f"https://arbiscan.io/tx/{tip[tx_hash_index]}"
             reply += f'\n\n[LINK (arbiscan.io)]({link})' + sig
@@ -155,22 +151,13 @@ if __name__ == '__main__':
                 tip_thread = reddit.comment(tip[content_id_index])
 
             tip_thread.reply(reply)
+        except Exception as e:
+            logger.error(f"  unable to notify about tx_hash {tip[tx_hash_index]}: {e}")
 
     logger.info("saving tips to database")
 
-    # save the tips to db
-    with sqlite3.connect(db_path) as db:
-        def adapt_decimal(d):
-            return str(d)
-
-        sqlite3.register_adapter(Decimal, adapt_decimal)
-
-        sql = """
-            insert or replace into onchain_tip (from_address, to_address, tx_hash, chain_id, block, amount, 
-            token, content_id, timestamp, weight) values (?,?,?,?,?,?,?,?,?,?)
-        """
-
-        cursor = db.cursor()
-        cursor.executemany(sql, tips)
+    # save the tips to db, then move the cursor past them
+    database.insert_onchain_tips(tips)
+    indexer.save_cursor(to_block)
 
-    logger.info("complete")
\ No newline at end of file
+    logger.info("complete")
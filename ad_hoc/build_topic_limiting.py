@@ -1,11 +1,15 @@
 import json
 import os.path
-import re
+import sys
 import time
 import urllib.request
 import praw
 from dotenv import load_dotenv
 
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(SCRIPT_DIR))
+from topics.topic_classifier import TopicClassifier
+
 if __name__ == '__main__':
     # load environment variables
     load_dotenv()
@@ -28,57 +32,24 @@ if __name__ == '__main__':
 
     topic_results = []
 
+    # inject 'current' and 'submissions' field to the topic meta
+    for topic in topics:
+        topic["current"] = 0
+        topic["submissions"] = []
+
+    # the same classifier post-bot uses, so both agree on the topic of a post
+    classifier = TopicClassifier(topics)
+
     for idx, community_token in enumerate(config["community_tokens"]):
         community = community_token["community"]
         if "r/" in community:
             community = community[2:]
 
         for post in reddit.subreddit(community).hot(limit=50):
-            for topic in topics:
-                # inject 'current' and 'submissions' field to the topic meta
-                if "current" not in topic:
-                    topic["current"] = 0
-                    topic["submissions"] = []
-
-                if topic["community"] != community:
-                    continue
-
-                topic_ignore = []
-                for ignore in topic["overrides"]["ignore"]:
-                    if not ignore.startswith("t3_"):
-                        topic_ignore.append("t3_" + ignore)
-                    else:
-                        topic_ignore.append(ignore)
-
-                topic_include = []
-                for include in topic["overrides"]["include"]:
-                    if not include.startswith("t3_"):
-                        topic_include.append("t3_" + include)
-                    else:
-                        topic_include.append(include)
-
-                if post.fullname in topic_ignore:
-                    # skip to the next topic
-                    continue
-
-                # override says this post should be included in this topic
-                if post.fullname in topic_include:
-                    topic["current"] += 1
-                    topic["submissions"].append(post.shortlink)
-                    break
-
-                # otherwise test all the patterns
-                topic_match = False
-                for pattern in topic["patterns"]:
-                    hot_match = re.search(pattern, post.title.lower())
-                    if hot_match:
-                        topic["current"] += 1
-                        topic_match = True
-                        topic["submissions"].append(post.shortlink)
-                        break
-
-                if topic_match:
-                    break
+            topic = classifier.classify(post.fullname, post.title, community)
+            if topic:
+                topic["current"] += 1
+                topic["submissions"].append(post.shortlink)
 
         topic_results.extend([
             {
@@ -1,72 +1,52 @@
 import json
 import os.path
+import sys
 import time
 import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 
 from dotenv import load_dotenv
 from web3 import Web3
 
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(SCRIPT_DIR))
+from chain.balance_snapshot import BalanceSnapshot, STAKING_EVENTS, TRANSFER_EVENTS
+from chain.client_pool import ChainClientPool
+from chain.multicall import Multicall
 
-def calc_mainnet_donut(address):
-    for j in range(1, 10):
-        try:
-            eth_donut_balance = donut_eth_contract.functions.balanceOf(address).call()
-            staked_mainnet_balance = staking_eth_contract.functions.balanceOf(
-                address).call() * mainnet_multiplier
-            return w3_eth.from_wei(eth_donut_balance + staked_mainnet_balance, "ether")
-        except Exception as e:
-            print(e)
-            print(f'sleep {j * 60}...')
-            time.sleep(j * 60)
-            continue
-
-    print("  unable to query calc_mainnet_donut() at this time, attempt at a later time...")
-    exit(4)
+# an aggregate3 call of BATCH_SIZE balanceOf calls takes a lot longer than a single call
+RPC_TIMEOUT = 60
 
 
-def calc_gno_donut(address):
-    for j in range(1, 10):
-        try:
-            gno_donut_balance = donut_gno_contract.functions.balanceOf(address).call()
-            staked_gno_balance = staking_gno_contract.functions.balanceOf(address).call() * gno_multiplier
-            return w3_gno.from_wei(gno_donut_balance + staked_gno_balance, "ether")
-        except Exception as e:
-            print(e)
-            print(f'sleep {j * 60}...')
-            time.sleep(j * 60)
-            continue
+def calc_user_weight(balances, address, sushi_lp):
+    """
+    Calculates the contrib, donut and weight of a user from the balance snapshot.
+    :param balances: the balances in wei, by token and then by address
+    :param address: the user's address
+    :param sushi_lp: donuts in the sushi pool by lowercase owner address
+    :return: a tuple of (contrib, eth donuts, gno donuts, arb1 donuts)
+    """
+    contrib = int(Web3.from_wei(balances["contrib"][address], "ether"))
 
-    print("  unable to query calc_gno_donut() at this time, attempt at a later time...")
-    exit(4)
+    staked_mainnet_balance = balances["staking_eth"][address] * mainnet_multiplier
+    eth_donuts = int(Web3.from_wei(balances["donut_eth"][address] + staked_mainnet_balance, "ether"))
 
+    staked_gno_balance = balances["staking_gno"][address] * gno_multiplier
+    gno_donuts = int(Web3.from_wei(balances["donut_gno"][address] + staked_gno_balance, "ether"))
 
-def calc_arb_donut(address, lp_providers):
-    for j in range(1, 10):
-        try:
-            arb1_donut_balance = donut_arb1_contract.functions.balanceOf(address).call()
-            sushi_lp_donuts = sum([int(s["tokens"]) for s in lp_providers if s["owner"].lower() == address.lower()])
-            return w3_arb.from_wei(arb1_donut_balance, "ether") + sushi_lp_donuts
-        except Exception as e:
-            print(e)
-            print(f'sleep {j * 60}...')
-            time.sleep(j * 60)
-            continue
+    arb_donuts = int(Web3.from_wei(balances["donut_arb1"][address], "ether") + sushi_lp.get(address.lower(), 0))
 
-    print("  unable to query calc_arb_donut() at this time, attempt at a later time...")
-    exit(4)
+    return contrib, eth_donuts, gno_donuts, arb_donuts
 
 
 def get_sushi_providers():
-    lp_providers = []
+    lp_providers = {}
     liquidity = json.load(urllib.request.urlopen("https://raw.githubusercontent.com/mattg1981/donut-bot-output/main/"
                                                  "liquidity/liquidity_leaders.json"))
 
     for liq in liquidity:
-        lp_providers.append({
-            "id": liq["id"],
-            "owner": liq["owner"],
-            "tokens": liq['donut_in_lp']
-        })
+        owner = liq["owner"].lower()
+        lp_providers[owner] = lp_providers.get(owner, 0) + int(liq['donut_in_lp'])
 
     return lp_providers
 
@@ -77,11 +57,11 @@ def calculate_staking_mulitpliers():
     was_success = False
     for j in range(1, 10):
         try:
-            eth_lp_supply = lp_eth_contract.functions.totalSupply().call()
-            gno_lp_supply = lp_gno_contract.functions.totalSupply().call()
+            eth_lp_supply = lp_eth_contract.functions.totalSupply().call(block_identifier=blocks["eth"])
+            gno_lp_supply = lp_gno_contract.functions.totalSupply().call(block_identifier=blocks["gno"])
 
-            uniswap_eth_donuts = lp_eth_contract.functions.getReserves().call()
-            uniswap_gno_donuts = lp_gno_contract.functions.getReserves().call()
+            uniswap_eth_donuts = lp_eth_contract.functions.getReserves().call(block_identifier=blocks["eth"])
+            uniswap_gno_donuts = lp_gno_contract.functions.getReserves().call(block_identifier=blocks["gno"])
 
             mainnet_multiplier = uniswap_eth_donuts[0] / eth_lp_supply
             gno_multiplier = uniswap_gno_donuts[0] / gno_lp_supply
@@ -98,25 +78,74 @@ def calculate_staking_mulitpliers():
         exit(4)
 
 
+def snapshot_chain(chain, tokens, addresses):
+    """
+    Brings the chain's balance snapshot up to the chain's snapshot block, only the addresses with a balance change
+    since the previous run are read.
+    :return: the balances in wei, by token name and then by address
+    """
+    multicall = Multicall(chains.web3(chain))
+    snapshot = BalanceSnapshot(chain, chains.web3(chain), tokens, multicall)
+    balances = snapshot.refresh(addresses, blocks[chain])
+
+    print(f"  [{chain}] done at block {blocks[chain]} - balances read: {snapshot.queried} | "
+          f"aggregate3 calls: {multicall.aggregate_calls} | retried: {multicall.retried}")
+    return balances
+
+
+def snapshot_balances(addresses):
+    """
+    Takes the balance snapshot of the three chains at the same time.  A chain that fails keeps the balances it
+    did read, the next run picks up from there.
+    :return: the balances in wei, by token name and then by address
+    """
+    tokens = {
+        "eth": {"donut_eth": (donut_eth_contract, TRANSFER_EVENTS),
+                "staking_eth": (staking_eth_contract, STAKING_EVENTS)},
+        "gno": {"donut_gno": (donut_gno_contract, TRANSFER_EVENTS),
+                "staking_gno": (staking_gno_contract, STAKING_EVENTS)},
+        "arb1": {"donut_arb1": (donut_arb1_contract, TRANSFER_EVENTS),
+                 "contrib": (contrib_contract, TRANSFER_EVENTS)},
+    }
+
+    balances = {}
+    with ThreadPoolExecutor(max_workers=len(tokens)) as executor:
+        futures = {chain: executor.submit(snapshot_chain, chain, t, addresses) for chain, t in tokens.items()}
+        for chain, future in futures.items():
+            try:
+                balances.update(future.result())
+            except Exception as e:
+                print(e)
+                print(f"  unable to snapshot [{chain}] at this time, attempt at a later time...")
+                exit(4)
+
+    return balances
+
+
 def setup_abi_and_contracts():
-    global w3_eth, w3_gno, w3_arb, f, contrib_contract, donut_eth_contract, donut_gno_contract, donut_arb1_contract, \
-        staking_eth_contract, staking_gno_contract, lp_gno_contract, lp_eth_contract
+    global chains, blocks, w3_eth, w3_gno, w3_arb, f, contrib_contract, donut_eth_contract, donut_gno_contract, \
+        donut_arb1_contract, staking_eth_contract, staking_gno_contract, lp_gno_contract, lp_eth_contract
+
+    chains = ChainClientPool(default_timeout=RPC_TIMEOUT)
 
-    w3_eth = Web3(Web3.HTTPProvider(os.getenv('INFURA_ETH_PROVIDER')))
+    w3_eth = chains.web3("eth")
     if not w3_eth.is_connected():
         print('INFURA_ETH_PROVIDER failed to connect...')
         exit(4)
 
-    w3_gno = Web3(Web3.HTTPProvider(os.getenv('ANKR_API_PROVIDER')))
+    w3_gno = chains.web3("gno")
     if not w3_gno.is_connected():
         print('ANKR_API_PROVIDER failed to connect...')
         exit(4)
 
-    w3_arb = Web3(Web3.HTTPProvider(os.getenv('CHAINSTACK_ARB1_PROVIDER')))
-    if not w3_gno.is_connected():
+    w3_arb = chains.web3("arb1")
+    if not w3_arb.is_connected():
         print('CHAINSTACK_ARB1_PROVIDER failed to connect...')
         exit(4)
 
+    # every balance and multiplier is read at the same block of its chain, so the snapshot is consistent
+    blocks = {"eth": w3_eth.eth.block_number, "gno": w3_gno.eth.block_number, "arb1": w3_arb.eth.block_number}
+
     # load abi's
     with open(os.path.normpath("../contracts/contrib_gnosis_abi.json"), 'r') as f:
         contrib_abi = json.load(f)
@@ -128,22 +157,14 @@ def setup_abi_and_contracts():
         uniswap_abi = json.load(f)
 
     # contract objects
-    contrib_contract = w3_arb.eth.contract(address=w3_arb.to_checksum_address(config['contracts']['arb1']['contrib']),
-                                           abi=contrib_abi)
-    donut_eth_contract = w3_eth.eth.contract(address=w3_eth.to_checksum_address(config["contracts"]["mainnet"]
-                                                                                ["donut"]), abi=donut_abi)
-    donut_gno_contract = w3_gno.eth.contract(address=w3_gno.to_checksum_address(config["contracts"]["gnosis"]
-                                                                                ["donut"]), abi=donut_abi)
-    donut_arb1_contract = w3_arb.eth.contract(address=w3_arb.to_checksum_address(config["contracts"]["arb1"]
-                                                                                 ["donut"]), abi=donut_abi)
-    staking_eth_contract = w3_eth.eth.contract(address=w3_eth.to_checksum_address(config["contracts"]["mainnet"]
-                                                                                  ["staking"]), abi=staking_abi)
-    staking_gno_contract = w3_gno.eth.contract(address=w3_gno.to_checksum_address(config["contracts"]["gnosis"]
-                                                                                  ["staking"]), abi=staking_abi)
-    lp_gno_contract = w3_gno.eth.contract(address=w3_gno.to_checksum_address(
-        config["contracts"]["gnosis"]["lp"]), abi=uniswap_abi)
-    lp_eth_contract = w3_eth.eth.contract(address=w3_eth.to_checksum_address(
-        config["contracts"]["mainnet"]["lp"]), abi=uniswap_abi)
+    contrib_contract = chains.contract("arb1", config['contracts']['arb1']['contrib'], contrib_abi)
+    donut_eth_contract = chains.contract("eth", config["contracts"]["mainnet"]["donut"], donut_abi)
+    donut_gno_contract = chains.contract("gno", config["contracts"]["gnosis"]["donut"], donut_abi)
+    donut_arb1_contract = chains.contract("arb1", config["contracts"]["arb1"]["donut"], donut_abi)
+    staking_eth_contract = chains.contract("eth", config["contracts"]["mainnet"]["staking"], staking_abi)
+    staking_gno_contract = chains.contract("gno", config["contracts"]["gnosis"]["staking"], staking_abi)
+    lp_gno_contract = chains.contract("gno", config["contracts"]["gnosis"]["lp"], uniswap_abi)
+    lp_eth_contract = chains.contract("eth", config["contracts"]["mainnet"]["lp"], uniswap_abi)
 
 
 if __name__ == '__main__':
@@ -171,22 +192,17 @@ if __name__ == '__main__':
     print('finding all sushi lp providers')
     sushi_lp = get_sushi_providers()
 
+    print('snapshot balances')
+    balances = snapshot_balances(list(dict.fromkeys(u["address"] for u in user_json)))
+
     print('process users')
-    count = 0
     for u in user_json:
-        count += 1
         print(f"processing user {u['username']}")
 
-        user_address = u["address"]
-
-        contrib_token_balance_arb1 = contrib_contract.functions.balanceOf(user_address).call()
-        contrib = int(w3_arb.from_wei(contrib_token_balance_arb1, "ether"))
+        contrib, eth_donuts, gno_donuts, arb_donuts = calc_user_weight(balances, u["address"], sushi_lp)
         u["contrib"] = contrib
 
         # calculate donut
-        eth_donuts = int(calc_mainnet_donut(user_address))
-        gno_donuts = int(calc_gno_donut(user_address))
-        arb_donuts = int(calc_arb_donut(user_address, sushi_lp))
         total_donut = eth_donuts + gno_donuts + arb_donuts
         u["donut"] = total_donut
 
@@ -196,9 +212,6 @@ if __name__ == '__main__':
 
         print(f" contrib: [{contrib}] - donut: [{total_donut}] (eth: {eth_donuts}, gno: {gno_donuts}, arb1: {arb_donuts}) - weight: [{weight}]")
 
-        # getting a http 429 code, so we need to self throttle
-        time.sleep(.25)
-
     if os.path.exists(out_file):
         os.remove(out_file)
 
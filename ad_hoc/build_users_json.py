@@ -10,6 +10,7 @@ from web3 import Web3
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(os.path.dirname(SCRIPT_DIR))
+from cache.user_registry import UserRegistry
 from database import database
 
 
@@ -37,7 +38,11 @@ if __name__ == '__main__':
     db_path = os.path.join(BASE_DIR, "../database/donut-bot.db")
     db_path = os.path.normpath(db_path)
 
-    user_json = json.load(urllib.request.urlopen("https://ethtrader.github.io/donut.distribution/users.json"))
+    users = UserRegistry()
+    if not users.refresh():
+        exit(4)
+
+    user_json = users.users
 
     try:
         ### download registration details from the dao website
@@ -75,17 +80,17 @@ if __name__ == '__main__':
 
     for u in registered_users:
         try:
-            json_user = next(j for j in user_json if j["username"].lower() == u["username"].lower())
-            json_user["address"] = get_address(u["address"])
-        except StopIteration as e:
-            # not found in the enumerable
-            user_json.append({
-                "username": u["username"],
-                "address": get_address(u["address"]),
-                "contrib": 0,
-                "donut": 0,
-                "weight": 0
-            })
+            json_user = users.by_name(u["username"])
+            if json_user:
+                json_user["address"] = get_address(u["address"])
+            else:
+                users.add({
+                    "username": u["username"],
+                    "address": get_address(u["address"]),
+                    "contrib": 0,
+                    "donut": 0,
+                    "weight": 0
+                })
         except Exception as e:
             print(e)
             exit(4)
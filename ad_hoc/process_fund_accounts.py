@@ -5,10 +5,11 @@ import random
 import sys
 import urllib.request
 import math
+from concurrent.futures import ThreadPoolExecutor
+
 import praw
 
 from dotenv import load_dotenv
-from web3 import Web3
 from datetime import datetime
 from decimal import Decimal
 
@@ -16,8 +17,12 @@ from logging.handlers import RotatingFileHandler
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(os.path.dirname(SCRIPT_DIR))
+from chain.client_pool import get_pool
 from database import database as db
 
+# transactions looked up at the same time, the lookups are sent to the node as json-rpc batches
+LOOKUP_WORKERS = 20
+
 
 def send_any_notifications():
     # find previous transactions that need to be notified (if any)
@@ -117,49 +122,46 @@ if __name__ == '__main__':
 
     ignored_addresses = [account["address"] for account in config["funded_accounts_to_ignore"]]
 
-    w3 = Web3(Web3.HTTPProvider(os.getenv("CHAINSTACK_ARB1_PROVIDER")))
+    w3 = get_pool(config.get("chain_clients")).web3("arb1")
 
     if not w3.is_connected():
         logger.warning("  failed to connect, try next...")
         exit(4)
 
-    for tx in json_result["result"]:
-        # this bug has been corrected and this check should no longer be needed
-        # there is a bug with the arbiscan api where if you supply any number > 0 as the starting block it will not
-        # return results.  So we request all records and then filter here instead.
-        # if int(tx['blockNumber']) < starting_block:
-        #     continue
-
-        # only concern ourselves with pre-screened/valid tokens
-        # and ensure they are not from addresses that should be ignored
-        if (tx["contractAddress"].lower() in valid_tokens and tx["from"].lower() not in ignored_addresses
-                and tx["to"].lower() == config['contracts']['arb1']['multi-sig'].lower()):
-
-            tx_hash = tx["hash"]
-            w3_tx = w3.eth.get_transaction(tx_hash)
-            inpt = w3_tx.input.hex()
-
-            # not a transfer event
-            if not inpt[:10] == "0xa9059cbb":
-                logger.debug(f"not a transfer transaction [tx_hash]: {tx_hash}")
-                continue
-            else:
-                from_address = tx["from"]
-                to_address = tx["to"]
-                token = tx["tokenSymbol"]
-                blockchain_amount = tx["value"]
-                amount = Decimal(tx["value"]) / Decimal(math.pow(10, float(tx["tokenDecimal"])))
-                block = tx["blockNumber"]
-                timestamp = datetime.fromtimestamp(int(tx["timeStamp"]))
-
-                logger.info(
-                    f"transfer:: [from]: {from_address} [to]: {to_address} [amount]: {amount} [token]: {token} [tx_hash]: {tx_hash}")
-
-            logger.info("insert record into database...")
-
-            db.insert_funded_account(from_address, amount, token, block, tx_hash, timestamp)
-
-            logger.info("sucess...")
+    # only concern ourselves with pre-screened/valid tokens
+    # and ensure they are not from addresses that should be ignored
+    transfers = [tx for tx in json_result["result"]
+                 if tx["contractAddress"].lower() in valid_tokens and tx["from"].lower() not in ignored_addresses
+                 and tx["to"].lower() == config['contracts']['arb1']['multi-sig'].lower()]
+
+    with ThreadPoolExecutor(max_workers=LOOKUP_WORKERS) as executor:
+        w3_txs = list(executor.map(w3.eth.get_transaction, [tx["hash"] for tx in transfers]))
+
+    for tx, w3_tx in zip(transfers, w3_txs):
+        tx_hash = tx["hash"]
+        inpt = w3_tx.input.hex()
+
+        # not a transfer event
+        if not inpt[:10] == "0xa9059cbb":
+            logger.debug(f"not a transfer transaction [tx_hash]: {tx_hash}")
+            continue
+        else:
+            from_address = tx["from"]
+            to_address = tx["to"]
+            token = tx["tokenSymbol"]
+            blockchain_amount = tx["value"]
+            amount = Decimal(tx["value"]) / Decimal(math.pow(10, float(tx["tokenDecimal"])))
+            block = tx["blockNumber"]
+            timestamp = datetime.fromtimestamp(int(tx["timeStamp"]))
+
+            logger.info(
+                f"transfer:: [from]: {from_address} [to]: {to_address} [amount]: {amount} [token]: {token} [tx_hash]: {tx_hash}")
+
+        logger.info("insert record into database...")
+
+        db.insert_funded_account(from_address, amount, token, block, tx_hash, timestamp)
+
+        logger.info("sucess...")
 
     send_any_notifications()
     logger.info('complete.')
@@ -0,0 +1,40 @@
+import os
+import sqlite3
+import sys
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(SCRIPT_DIR))
+from database import connection
+
+###
+#   Rebuilds tip_round_totals (the totals behind !tip status and !tip sub) from earn2tip, e.g. after tips were
+#   edited or removed by hand.  The migration that created the table also fills it, it is run again in a single
+#   transaction, so the bot keeps reading the old totals until the new ones are complete.
+#
+#   usage: python3.11 rebuild_tip_round_totals.py [path to database]
+###
+
+MIGRATION_PATH = os.path.join(SCRIPT_DIR, "setup/migrations/0008_tip_round_totals.sql")
+
+
+def rebuild(db_path=None):
+    """
+    :return: the number of rows in tip_round_totals
+    """
+    with open(MIGRATION_PATH, 'r') as f:
+        sql = f.read()
+
+    with sqlite3.connect(db_path or connection.DB_PATH) as db:
+        try:
+            db.executescript(f"BEGIN;\n{sql}\nCOMMIT;")
+        except sqlite3.Error:
+            if db.in_transaction:
+                db.execute("ROLLBACK;")
+            raise
+
+        return db.execute("select count(*) from tip_round_totals;").fetchone()[0]
+
+
+if __name__ == '__main__':
+    rows = rebuild(sys.argv[1] if len(sys.argv) > 1 else None)
+    print(f"rebuilt tip_round_totals: {rows} rows")
@@ -0,0 +1,88 @@
+import os
+import re
+import sqlite3
+import sys
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(os.path.dirname(SCRIPT_DIR)))
+from database import connection
+
+###
+#   Applies the numbered .sql files in the migrations directory (e.g. 0001_hot_lookup_indexes.sql) that are newer
+#   than the schema_version recorded in the settings table.  Each migration runs in its own transaction, so
+#   migrations must not contain BEGIN/COMMIT statements and should be written to be idempotent.
+#
+#   usage: python3.11 migrate.py [path to database]
+###
+
+MIGRATIONS_DIR = os.path.join(SCRIPT_DIR, "migrations")
+SCHEMA_VERSION_SETTING = "schema_version"
+
+
+def get_migrations():
+    """
+    Returns the available migrations.
+    :return: a list of (version, path) tuples ordered by version
+    """
+    migrations = []
+    for f in os.listdir(MIGRATIONS_DIR):
+        match = re.match(r'^(\d+)_.*\.sql$', f)
+        if match:
+            migrations.append((int(match.group(1)), os.path.join(MIGRATIONS_DIR, f)))
+
+    return sorted(migrations)
+
+
+def get_schema_version(db):
+    result = db.execute("select value from settings where setting = ?;", [SCHEMA_VERSION_SETTING]).fetchone()
+    return int(result[0]) if result and result[0] else 0
+
+
+def migrate(db_path=None):
+    """
+    Brings the database up to the latest schema version.
+    :param db_path: the database to migrate, defaults to the bot database
+    :return: the list of versions that were applied
+    """
+    applied = []
+
+    with sqlite3.connect(db_path or connection.DB_PATH) as db:
+        current_version = get_schema_version(db)
+
+        for version, path in get_migrations():
+            if version <= current_version:
+                continue
+
+            with open(path, 'r') as f:
+                sql = f.read()
+
+            script = f"""
+                BEGIN;
+                {sql}
+                UPDATE settings SET value = '{version}', updated_at = CURRENT_TIMESTAMP 
+                WHERE setting = '{SCHEMA_VERSION_SETTING}';
+                INSERT INTO settings (setting, value)
+                SELECT '{SCHEMA_VERSION_SETTING}', '{version}'
+                WHERE NOT EXISTS (select 1 from settings where setting = '{SCHEMA_VERSION_SETTING}');
+                COMMIT;
+            """
+
+            try:
+                db.executescript(script)
+            except sqlite3.Error:
+                if db.in_transaction:
+                    db.execute("ROLLBACK;")
+                raise
+
+            applied.append(version)
+
+    return applied
+
+
+if __name__ == '__main__':
+    versions = migrate(sys.argv[1] if len(sys.argv) > 1 else None)
+
+    if versions:
+        print(f"applied migrations: {', '.join(str(v) for v in versions)}")
+    else:
+        print("database is up to date")
@@ -0,0 +1,36 @@
+-- indexes for the lookups performed on every comment / submission / tip
+
+-- has_processed_content() for every command and flair-bot
+CREATE INDEX IF NOT EXISTS idx_history_content_id_command ON history (content_id, command);
+
+-- registration, tipping and flair lookups
+CREATE INDEX IF NOT EXISTS idx_users_username ON users (username);
+CREATE INDEX IF NOT EXISTS idx_users_address ON users (address);
+
+-- !tip status (covering, so the round totals are read from the index alone)
+CREATE INDEX IF NOT EXISTS idx_earn2tip_from_user_created_date ON earn2tip (from_user, created_date, token, amount);
+CREATE INDEX IF NOT EXISTS idx_earn2tip_to_user_created_date ON earn2tip (to_user, created_date, token, amount);
+
+-- !tip sub
+CREATE INDEX IF NOT EXISTS idx_earn2tip_community_created_date ON earn2tip (community, created_date, token, amount);
+
+-- post-bot cooldown / posts per 24 hours and !post status
+CREATE INDEX IF NOT EXISTS idx_post_author_created_date ON post (author, created_date, tip_comment_id);
+
+-- !pow
+CREATE INDEX IF NOT EXISTS idx_potd_post_id ON potd (post_id);
+
+-- funded account processing
+CREATE INDEX IF NOT EXISTS idx_funded_account_tx_hash ON funded_account (tx_hash);
+CREATE INDEX IF NOT EXISTS idx_funded_account_block_number ON funded_account (block_number);
+CREATE INDEX IF NOT EXISTS idx_funded_account_processed_at ON funded_account (processed_at);
+CREATE INDEX IF NOT EXISTS idx_funded_account_from_address_processed_at ON funded_account (from_address, processed_at);
+
+-- !faucet eligibility
+CREATE INDEX IF NOT EXISTS idx_faucet_username_direction_created_date ON faucet (username, direction, created_date);
+
+-- current distribution round lookups
+CREATE INDEX IF NOT EXISTS idx_distribution_rounds_from_date_to_date ON distribution_rounds (from_date, to_date);
+
+-- active membership seasons
+CREATE INDEX IF NOT EXISTS idx_membership_season_start_date ON membership_season (start_date, end_date);
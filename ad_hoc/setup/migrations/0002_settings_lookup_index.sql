@@ -0,0 +1,2 @@
+-- get_setting() / set_setting(), used for the checkpoints of the long running services
+CREATE INDEX IF NOT EXISTS idx_settings_setting ON settings (setting);
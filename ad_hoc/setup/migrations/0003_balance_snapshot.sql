@@ -0,0 +1,11 @@
+-- per chain / token / address balances for build_user_weight.py, so a run only re-reads the addresses whose
+-- balance changed since the last snapshot.  balance is wei as text, uint256 does not fit an sqlite integer.
+-- the block the whole snapshot of a chain is complete at is kept in settings (balance_snapshot_<chain>_block)
+CREATE TABLE IF NOT EXISTS balance_snapshot (
+    chain        NVARCHAR2 NOT NULL,
+    token        NVARCHAR2 NOT NULL,
+    address      NVARCHAR2 NOT NULL,
+    balance      NVARCHAR2 NOT NULL,
+    block_number INTEGER   NOT NULL,
+    PRIMARY KEY (chain, token, address)
+) WITHOUT ROWID;
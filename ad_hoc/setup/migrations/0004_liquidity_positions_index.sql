@@ -0,0 +1,2 @@
+-- build_liquidity_leaders_v2: the saved position ids and the not-exists check on every new position
+CREATE INDEX IF NOT EXISTS idx_liquidity_positions_nft_id ON liquidity_positions (nft_id);
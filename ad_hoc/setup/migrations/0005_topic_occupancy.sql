@@ -0,0 +1,12 @@
+-- the topic counts post-bot keeps from the hot 50 (topics/occupancy.py), one row per limited topic.  other processes
+-- (e.g. the !topics command in main.py) read them from here instead of topic_limits.json on github.
+-- submissions is a json list of shortlinks, updated_at is epoch seconds of the hot listing the counts are from
+CREATE TABLE IF NOT EXISTS topic_occupancy (
+    community    NVARCHAR2 NOT NULL,
+    display_name NVARCHAR2 NOT NULL,
+    topic_limit  INTEGER   NOT NULL,
+    current      INTEGER   NOT NULL,
+    submissions  NVARCHAR2 NOT NULL,
+    updated_at   INTEGER   NOT NULL,
+    PRIMARY KEY (community, display_name)
+);
@@ -0,0 +1,9 @@
+-- submissions post-bot removed without recording them in post (e.g. media posts by non members), so a replayed
+-- submission is known to be processed without searching its comments for the bot's reply
+CREATE TABLE IF NOT EXISTS rejected_post (
+    submission_id NVARCHAR2 NOT NULL COLLATE NOCASE PRIMARY KEY,
+    author        NVARCHAR2 COLLATE NOCASE,
+    reason        NVARCHAR2 NOT NULL,
+    community     TEXT COLLATE NOCASE,
+    created_date  DATETIME  NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,9 @@
+-- history is written behind (database/processed_content.py) with insert or ignore, a (content_id, command) is
+-- recorded once.  duplicates written before are removed (the first record is kept) and the index is rebuilt as
+-- unique, it still covers has_processed_content().
+DELETE FROM history
+WHERE id NOT IN (SELECT min(id) FROM history GROUP BY content_id, command);
+
+DROP INDEX IF EXISTS idx_history_content_id_command;
+
+CREATE UNIQUE INDEX idx_history_content_id_command ON history (content_id, command);
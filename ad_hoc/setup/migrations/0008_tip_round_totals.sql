@@ -0,0 +1,43 @@
+-- the earn2tip totals of every distribution round, kept up to date by process_tip_comment() so !tip status and
+-- !tip sub are primary key lookups.  direction is 'sent' or 'received' (by from_user / to_user), or 'sub' for the
+-- totals of a whole community (username '').  ad_hoc/rebuild_tip_round_totals.py rebuilds it from earn2tip.
+-- the backfill groups with the NOCASE collation of the key, not that of earn2tip (older databases compare binary), so
+-- case variants of a user, community or token add up to one row.
+CREATE TABLE IF NOT EXISTS tip_round_totals (
+    distribution_round INTEGER         NOT NULL,
+    username           NVARCHAR2       NOT NULL
+                                       COLLATE NOCASE,
+    direction          NVARCHAR2       NOT NULL,
+    community          NVARCHAR2       NOT NULL
+                                       COLLATE NOCASE,
+    token              NVARCHAR2       NOT NULL
+                                       COLLATE NOCASE,
+    tip_count          INTEGER         NOT NULL,
+    amount             DECIMAL (10, 5) NOT NULL,
+    PRIMARY KEY (distribution_round, username, direction, community, token)
+) WITHOUT ROWID;
+
+DELETE FROM tip_round_totals;
+
+INSERT INTO tip_round_totals (distribution_round, username, direction, community, token, tip_count, amount)
+SELECT dr.distribution_round, tip.from_user, 'sent', tip.community, tip.token, count(tip.id), sum(tip.amount)
+FROM earn2tip tip
+  INNER JOIN (SELECT DISTINCT distribution_round, from_date, to_date FROM distribution_rounds) dr
+    ON tip.created_date BETWEEN dr.from_date AND dr.to_date
+WHERE tip.from_user IS NOT NULL
+GROUP BY dr.distribution_round, tip.from_user COLLATE NOCASE, tip.community COLLATE NOCASE, tip.token COLLATE NOCASE;
+
+INSERT INTO tip_round_totals (distribution_round, username, direction, community, token, tip_count, amount)
+SELECT dr.distribution_round, tip.to_user, 'received', tip.community, tip.token, count(tip.id), sum(tip.amount)
+FROM earn2tip tip
+  INNER JOIN (SELECT DISTINCT distribution_round, from_date, to_date FROM distribution_rounds) dr
+    ON tip.created_date BETWEEN dr.from_date AND dr.to_date
+WHERE tip.to_user IS NOT NULL
+GROUP BY dr.distribution_round, tip.to_user COLLATE NOCASE, tip.community COLLATE NOCASE, tip.token COLLATE NOCASE;
+
+INSERT INTO tip_round_totals (distribution_round, username, direction, community, token, tip_count, amount)
+SELECT dr.distribution_round, '', 'sub', tip.community, tip.token, count(tip.id), sum(tip.amount)
+FROM earn2tip tip
+  INNER JOIN (SELECT DISTINCT distribution_round, from_date, to_date FROM distribution_rounds) dr
+    ON tip.created_date BETWEEN dr.from_date AND dr.to_date
+GROUP BY dr.distribution_round, tip.community COLLATE NOCASE, tip.token COLLATE NOCASE;
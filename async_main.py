@@ -0,0 +1,211 @@
+import asyncio
+import json
+import logging
+import os
+import signal
+from logging.handlers import RotatingFileHandler
+
+import asyncpraw
+import praw
+from asyncpraw.models.base import AsyncPRAWBase
+from dotenv import load_dotenv
+
+from bots.loader import load_bot
+from commands import *
+from commands.command import Command
+from commands.dispatcher import CommandDispatcher
+from commands.executor import CommandExecutor
+
+###
+#   Runs the comment commands, the post bot and the flair bot in a single process.  The subreddit listings are
+#   polled once with asyncpraw and every item is fanned out to the three consumers, instead of each bot polling the
+#   same listings on its own.  The handlers themselves are the blocking ones from main.py and the bots, they run on
+#   worker threads (along with their database and web3 calls) so that slow calls overlap rather than queue up.
+#
+#   main.py, bots/post-bot.py and bots/flair-bot.py can still be run on their own (see donut-bot.sh).
+###
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# how many streamed items each consumer can fall behind before the stream waits for it
+CONSUMER_QUEUE_SIZE = 500
+
+logger = logging.getLogger("donut_bot")
+
+
+def to_praw(item, reddit):
+    """
+    Converts a streamed asyncpraw submission or comment to the equivalent praw object, bound to the given (blocking)
+    reddit instance, without refetching it.
+    :param item: an asyncpraw Submission or Comment
+    :param reddit: the praw instance the object should use
+    :return: a praw Submission or Comment
+    """
+    data = {}
+    for key, value in vars(item).items():
+        if key.startswith('_') or key in ('comments', 'comment_limit', 'comment_sort'):
+            continue
+
+        if isinstance(value, (asyncpraw.models.Redditor, asyncpraw.models.Subreddit)):
+            # praw builds its own lazy objects from the name
+            value = str(value)
+        elif isinstance(value, AsyncPRAWBase):
+            continue
+
+        data[key] = value
+
+    if isinstance(item, asyncpraw.models.Comment):
+        return praw.models.Comment(reddit, _data=data)
+
+    return praw.models.Submission(reddit, _data=data)
+
+
+def get_subs(config):
+    return '+'.join(c["community"][2:] if "r/" in c["community"] else c["community"]
+                    for c in config["community_tokens"])
+
+
+class BotRuntime:
+    """
+    One event loop that streams the comments and submissions once and feeds the commands, post bot and flair bot.
+    """
+
+    def __init__(self, config, reddit, post_bot, flair_bot):
+        self.config = config
+        self.reddit = reddit
+        self.post_bot = post_bot
+        self.flair_bot = flair_bot
+        self.username = os.getenv('REDDIT_USERNAME')
+
+        commands = [cls(config, reddit) for cls in Command.__subclasses__()]
+        self.dispatcher = CommandDispatcher(commands)
+        self.executor = CommandExecutor(config.get("executor"))
+
+        self.comments = asyncio.Queue(CONSUMER_QUEUE_SIZE)
+        self.posts = asyncio.Queue(CONSUMER_QUEUE_SIZE)
+        self.flairs = asyncio.Queue(CONSUMER_QUEUE_SIZE)
+
+    async def stream_comments(self, subreddit):
+        async for comment in subreddit.stream.comments():
+            await self.comments.put(comment)
+            await self.flairs.put(comment)
+
+    async def stream_submissions(self, subreddit):
+        # the first batch is the backlog of existing submissions - the post bot skips those (like
+        # stream.submissions(skip_existing=True) in post-bot.py) but the flair bot does not
+        existing = True
+        async for submission in subreddit.stream.submissions(pause_after=0):
+            if submission is None:
+                existing = False
+                continue
+
+            if not existing:
+                await self.posts.put(submission)
+            await self.flairs.put(submission)
+
+    async def keep_streaming(self, stream, subreddit):
+        while True:
+            try:
+                await stream(subreddit)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(e)
+                logger.info('sleeping 30 seconds ...')
+                await asyncio.sleep(30)
+
+    def handle_comment(self, comment):
+        if not comment.author or comment.author.name == self.username or comment.author == "EthTrader_Reposter":
+            return
+
+        for command in self.dispatcher.dispatch(comment.body):
+            self.executor.submit(command, comment)
+
+    async def consume(self, queue, handler, reddit):
+        while True:
+            item = await queue.get()
+            try:
+                await asyncio.to_thread(handler, to_praw(item, reddit))
+            except Exception as e:
+                logger.error(f'  Exception: {e}')
+            finally:
+                queue.task_done()
+
+    async def run(self, stop):
+        session = asyncpraw.Reddit(client_id=os.getenv('REDDIT_CLIENT_ID'),
+                                   client_secret=os.getenv('REDDIT_CLIENT_SECRET'),
+                                   username=self.username,
+                                   password=os.getenv('REDDIT_PASSWORD'),
+                                   user_agent='donut-bot (by u/mattg1981)')
+
+        try:
+            subreddit = await session.subreddit(get_subs(self.config))
+
+            streams = [asyncio.create_task(self.keep_streaming(self.stream_comments, subreddit)),
+                       asyncio.create_task(self.keep_streaming(self.stream_submissions, subreddit))]
+            consumers = [asyncio.create_task(self.consume(self.comments, self.handle_comment, self.reddit)),
+                         asyncio.create_task(self.consume(self.posts, self.post_bot.process_submission,
+                                                          self.post_bot.reddit)),
+                         asyncio.create_task(self.consume(self.flairs, self.flair_bot.handle_item,
+                                                          self.flair_bot.reddit))]
+
+            await stop.wait()
+
+            # stop reading new items, then let the consumers and the command executor drain
+            logger.info('shutting down, waiting for queued items to finish ...')
+            for task in streams:
+                task.cancel()
+            await asyncio.gather(*streams, return_exceptions=True)
+
+            for queue in (self.comments, self.posts, self.flairs):
+                await queue.join()
+            for task in consumers:
+                task.cancel()
+
+            await asyncio.to_thread(self.executor.shutdown)
+            await asyncio.to_thread(self.flair_bot.shutdown)
+            self.executor.log_metrics()
+            logger.info('shutdown complete')
+        finally:
+            await session.close()
+
+
+async def main():
+    # load environment variables
+    load_dotenv()
+
+    # load config
+    with open(os.path.join(BASE_DIR, "config.json"), 'r') as f:
+        config = json.load(f)
+
+    # set up logging
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    logger.setLevel(logging.INFO)
+    handler = RotatingFileHandler(os.path.normpath(os.path.join(BASE_DIR, config["log_path"])),
+                                  maxBytes=2500000, backupCount=4)
+    handler.setFormatter(formatter)
+    logger.addHandler(handler)
+
+    # the blocking instance the commands and the post bot write with (the flair bot uses its own account)
+    reddit = praw.Reddit(client_id=os.getenv('REDDIT_CLIENT_ID'),
+                         client_secret=os.getenv('REDDIT_CLIENT_SECRET'),
+                         username=os.getenv('REDDIT_USERNAME'),
+                         password=os.getenv('REDDIT_PASSWORD'),
+                         user_agent='donut-bot (by u/mattg1981)')
+
+    post_bot = load_bot("post-bot")
+    post_bot.setup(reddit)
+
+    flair_bot = load_bot("flair-bot")
+    await asyncio.to_thread(flair_bot.setup)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    await BotRuntime(config, reddit, post_bot, flair_bot).run(stop)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,86 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+from commands.command_approve import ApproveCommand
+from commands.command_dailypin import DailyPinCommand
+from commands.command_flair import FlairCommand
+from commands.command_pow import PostOfTheWeekCommand
+from commands.command_post import PostCommand
+from commands.command_register import RegisterCommand
+from commands.command_special_membership import SpecialMembershipCommand
+from commands.command_tip import TipCommand
+from commands.command_topics import TopicCommand
+from commands.dispatcher import CommandDispatcher
+
+###
+#   Measures comments/sec for command routing.  Pass --corpus with a file containing one json encoded comment
+#   body per line (e.g. recorded from the comment stream) or omit it to use a generated daily-discussion corpus.
+#
+#   usage (from the repository root): python3.11 benchmarks/bench_dispatcher.py [--corpus comments.jsonl]
+###
+
+FILLER = ["gm", "this is the way", "eth to the moon", "wen merge", "not financial advice", "lol",
+          "I have been holding since 2017 and honestly this thread is the best part of my day",
+          "can someone explain how the distribution works?", "https://etherscan.io/tx/0x123",
+          "[link](https://reddit.com/r/ethtrader)", "donuts are the best token"]
+
+COMMANDS = ["!tip 1", "!tip 5 donut", "!tip u/someone 10", "!tip status", "!register 0xabc", "!pow", "!post status",
+            "!topics", "![gif](giphy|xyz)", "!approve", "!flair hello"]
+
+
+def load_corpus(path):
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def generate_corpus(size):
+    rnd = random.Random(42)
+    corpus = []
+    for _ in range(size):
+        body = " ".join(rnd.choice(FILLER) for _ in range(rnd.randint(1, 12)))
+        # roughly 1 in 10 comments on a daily discussion contains a command
+        if rnd.random() < .1:
+            body += "\n\n" + rnd.choice(COMMANDS)
+        corpus.append(body)
+    return corpus
+
+
+def run(name, route, corpus, rounds):
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for body in corpus:
+            route(body)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    print(f"{name:<12} {len(corpus) / best:>12,.0f} comments/sec")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--corpus', help='file with one json encoded comment body per line')
+    parser.add_argument('--size', type=int, default=20_000, help='size of the generated corpus')
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    with open(os.path.normpath(os.path.join(SCRIPT_DIR, "../config.json")), 'r') as f:
+        config = json.load(f)
+
+    commands = [cls(config, None) for cls in [TipCommand, RegisterCommand, ApproveCommand, SpecialMembershipCommand,
+                                              FlairCommand, PostOfTheWeekCommand, PostCommand, TopicCommand,
+                                              DailyPinCommand]]
+    dispatcher = CommandDispatcher(commands)
+
+    corpus = load_corpus(args.corpus) if args.corpus else generate_corpus(args.size)
+    print(f"{len(corpus):,} comments, {len(commands)} commands")
+
+    run("can_handle", lambda body: [c for c in commands if c.can_handle(body)], corpus, args.rounds)
+    run("dispatcher", dispatcher.dispatch, corpus, args.rounds)
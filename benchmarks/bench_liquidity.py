@@ -0,0 +1,79 @@
+import os
+import random
+import sys
+
+import pytest
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+from liquidity.amounts import position_amounts, position_amounts_exact, sqrt_ratio_at_tick, tick_to_price
+
+###
+#   Measures the uniswap v3 position math over synthetic pools.  Needs pytest-benchmark (pip install
+#   pytest-benchmark), the file is not named test_* so the regular test run does not pick it up.
+#
+#   usage (from the repository root): python3.11 -m pytest benchmarks/bench_liquidity.py
+###
+
+pytest.importorskip("pytest_benchmark")
+
+CURRENT_TICK = -60_000
+TICK_SPACING = 60
+
+SIZES = [10_000, 100_000, 1_000_000]
+
+
+def synthetic_pool(size):
+    """
+    :return: a tuple of (liquidity, tick_lower, tick_upper) lists for `size` positions, clustered around the price
+    """
+    rnd = random.Random(42)
+    liquidity, tick_lower, tick_upper = [], [], []
+
+    for _ in range(size):
+        lower = CURRENT_TICK + int(rnd.gauss(0, 200)) * TICK_SPACING
+        liquidity.append(rnd.randrange(10 ** 12, 10 ** 24))
+        tick_lower.append(lower)
+        tick_upper.append(lower + rnd.randrange(1, 400) * TICK_SPACING)
+
+    return liquidity, tick_lower, tick_upper
+
+
+def loop_amounts(liquidity, tick_lower, tick_upper, current_tick, current_sqrt_price):
+    """
+    The per position loop the liquidity scripts used before, for comparison.
+    """
+    amounts = []
+    for liq, lower, upper in zip(liquidity, tick_lower, tick_upper):
+        sa = tick_to_price(lower / 2)
+        sb = tick_to_price(upper / 2)
+
+        if upper <= current_tick:
+            amounts.append((0, liq * (sb - sa)))
+        elif lower < current_tick < upper:
+            amounts.append((liq * (sb - current_sqrt_price) / (current_sqrt_price * sb),
+                            liq * (current_sqrt_price - sa)))
+        else:
+            amounts.append((liq * (sb - sa) / (sa * sb), 0))
+
+    return amounts
+
+
+@pytest.fixture(scope="module", params=SIZES, ids=lambda size: f"{size}_positions")
+def pool(request):
+    return synthetic_pool(request.param)
+
+
+def test_loop(benchmark, pool):
+    benchmark.pedantic(loop_amounts, args=(*pool, CURRENT_TICK, tick_to_price(CURRENT_TICK / 2)), rounds=3)
+
+
+def test_vectorized(benchmark, pool):
+    benchmark.pedantic(position_amounts, args=(*pool, CURRENT_TICK, tick_to_price(CURRENT_TICK / 2)), rounds=3)
+
+
+def test_exact(benchmark, pool):
+    # the first round starts without any cached tick ratios
+    sqrt_ratio_at_tick.cache_clear()
+    benchmark.pedantic(position_amounts_exact, args=(*pool, sqrt_ratio_at_tick(CURRENT_TICK)), rounds=3)
@@ -0,0 +1,57 @@
+import json
+import os
+import random
+import sys
+
+import pytest
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(SCRIPT_DIR))
+
+from topics.topic_classifier import TopicClassifier
+from tests.test_topic_classifier import reference_topic
+
+###
+#   Measures titles/sec for topic classification, the compiled classifier against the per topic loop post-bot used
+#   to run.  The golden titles from tests/data are the corpus, repeated (with fresh fullnames) to a few thousand
+#   submissions.  Needs pytest-benchmark, the file is not named test_* so the regular test run does not pick it up.
+#
+#   usage (from the repository root): python3.11 -m pytest benchmarks/bench_topics.py
+###
+
+pytest.importorskip("pytest_benchmark")
+
+DATA_DIR = os.path.join(os.path.dirname(SCRIPT_DIR), "tests", "data")
+
+CORPUS_SIZE = 5_000
+
+
+def load(name):
+    with open(os.path.join(DATA_DIR, name), 'r') as f:
+        return json.load(f)
+
+
+@pytest.fixture(scope="module")
+def topics():
+    return load("topic_meta.json")
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    rnd = random.Random(42)
+    titles = load("topic_titles.json")
+    return [(f"t3_{idx:x}", t["title"], t["community"]) for idx, t in
+            enumerate(rnd.choice(titles) for _ in range(CORPUS_SIZE))]
+
+
+def test_reference_loop(benchmark, topics, corpus):
+    benchmark(lambda: [reference_topic(fullname, title, topics, community) for fullname, title, community in corpus])
+
+
+def test_classifier(benchmark, topics, corpus):
+    classifier = TopicClassifier(topics)
+    benchmark(lambda: [classifier.classify(fullname, title, community) for fullname, title, community in corpus])
+
+
+def test_compile(benchmark, topics):
+    benchmark(TopicClassifier, topics)
@@ -1,17 +1,13 @@
 import json
 import logging
 import os
-import sqlite3
+import signal
 import time
 import types
-import urllib.request
 import sys
 import praw
-import hashlib
 
-from pathlib import Path
 from web3 import Web3
-from datetime import datetime, timedelta
 from logging.handlers import RotatingFileHandler
 from dotenv import load_dotenv
 
@@ -19,13 +15,26 @@ from dotenv import load_dotenv
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(os.path.dirname(SCRIPT_DIR))
 
-from database import database
+from chain.client_pool import get_pool
+from flair.scheduler import FlairScheduler, TransferWatcher
+from flair.writer import FlairWriter
 import cache.cache
 
-UNREGISTERED = []
-LP_PROVIDERS = {}
+logger = logging.getLogger("flair_bot")
+
 SPECIAL_MEMBERS = {}
 
+# created by setup()
+scheduler = None
+writer = None
+
+DONUT_ADDRESS_ETH = '0xC0F9bD5Fa5698B6505F643900FFA515Ea5dF54A9'
+DONUT_ADDRESS_GNO = '0x524B969793a64a602342d89BC2789D43a016B13A'
+DONUT_ADDRESS_ARB1 = '0xF42e2B8bc2aF8B110b65be98dB1321B1ab8D44f5'
+CONTRIB_ADDRESS_ARB1 = '0xF28831db80a616dc33A5869f6F689F54ADd5b74C'
+
+FLAIR_TEMPLATE_ID = "da1b88dc-8e17-11ee-8d85-86deef0eb333"
+
 
 def display_number(number):
     if 1_000 <= number < 1_000_000:
@@ -42,79 +51,42 @@ def display_number(number):
 
 def get_onchain_amounts(user_address):
     try:
-        # ---- get mainnet balance ----------------
-        logger.info(f"  connecting to INFURA_ETH_PROVIDER...")
-        eth_w3 = Web3(Web3.HTTPProvider(os.getenv('INFURA_ETH_PROVIDER')))
-
-        if not eth_w3.is_connected():
-            logger.error("failed to connect to INFURA_ETH_PROVIDER")
-            raise Exception("failed to connect to INFURA_ETH_PROVIDER")
-
         if '.eth' in user_address.lower():
             logger.info("  ENS name detected, do lookup...")
 
-            user_address = eth_w3.ens.address(user_address)
+            ens_name = user_address
+            user_address = chains.web3("eth").ens.address(ens_name)
 
             if user_address is None:
-                raise Exception(f"ENS did not resolve for {user_address}")
+                raise Exception(f"ENS did not resolve for {ens_name}")
         else:
             user_address = Web3.to_checksum_address(user_address)
 
-        # donut token
-        donut_address_eth = '0xC0F9bD5Fa5698B6505F643900FFA515Ea5dF54A9'
-        eth_donut_contract = eth_w3.eth.contract(address=eth_w3.to_checksum_address(donut_address_eth), abi=eth_abi)
-        eth_token_balance = eth_donut_contract.functions.balanceOf(user_address).call()
-        eth_balance = eth_w3.from_wei(eth_token_balance, "ether")
-
-        # ---- get gnosis balance ----------------------
-        logger.info(f"  connecting to ANKR_API_PROVIDER")
-        gno_w3 = Web3(Web3.HTTPProvider(os.getenv('ANKR_API_PROVIDER')))
-
-        if not gno_w3.is_connected():
-            logger.error("failed to connect to ANKR_API_PROVIDER")
-            raise Exception("failed to connect to ANKR_API_PROVIDER")
-
-        # donut token
-        donut_address_gno = '0x524B969793a64a602342d89BC2789D43a016B13A'
-        donut_contract = gno_w3.eth.contract(address=gno_w3.to_checksum_address(donut_address_gno), abi=eth_abi)
-        gno_token_balance = donut_contract.functions.balanceOf(user_address).call()
-        gno_balance = eth_w3.from_wei(gno_token_balance, "ether")
-
-        # ---- get arb 1 balances ----------------------
-        logger.info(f"  connecting to CHAINSTACK_ARB1_PROVIDER")
-        arb1_w3 = Web3(Web3.HTTPProvider(os.getenv('CHAINSTACK_ARB1_PROVIDER')))
-
-        if not arb1_w3.is_connected():
-            logger.error("failed to connect to CHAINSTACK_ARB1_PROVIDER")
-            raise Exception("failed to connect to CHAINSTACK_ARB1_PROVIDER")
-
-        # donut token on ARB1
-        donut_address_arb1 = '0xF42e2B8bc2aF8B110b65be98dB1321B1ab8D44f5'
-        arb1_donut_contract = arb1_w3.eth.contract(address=arb1_w3.to_checksum_address(donut_address_arb1),
-                                                   abi=eth_abi)
-        arb1_token_balance = arb1_donut_contract.functions.balanceOf(user_address).call()
-        arb1_balance = arb1_w3.from_wei(arb1_token_balance, "ether")
-
-        # contrib information
-        contrib_address_arb1 = "0xF28831db80a616dc33A5869f6F689F54ADd5b74C"
-        contrib_contract_arb1 = arb1_w3.eth.contract(address=arb1_w3.to_checksum_address(contrib_address_arb1),
-                                                     abi=contrib_abi)
-        contrib_token_balance_arb1 = contrib_contract_arb1.functions.balanceOf(user_address).call()
-        contrib_balance = arb1_w3.from_wei(contrib_token_balance_arb1, "ether")
+        # the four balances are read at the same time, each chain on its own kept-alive connection
+        balances, errors = chains.balances_of(user_address, {
+            "eth": ("eth", DONUT_ADDRESS_ETH, eth_abi),
+            "gno": ("gno", DONUT_ADDRESS_GNO, eth_abi),
+            "arb1": ("arb1", DONUT_ADDRESS_ARB1, eth_abi),
+            "contrib": ("arb1", CONTRIB_ADDRESS_ARB1, contrib_abi),
+        })
+
+        if errors:
+            # a flair built from some of the balances would be wrong, try again on the user's next post / comment
+            logger.error(f"  balance lookup failed for: {', '.join(errors)}")
+            return None
+
+        eth_balance = Web3.from_wei(balances["eth"], "ether")
+        gno_balance = Web3.from_wei(balances["gno"], "ether")
+        arb1_balance = Web3.from_wei(balances["arb1"], "ether")
+        contrib_balance = Web3.from_wei(balances["contrib"], "ether")
 
     except Exception as ex:
+        logger.error(f"  onchain lookup failed: {ex}")
         return None
 
     lp = 0
     try:
-        if "last_update" not in LP_PROVIDERS or datetime.now() - timedelta(minutes=20) >= LP_PROVIDERS["last_update"]:
-            LP_PROVIDERS['last_update'] = datetime.now()
-            LP_PROVIDERS['providers'] = json.load(urllib.request.urlopen(
-                "https://raw.githubusercontent.com/mattg1981/donut-bot-output/main/liquidity/liquidity_leaders.json"))
-
-        lp = next(
-            (l['percent_of_pool'] for l in LP_PROVIDERS["providers"] if l["owner"].lower() == user_address.lower()),
-            None)
+        lp = cache.cache.LIQUIDITY_LEADERS.get().get(user_address.lower())
     except Exception as ex:
         pass
 
@@ -135,86 +107,32 @@ def get_onchain_amounts(user_address):
     return ret_val
 
 
-def set_flair_for_user(fullname, user, community):
-    if database.has_processed_content(fullname, Path(__file__).stem) is not None:
-        logger.debug("  previously processed...")
-        return
-
+def render_flair(user, state, community, special_member):
+    """
+    Builds the flair text of a registered user.  Called by the flair scheduler.
+    :param user: the redditor
+    :param state: the user's view_flair_can_update row
+    :param community: the subreddit, lowercase
+    :param special_member: whether the user is a special member of the community
+    :return: the flair text, or None if the onchain lookup failed
+    """
     logger.info(f"processing [user]: {user}...")
-    logger.debug("  get user from sql...")
-
-    # get address for user
-    with sqlite3.connect(db_path) as db:
-        registered_sql = """
-            select username 
-            from users
-            where username=?;
-        """
-
-        can_update_sql = """
-            select username, address, hash, custom_flair, eligible
-            from view_flair_can_update 
-            where username=?;
-        """
-        db.row_factory = lambda c, r: dict(zip([col[0] for col in c.description], r))
-        cur = db.cursor()
-
-        cur.execute(registered_sql, [user])
-        registered_lookup = cur.fetchone()
-
-        logger.info(f"  registered result: {registered_lookup}")
-
-        # dont lookup if user can update flair if they arent registered
-        if registered_lookup:
-            cur.execute(can_update_sql, [user])
-            user_lookup = cur.fetchone()
-            logger.info(f"  user_lookup result: {user_lookup}")
-
-    if not registered_lookup:
-        logger.info(f"  not registered.")
-        if user in UNREGISTERED:
-            return
-
-        flair_text = "Not Registered"
-        UNREGISTERED.append(user)
-        reddit.subreddit(community).flair.set(user,
-                                         text=flair_text,
-                                         flair_template_id ="da1b88dc-8e17-11ee-8d85-86deef0eb333")
-        database.set_processed_content(fullname, Path(__file__).stem)
-        return
-
-    special_member_lp = False
-    # special_member = next((m for m in SPECIAL_MEMBERS['members'] if m['redditor'].lower() == user.lower()
-    #                        and m['type'] == 'lp'), None)
-
-    logger.info(f"  user: {user}")
     logger.info(f"  community: {community}")
 
-    special_member = cache.cache.is_special_member(user, community)
-
-    # if special_member:
-    #     special_member_lp = True
-    # if not special_member:
-    #     special_member = next((m for m in SPECIAL_MEMBERS['members'] if m['redditor'].lower() == user.lower()
-    #                            and m['community'].lower() == community), None)
+    special_member_lp = False
 
     if special_member:
         logger.info("  special member...")
 
-    if not user_lookup['eligible'] and not special_member:
-        logger.info(f"  not eligible to have their flair updated at this time.")
-        database.set_processed_content(fullname, Path(__file__).stem)
-        return
-
-    if special_member and user_lookup['custom_flair']:
-        flair_text = user_lookup['custom_flair']
+    if special_member and state['custom_flair']:
+        flair_text = state['custom_flair']
     else:
         logger.info(f"get onchain amounts for [user] {user}...")
-        result = get_onchain_amounts(user_lookup["address"])
+        result = get_onchain_amounts(state["address"])
 
         if not result:
             logger.error(f"  onchain lookup failed, no flair to be applied!")
-            return
+            return None
 
         flair_text = f":donut: {display_number(result.donuts)} / ⚖️ {display_number(result.contrib)}"
 
@@ -239,39 +157,35 @@ def set_flair_for_user(fullname, user, community):
             # prevent users from using the :lp: emoji if they are not in the LP
             flair_text = f":sm: {flair_text}"
 
-    # use md5 hash instead of built-in python hash to have the same hashes between program restarts
-    # flair_hash = hash(flair_text)
-    flair_hash = hashlib.md5(flair_text.encode('utf-8')).hexdigest()
+    return flair_text
 
-    if flair_hash != user_lookup['hash']:
-        logger.info(f"  hash lookup -> [db]: {user_lookup['hash']} -- [current]: {flair_hash}")
-        logger.info("  setting flair...")
-        reddit.subreddit(community).flair.set(user,
-                                         text=flair_text,
-                                         flair_template_id ="da1b88dc-8e17-11ee-8d85-86deef0eb333")
-    else:
-        logger.info("  flair unchanged since last update...")
 
-    logger.info("  update last_update for flair")
-    with sqlite3.connect(db_path) as db:
-        update_sql = """       
-            INSERT OR REPLACE INTO flair (user_id, hash, last_update, custom_flair) 
-            VALUES ((select id from users where username=?), ?, ?, ?)
-        """
-        cur = db.cursor()
-        cur.execute(update_sql, [user, flair_hash, datetime.now(), flair_text])
+def apply_flair(user, community, flair_text):
+    logger.info(f"  queue flair for [user] {user} in {community} -> {flair_text}")
+    writer.enqueue(user, community, flair_text, FLAIR_TEMPLATE_ID)
 
-    database.set_processed_content(fullname, Path(__file__).stem)
 
-    logger.info("  success.")
+def lp_share(address):
+    try:
+        return cache.cache.LIQUIDITY_LEADERS.get().get(address.lower())
+    except Exception:
+        return None
 
 
-if __name__ == '__main__':
+def setup(reddit_instance=None):
+    """
+    Loads the config, logging, contract abis and reddit instance used by the flair bot.  Called by the blocking loop
+    below and by async_main.py, which streams the items itself and passes each one to handle_item().
+    :param reddit_instance: an authorized reddit instance, created from the FLAIR_BOT_* settings when not given
+    """
+    global config, logger, username, reddit, subs, ignore_list, chains, scheduler, writer
+    global eth_abi, gno_abi, contrib_abi, stake_mainnet_abi, stake_gno_abi, lp_mainnet_abi, lp_gno_abi
+
     # load environment variables
     load_dotenv()
 
     # load config
-    with open(os.path.normpath("../config.json"), 'r') as f:
+    with open(os.path.normpath(os.path.join(SCRIPT_DIR, "../config.json")), 'r') as f:
         config = json.load(f)
 
     # set up logging
@@ -281,25 +195,19 @@ if __name__ == '__main__':
     # set to info for more info - lots of logs are generated
     logger.setLevel(logging.INFO)
 
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    log_path = os.path.join(base_dir, "../logs/flair-bot.log")
+    log_path = os.path.join(SCRIPT_DIR, "../logs/flair-bot.log")
     handler = RotatingFileHandler(os.path.normpath(log_path), maxBytes=2500000, backupCount=4)
     handler.setFormatter(formatter)
     logger.addHandler(handler)
 
-    # get database location
-    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-    db_path = os.path.join(BASE_DIR, "../database/donut-bot.db")
-    db_path = os.path.normpath(db_path)
-
     username = os.getenv('FLAIR_BOT_USERNAME')
 
     # creating an authorized reddit instance
-    reddit = praw.Reddit(client_id=os.getenv('FLAIR_BOT_CLIENT_ID'),
-                         client_secret=os.getenv('FLAIR_BOT_CLIENT_SECRET'),
-                         username=username,
-                         password=os.getenv('FLAIR_BOT_PASSWORD'),
-                         user_agent='flair-bot (by u/mattg1981)')
+    reddit = reddit_instance or praw.Reddit(client_id=os.getenv('FLAIR_BOT_CLIENT_ID'),
+                                            client_secret=os.getenv('FLAIR_BOT_CLIENT_SECRET'),
+                                            username=username,
+                                            password=os.getenv('FLAIR_BOT_PASSWORD'),
+                                            user_agent='flair-bot (by u/mattg1981)')
 
     subs = ""
     for idx, community_token in enumerate(config["community_tokens"]):
@@ -310,27 +218,30 @@ if __name__ == '__main__':
         if idx < len(config["community_tokens"]) - 1:
             subs += '+'
 
-    with open(os.path.normpath("../contracts/donut_mainnet_abi.json"), 'r') as f:
+    with open(os.path.normpath(os.path.join(SCRIPT_DIR, "../contracts/donut_mainnet_abi.json")), 'r') as f:
         eth_abi = json.load(f)
 
-    with open(os.path.normpath("../contracts/donut_gnosis_abi.json"), 'r') as f:
+    with open(os.path.normpath(os.path.join(SCRIPT_DIR, "../contracts/donut_gnosis_abi.json")), 'r') as f:
         gno_abi = json.load(f)
 
-    with open(os.path.normpath("../contracts/contrib_gnosis_abi.json"), 'r') as f:
+    with open(os.path.normpath(os.path.join(SCRIPT_DIR, "../contracts/contrib_gnosis_abi.json")), 'r') as f:
         contrib_abi = json.load(f)
 
-    with open(os.path.normpath("../contracts/donut_uniswap_rewards_mainnet_abi.json"), 'r') as f:
+    with open(os.path.normpath(os.path.join(SCRIPT_DIR, "../contracts/donut_uniswap_rewards_mainnet_abi.json")), 'r') as f:
         stake_mainnet_abi = json.load(f)
 
-    with open(os.path.normpath("../contracts/donut_uniswap_rewards_gno_abi.json"), 'r') as f:
+    with open(os.path.normpath(os.path.join(SCRIPT_DIR, "../contracts/donut_uniswap_rewards_gno_abi.json")), 'r') as f:
         stake_gno_abi = json.load(f)
 
-    with open(os.path.normpath("../contracts/uniswap_v2_pair_abi.json"), 'r') as f:
+    with open(os.path.normpath(os.path.join(SCRIPT_DIR, "../contracts/uniswap_v2_pair_abi.json")), 'r') as f:
         lp_mainnet_abi = json.load(f)
 
-    with open(os.path.normpath("../contracts/uniswap_v2_pair_gnosis_abi.json"), 'r') as f:
+    with open(os.path.normpath(os.path.join(SCRIPT_DIR, "../contracts/uniswap_v2_pair_gnosis_abi.json")), 'r') as f:
         lp_gno_abi = json.load(f)
 
+    # one client per chain, shared by every balance lookup
+    chains = get_pool(config.get("chain_clients"))
+
     # set flair for community bots once
     reddit.subreddit(subs).flair.update([x for x in config['flair']['ignore']], text='bot', css_class='default')
     # set verified addresses
@@ -344,43 +255,90 @@ if __name__ == '__main__':
     # that cannot be changed by users
     # ignore_list.extend([x.lower() for x in config['flair']['arb1-pioneers']])
 
+    # flairs are recomputed when the user's balances, membership or custom flair change, not on every comment
+    watchers = [
+        TransferWatcher("eth", chains.web3("eth"), [chains.contract("eth", DONUT_ADDRESS_ETH, eth_abi)]),
+        TransferWatcher("gno", chains.web3("gno"), [chains.contract("gno", DONUT_ADDRESS_GNO, eth_abi)]),
+        TransferWatcher("arb1", chains.web3("arb1"), [chains.contract("arb1", DONUT_ADDRESS_ARB1, eth_abi),
+                                                      chains.contract("arb1", CONTRIB_ADDRESS_ARB1, contrib_abi)]),
+    ]
+
+    scheduler = FlairScheduler(render_flair, apply_flair, watchers,
+                               is_special_member=cache.cache.is_special_member,
+                               lp_share=lp_share,
+                               interval=config['flair'].get('schedule_seconds', 60),
+                               max_age=config['flair'].get('max_age_minutes', 720) * 60)
+    # flair changes are sent in bulk (flaircsv) when the template has a css class, a change that cannot be applied
+    # is recomputed by the scheduler
+    css_classes = config['flair'].get('template_css_classes') or {}
+    if FLAIR_TEMPLATE_ID not in css_classes:
+        logger.warning(f"  flair template {FLAIR_TEMPLATE_ID} has no entry in template_css_classes, every flair "
+                       f"change is sent with its own flair.set request")
+
+    writer = FlairWriter(reddit,
+                         css_classes=css_classes,
+                         flush_interval=config['flair'].get('flush_seconds', 5),
+                         on_failure=scheduler.mark_dirty)
+
+    scheduler.start()
+    writer.start()
+
+
+def shutdown():
+    """
+    Stops the flair scheduler and then the writer, which sends the flair changes still queued and saves their hashes.
+    """
+    if scheduler:
+        scheduler.stop()
+    if writer:
+        writer.stop()
+
+
+def handle_item(item):
+    """
+    Updates the flair of the author of a submission or comment.
+    :param item: a praw submission or comment
+    """
+    if not item.author or item.author.name == username:
+        return
 
+    if item.author.name.lower() in ignore_list:
+        return
 
-    while True:
-        try:
-            # if "last_update" not in SPECIAL_MEMBERS or datetime.now() - timedelta(minutes=12) >= SPECIAL_MEMBERS[
-            #     "last_update"]:
-            #     SPECIAL_MEMBERS['last_update'] = datetime.now()
-            #     SPECIAL_MEMBERS['members'] = json.load(urllib.request.urlopen(config['membership']['members']))
+    scheduler.seen(item.author.name, item.subreddit.display_name.lower())
 
-            for submission in reddit.subreddit(subs).stream.submissions(pause_after=-1):
-                if submission is None:
-                    break
 
-                if not submission.author or submission.author.name == username:
-                    continue
+if __name__ == '__main__':
+    setup()
 
-                if submission.author.name.lower() in ignore_list:
-                    continue
+    # update.sh sends SIGTERM first, leave the loop and send the queued flair changes before exiting
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
 
-                set_flair_for_user(submission.fullname, submission.author.name,
-                                   submission.subreddit.display_name.lower())
+    try:
+        while True:
+            try:
+                # if "last_update" not in SPECIAL_MEMBERS or datetime.now() - timedelta(minutes=12) >= SPECIAL_MEMBERS[
+                #     "last_update"]:
+                #     SPECIAL_MEMBERS['last_update'] = datetime.now()
+                #     SPECIAL_MEMBERS['members'] = json.load(urllib.request.urlopen(config['membership']['members']))
 
-            for comment in reddit.subreddit(subs).stream.comments(pause_after=-1):
-                if comment is None:
-                    break
+                for submission in reddit.subreddit(subs).stream.submissions(pause_after=-1):
+                    if submission is None:
+                        break
 
-                if not comment.author or comment.author.name == username:
-                    continue
+                    handle_item(submission)
 
-                if comment.author.name.lower() in ignore_list:
-                    continue
+                for comment in reddit.subreddit(subs).stream.comments(pause_after=-1):
+                    if comment is None:
+                        break
 
-                set_flair_for_user(comment.fullname, comment.author.name, comment.subreddit.display_name.lower())
+                    handle_item(comment)
 
-            time.sleep(10)
+                time.sleep(10)
 
-        except Exception as e:
-            logger.error(e)
-            logger.error('sleeping 30 seconds ...')
-            time.sleep(30)
+            except Exception as e:
+                logger.error(e)
+                logger.error('sleeping 30 seconds ...')
+                time.sleep(30)
+    finally:
+        shutdown()
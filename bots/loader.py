@@ -0,0 +1,17 @@
+import importlib.util
+import os
+
+BOTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_bot(name):
+    """
+    Imports one of the bot scripts in the bots directory (their file names are not valid module names), so that
+    main.py and async_main.py can host the bot.
+    :param name: the script name without extension, e.g. 'post-bot'
+    :return: the module
+    """
+    spec = importlib.util.spec_from_file_location(name.replace('-', '_'), os.path.join(BOTS_DIR, f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
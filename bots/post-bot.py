@@ -1,50 +1,35 @@
 import json
 import logging
 import os
-import re
-import sqlite3
 import sys
 import time
-import urllib.request
-from datetime import datetime, timedelta
+from datetime import datetime
 from logging.handlers import RotatingFileHandler
 
 import praw
 from dotenv import load_dotenv
+from praw.models import MoreComments
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(os.path.dirname(SCRIPT_DIR))
 from cache import cache
+from cache.submission_ledger import SubmissionLedger
+from database import connection, database
+from topics.occupancy import TopicOccupancy
 
+logger = logging.getLogger("post_bot")
 
-def get_submission_topic(submission, topics, community):
-    # test if this submission hits any topics that are limited in this community
-    for topic in [t for t in topics if t["community"].lower() == community.lower()]:
-        topic_ignore = []
-        for ignore in topic["overrides"]["ignore"]:
-            if not ignore.startswith("t3_"):
-                topic_ignore.append("t3_" + ignore)
-            else:
-                topic_ignore.append(ignore)
-
-        topic_include = []
-        for include in topic["overrides"]["include"]:
-            if not include.startswith("t3_"):
-                topic_include.append("t3_" + include)
-            else:
-                topic_include.append(include)
-
-        if submission.fullname in topic_ignore:
-            continue
+# users listed in ignore_list are not restricted to a limited number of posts
+# be sure to user lowercase when adding to this list
+ignore_list = ["ethtrader_reposter", "automoderator"]
 
-        if submission.fullname in topic_include:
-            return topic
+# how many top-level comments previously_processed() fetches when a submission is not in the database
+FALLBACK_COMMENT_LIMIT = 25
 
-        # otherwise test the title against the patterns
-        for pattern in topic["patterns"]:
-            submission_match = re.search(pattern, submission.title.lower())
-            if submission_match:
-                return topic
+
+def get_submission_topic(submission, classifier, community):
+    # test if this submission hits any topics that are limited in this community
+    return classifier.classify(submission.fullname, submission.title, community)
 
 
 def is_daily(submission):
@@ -95,7 +80,7 @@ def create_post_meta(submission, comment_thread_id):
     if submission.author:
         author = submission.author.name
 
-    with sqlite3.connect(db_path) as db:
+    with connection.get_connection() as db:
         sql = """
             INSERT INTO post (submission_id, tip_comment_id, author, is_daily, created_date, community)
             VALUES (?, ?, ?, ?, ?, ?);
@@ -113,6 +98,7 @@ def create_post_meta(submission, comment_thread_id):
             ],
         )
 
+    ledger.record(submission.fullname)
     logger.info("  done.")
 
 
@@ -137,9 +123,8 @@ def eligible_to_submit(submission):
         limit 1;
     """
 
-    with sqlite3.connect(db_path) as db:
-        db.row_factory = lambda c, r: dict(zip([col[0] for col in c.description], r))
-        cursor = db.cursor()
+    with connection.get_connection() as db:
+        cursor = connection.dict_cursor(db)
         cursor.execute(post_per_day_sql, [submission.author.name])
         eligibility_check = cursor.fetchone()
 
@@ -184,25 +169,31 @@ def previously_processed(submission, bot_name):
             where submission_id = ?
         """
 
-    with sqlite3.connect(db_path) as db:
-        db.row_factory = lambda c, r: dict(zip([col[0] for col in c.description], r))
-        cursor = db.cursor()
-        cursor.execute(sql, [submission.fullname])
-        db_result = cursor.fetchone()
+    if ledger.might_contain(submission.fullname):
+        with connection.get_connection() as db:
+            cursor = connection.dict_cursor(db)
+            cursor.execute(sql, [submission.fullname])
+            db_result = cursor.fetchone()
 
-    if db_result:
-        return db_result
+        if db_result:
+            return db_result
 
-    # to address the reddit API (or praw) returning historically old posts.  Most posts will already
-    # be handled by the database lookup we just performed.  However, if the post was rejected for word count
-    # or other edge cases, no record is recorded in the database.  To handle these, we will search
-    # the comments of this post to see if donut-bot has responded on the top-level
-    # previously.  If it has, then this post has been previously processed.
+        if database.get_rejected_post(submission.fullname):
+            return True
+    elif ledger.created_since_load(submission):
+        # every submission this process handles is recorded in the ledger
+        return False
 
+    # to address the reddit API (or praw) returning historically old posts that were handled before they were
+    # recorded (e.g. removed before rejected_post existed).  The bot's sticky comment is top-level and one of the
+    # first on the post, so a single fetch of the oldest top-level comments is enough to find it, the rest of the
+    # tree is never expanded.
     submission.comment_sort = "old"
-    submission.comments.replace_more(limit=None)
+    submission.comment_limit = FALLBACK_COMMENT_LIMIT
 
-    for c in submission.comments:  # Top-level only
+    for c in submission.comments:  # Top-level only, MoreComments are not expanded
+        if isinstance(c, MoreComments):
+            continue
         # c.author may be None if the user was deleted
         if c.author and c.author.name == bot_name:
             return True
@@ -210,37 +201,181 @@ def previously_processed(submission, bot_name):
     return False
 
 
-if __name__ == "__main__":
+def process_submission(submission):
+    """
+    Moderates a new submission: enforces the media, word count, topic and posting limits and then leaves the
+    sticky comment.
+    :param submission: a praw submission
+    """
+    if submission is None:
+        return
+
+    if not submission.author or submission.author.name == username:
+        return
+
+    try:
+        logger.info(f"processing submission by [{submission.author.name}]: {submission.fullname} [{submission.title}]")
+    except Exception as e:
+        logger.error("error processing submission: {e})")
+
+    if previously_processed(submission, username):
+        logger.info(f"  {submission.fullname} already processed.")
+        return
+
+    community = submission.subreddit.display_name.lower()
+
+    logger.info(
+        f"  is_reddit_media_domain: {submission.is_reddit_media_domain}"
+    )
+
+    post_hint = None
+
+    try:
+        logger.info(f"  post_hint: {submission.post_hint}")
+        post_hint = submission.post_hint
+    except Exception as e:
+        logger.info(f"  post_hint is not present...")
+
+    special_membership_required = False
+    if post_hint and not 'self' in post_hint and not 'link' in post_hint:
+        logger.info('    special membership required for this post_hint...')
+        special_membership_required = True
+
+    if submission.is_reddit_media_domain or special_membership_required:
+        if not cache.is_special_member(submission.author.name, community):
+
+            logger.info(
+                f"  is_special_member => false; removed..."
+            )
+
+            database.insert_rejected_post(submission.fullname, submission.author.name, "media", community)
+            ledger.record(submission.fullname)
+
+            submission.reply(
+                f"Your post was removed from r/{community} because media posts are reserved for special "
+                f"members. Please visit [this link] (https://donut-dashboard.net/#/membership) to learn "
+                f"more or to purchase a membership.  Otherwise, you can re-submit with a link to the "
+                f"media in the body of the post."
+            )
+            submission.mod.lock()
+            submission.mod.remove(spam=False)
+            return
+
+        else:
+            logger.info(
+                f"  is_reddit_media_domain => true and special member => true; allow..."
+            )
+
+    excluded = False
+    for excluded_flair in config["posts"][
+        "minimum_word_count_excluded_flairs"
+    ]:
+        if "[" + excluded_flair.lower() + "]" in submission.title.lower():
+            excluded = True
+            break
+
+    # exclude word count minimum and topic limiting for users in ignore_list
+    post_topic = None
+    if submission.author.name.lower() not in ignore_list:
+        # exclude word count minimum if using a standardized title
+        for title in config["posts"]["bypass_word_count_by_title"]:
+            if title.lower() in submission.title.lower():
+                excluded = True
+
+        if (
+            not excluded
+            and submission.is_self
+            and len(submission.selftext.split())
+            < config["posts"]["minimum_word_count"]
+        ):
+            logger.info(
+                f"  removed due to minimum_word_count={config['posts']['minimum_word_count']}"
+            )
+
+            create_post_meta(submission, None)
+
+            submission.reply(
+                f"Your post was removed from r/{community} because it's too short (minimum of "
+                f"{config['posts']['minimum_word_count']} words). You can still see it, but nobody else "
+                f"can. Feel free to resubmit your post with more text in the body to help direct the "
+                f"discussion. Thanks!"
+            )
+            submission.mod.lock()
+            submission.mod.remove(spam=False)
+            return
+
+        # topic meta is refreshed in the background and compiled into a TopicClassifier once per refresh, the
+        # counts come from the hot listings polled by the occupancy tracker
+        classifier = cache.TOPIC_META.get()
+        limits = cache.get_topic_limits(occupancy)["data"]
+
+        # topic limiting is performed before create_post_meta - so if a post is removed for
+        # being limited, it will not count against the XX posts per day limit
+        post_topic = get_submission_topic(submission, classifier, community)
+
+        if post_topic:
+            logger.info(f"  topic detected: {post_topic['display_name']}")
+            topic_meta = next(
+                t
+                for t in limits
+                if t["display_name"] == post_topic["display_name"]
+                and t["community"] == community
+            )
+
+            if topic_meta["current"] >= topic_meta["limit"]:
+                logger.info(
+                    f"  removed due to topic limiting: {topic_meta}"
+                )
+                create_post_meta(submission, None)
+                submission.reply(
+                    f"Sorry u/{submission.author.name}, topic limiting is in effect and only allows "
+                    f"{topic_meta['limit']} posts about **{topic_meta['display_name']}** "
+                    f"in the Hot 50 at a given time. Please try again later..."
+                )
+                submission.mod.lock()
+                submission.mod.remove(spam=False)
+                return
+
+    # todo: currently, eligible_to_submit will remove the post but would read better if
+    #  that logic was performed here
+    if submission.author.name.lower() in ignore_list or eligible_to_submit(
+        submission
+    ):
+        comment_thread_id = build_sticky_comment(submission, post_topic)
+        create_post_meta(submission, comment_thread_id)
+
+
+def setup(reddit_instance=None):
+    """
+    Loads the config, logging and reddit instance used by the post bot.  Called by the blocking loop below and by
+    async_main.py, which streams the submissions itself and passes each one to process_submission().
+    :param reddit_instance: an authorized reddit instance, created from the REDDIT_* settings when not given
+    """
+    global config, username, reddit, subs, occupancy, ledger
+
     # load environment variables
     load_dotenv()
 
     # load config
-    with open(os.path.normpath("../config.json"), "r") as f:
+    with open(os.path.normpath(os.path.join(SCRIPT_DIR, "../config.json")), "r") as f:
         config = json.load(f)
 
     # set up logging
     formatter = logging.Formatter(
         "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
     )
-    logger = logging.getLogger("post_bot")
     logger.setLevel(logging.INFO)
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    log_path = os.path.join(base_dir, "../logs/post-bot.log")
+    log_path = os.path.join(SCRIPT_DIR, "../logs/post-bot.log")
     handler = RotatingFileHandler(
         os.path.normpath(log_path), maxBytes=2500000, backupCount=4
     )
     handler.setFormatter(formatter)
     logger.addHandler(handler)
 
-    # get database location
-    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-    db_path = os.path.join(BASE_DIR, "../database/donut-bot.db")
-    db_path = os.path.normpath(db_path)
-
     username = os.getenv("REDDIT_USERNAME")
 
     # creating an authorized reddit instance
-    reddit = praw.Reddit(
+    reddit = reddit_instance or praw.Reddit(
         client_id=os.getenv("REDDIT_CLIENT_ID"),
         client_secret=os.getenv("REDDIT_CLIENT_SECRET"),
         username=username,
@@ -257,173 +392,23 @@ if __name__ == "__main__":
         if idx < len(config["community_tokens"]) - 1:
             subs += "+"
 
-    # users listed in ignore_list are not restricted to a limited number of posts
-    # be sure to user lowercase when adding to this list
-    ignore_list = ["ethtrader_reposter", "automoderator"]
+    ledger = SubmissionLedger()
+    ledger.load()
+
+    # topic counts are kept from the hot listings in process, instead of waiting on topic_limits.json from github
+    occupancy = TopicOccupancy(reddit, subs.split("+"), cache.TOPIC_META.get,
+                               poll_interval=config["posts"].get("topic_occupancy_poll_seconds", 30))
+    occupancy.start()
 
-    TOPIC_LIMITS = {}
+
+if __name__ == "__main__":
+    setup()
 
     while True:
         try:
             # for submission in reddit.subreddit(subs).stream.submissions():
             for submission in reddit.subreddit(subs).stream.submissions(skip_existing=True):
-                if submission is None:
-                    continue
-
-                if not submission.author or submission.author.name == username:
-                    continue
-
-                try:
-                    logger.info(f"processing submission by [{submission.author.name}]: {submission.fullname} [{submission.title}]")
-                except Exception as e:
-                    logger.error("error processing submission: {e})")
-
-                if previously_processed(submission, username):
-                    logger.info(f"  {submission.fullname} already processed.")
-                    continue
-
-                community = submission.subreddit.display_name.lower()
-
-                logger.info(
-                    f"  is_reddit_media_domain: {submission.is_reddit_media_domain}"
-                )
-
-                post_hint = None
-
-                try:
-                    logger.info(f"  post_hint: {submission.post_hint}")
-                    post_hint = submission.post_hint
-                except Exception as e:
-                    logger.info(f"  post_hint is not present...")
-
-                special_membership_required = False
-                if post_hint and not 'self' in post_hint and not 'link' in post_hint:
-                    logger.info('    special membership required for this post_hint...')
-                    special_membership_required = True
-
-                if submission.is_reddit_media_domain or special_membership_required:
-                    if not cache.is_special_member(submission.author.name, community):
-
-                        logger.info(
-                            f"  is_special_member => false; removed..."
-                        )
-
-                        submission.reply(
-                            f"Your post was removed from r/{community} because media posts are reserved for special "
-                            f"members. Please visit [this link] (https://donut-dashboard.net/#/membership) to learn "
-                            f"more or to purchase a membership.  Otherwise, you can re-submit with a link to the "
-                            f"media in the body of the post."
-                        )
-                        submission.mod.lock()
-                        submission.mod.remove(spam=False)
-                        continue
-
-                    else:
-                        logger.info(
-                            f"  is_reddit_media_domain => true and special member => true; allow..."
-                        )
-
-                excluded = False
-                for excluded_flair in config["posts"][
-                    "minimum_word_count_excluded_flairs"
-                ]:
-                    if "[" + excluded_flair.lower() + "]" in submission.title.lower():
-                        excluded = True
-                        break
-
-                # exclude word count minimum and topic limiting for users in ignore_list
-                post_topic = None
-                if submission.author.name.lower() not in ignore_list:
-                    # exclude word count minimum if using a standardized title
-                    for title in config["posts"]["bypass_word_count_by_title"]:
-                        if title.lower() in submission.title.lower():
-                            excluded = True
-
-                    if (
-                        not excluded
-                        and submission.is_self
-                        and len(submission.selftext.split())
-                        < config["posts"]["minimum_word_count"]
-                    ):
-                        logger.info(
-                            f"  removed due to minimum_word_count={config['posts']['minimum_word_count']}"
-                        )
-
-                        create_post_meta(submission, None)
-
-                        submission.reply(
-                            f"Your post was removed from r/{community} because it's too short (minimum of "
-                            f"{config['posts']['minimum_word_count']} words). You can still see it, but nobody else "
-                            f"can. Feel free to resubmit your post with more text in the body to help direct the "
-                            f"discussion. Thanks!"
-                        )
-                        submission.mod.lock()
-                        submission.mod.remove(spam=False)
-                        continue
-
-                    # refresh topic limits
-                    if (
-                        "last_update" not in TOPIC_LIMITS
-                        or datetime.now() - timedelta(minutes=6)
-                        >= TOPIC_LIMITS["last_update"]
-                    ):
-                        logger.info("  update TOPIC_LIMITS...")
-                        TOPIC_LIMITS["last_update"] = datetime.now()
-                        try:
-                            TOPIC_LIMITS["topics"] = json.load(
-                                urllib.request.urlopen(
-                                    "https://raw.githubusercontent.com/EthTrader/topic-limiting/main/topic_meta.json"
-                                )
-                            )
-                        except Exception:
-                            logger.error("Failed to load topic_meta - invalid .json")
-
-                        try:
-                            TOPIC_LIMITS["limits"] = json.load(
-                                urllib.request.urlopen(
-                                    "https://raw.githubusercontent.com/EthTrader/topic-limiting/main/topic_limits.json"
-                                )
-                            )
-                        except Exception:
-                            logger.error("Failed to load topic_limits - invalid .json")
-
-                    topics = TOPIC_LIMITS["topics"]
-                    limits = TOPIC_LIMITS["limits"]["data"]
-
-                    # topic limiting is performed before create_post_meta - so if a post is removed for
-                    # being limited, it will not count against the XX posts per day limit
-                    post_topic = get_submission_topic(submission, topics, community)
-
-                    if post_topic:
-                        logger.info(f"  topic detected: {post_topic['display_name']}")
-                        topic_meta = next(
-                            t
-                            for t in limits
-                            if t["display_name"] == post_topic["display_name"]
-                            and t["community"] == community
-                        )
-
-                        if topic_meta["current"] >= topic_meta["limit"]:
-                            logger.info(
-                                f"  removed due to topic limiting: {topic_meta}"
-                            )
-                            create_post_meta(submission, None)
-                            submission.reply(
-                                f"Sorry u/{submission.author.name}, topic limiting is in effect and only allows "
-                                f"{topic_meta['limit']} posts about **{topic_meta['display_name']}** "
-                                f"in the Hot 50 at a given time. Please try again later..."
-                            )
-                            submission.mod.lock()
-                            submission.mod.remove(spam=False)
-                            continue
-
-                # todo: currently, eligible_to_submit will remove the post but would read better if
-                #  that logic was performed here
-                if submission.author.name.lower() in ignore_list or eligible_to_submit(
-                    submission
-                ):
-                    comment_thread_id = build_sticky_comment(submission, post_topic)
-                    create_post_meta(submission, comment_thread_id)
+                process_submission(submission)
 
         except Exception as e:
             logger.error(e)
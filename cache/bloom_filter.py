@@ -0,0 +1,43 @@
+import hashlib
+import math
+import threading
+
+
+class BloomFilter:
+    """
+    A set of strings in a fixed amount of memory that can only answer "definitely not added" or "probably added".
+    Sized for `capacity` keys at the given false positive rate, adding more keys than that raises the rate.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        """
+        :param capacity: the number of keys the filter is sized for
+        :param error_rate: the false positive rate at capacity
+        """
+        capacity = max(capacity, 1)
+        self.size = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+        self._lock = threading.Lock()
+
+    def _positions(self, key):
+        # double hashing: k positions from the two halves of one digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        positions = self._positions(key)
+        with self._lock:
+            for position in positions:
+                self.bits[position >> 3] |= 1 << (position & 7)
+            self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def __len__(self):
+        return self.count
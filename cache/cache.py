@@ -1,12 +1,63 @@
-import json
-import urllib.request
-from datetime import datetime, timedelta
+import time
+from datetime import timedelta
 
+from cache import user_registry
+from cache.refreshing_cache import RefreshingCache
+from database import database
+from liquidity.positions import pool_share_by_owner
+from topics.topic_classifier import TopicClassifier
 
-CACHE = {
-    'users': {},
-    'special_members': {}
-}
+
+def index_members(members):
+    """
+    Indexes members.json by community and redditor.  Memberships that apply to every community are stored under
+    'all'.  When a redditor has several memberships in a community, the one that expires last is kept.
+    :param members: the members.json document
+    :return: a dict of {lowercase community: {lowercase redditor: membership}}
+    """
+    index = {}
+
+    for member in members:
+        if not member.get('redditor') or not member.get('community'):
+            continue
+
+        community = index.setdefault(member['community'].lower(), {})
+        redditor = member['redditor'].lower()
+
+        existing = community.get(redditor)
+        if existing is None or (existing.get('expires') or 0) < (member.get('expires') or 0):
+            community[redditor] = member
+
+    return index
+
+
+def is_expired(member, now=None) -> bool:
+    expires = member.get('expires')
+    return expires is not None and expires <= (now or time.time())
+
+
+SPECIAL_MEMBERS = RefreshingCache("special_members",
+                                  "https://raw.githubusercontent.com/EthTrader/memberships/main/members.json",
+                                  timedelta(minutes=10),
+                                  transform=index_members)
+
+TOPIC_META = RefreshingCache("topic_meta",
+                             "https://raw.githubusercontent.com/EthTrader/topic-limiting/main/topic_meta.json",
+                             timedelta(minutes=6),
+                             transform=TopicClassifier)
+
+TOPIC_LIMITS = RefreshingCache("topic_limits",
+                               "https://raw.githubusercontent.com/EthTrader/topic-limiting/main/topic_limits.json",
+                               timedelta(minutes=5))
+
+# counts saved by the topic occupancy tracker are ignored once they are older than this (post-bot is down)
+TOPIC_OCCUPANCY_MAX_AGE = timedelta(minutes=3)
+
+LIQUIDITY_LEADERS = RefreshingCache("liquidity_leaders",
+                                    "https://raw.githubusercontent.com/mattg1981/donut-bot-output/main/liquidity/"
+                                    "liquidity_leaders.json",
+                                    timedelta(minutes=20),
+                                    transform=pool_share_by_owner)
 
 
 def get_user_weight(user: str) -> int:
@@ -15,15 +66,28 @@ def get_user_weight(user: str) -> int:
     :param user: The user
     :return:  The users governance weight
     """
-    #config = json.load(open('config.json'))
-    u = CACHE['users']
+    return user_registry.get_registry().weight_of(user)
 
-    # update user list weight (if needed)
-    if "last_update" not in u or datetime.now() - timedelta(minutes=30) >= u["last_update"]:
-        u['users'] = json.load(urllib.request.urlopen("https://ethtrader.github.io/donut.distribution/users.json"))
-        u['last_update'] = datetime.now()
 
-    return next((u['weight'] for u in u['users'] if u['username'].lower() == user.lower()), 0)
+def get_special_member(user: str, community: str):
+    """
+    Returns the special membership of a user in a given community.
+    :param user: The user
+    :param community: The community
+    :return: The membership, or None if the user is not a special member
+    """
+    index = SPECIAL_MEMBERS.get() or {}
+    user = user.lower()
+    now = time.time()
+
+    # memberships can lapse between refreshes of members.json, so the expiry is checked on every lookup
+    for key in (community.lower(), 'all'):
+        member = index.get(key, {}).get(user)
+        if member and not is_expired(member, now):
+            return member
+
+    return None
+
 
 def is_special_member(user: str, community: str) -> bool:
     """
@@ -32,14 +96,31 @@ def is_special_member(user: str, community: str) -> bool:
     :param community: The community
     :return: True if the user is a special member, False otherwise
     """
-    #config = json.load(open('config.json'))
-    sm = CACHE['special_members']
+    return get_special_member(user, community) is not None
 
-    # update user list weight (if needed)
-    if "last_update" not in sm or datetime.now() - timedelta(minutes=10) >= sm["last_update"]:
-        sm['members'] = json.load(urllib.request.urlopen("https://raw.githubusercontent.com/EthTrader/memberships/main/members.json"))
-        sm['last_update'] = datetime.now()
 
-    member = next((special_member for special_member in sm['members'] if special_member['redditor'].lower() == user.lower() and
-                   (special_member['community'].lower() == community.lower() or special_member['community'].lower() == 'all')), None)
-    return member is not None
+def get_topic_limits(occupancy=None):
+    """
+    Returns the topic limits, as a topic_limits.json document.  The counts post-bot tracks from the hot listings
+    (topics/occupancy.py) are preferred: from memory when the tracker runs in this process, otherwise from the
+    database.  topic_limits.json on github is the fallback when no tracker has polled recently.
+    :param occupancy: the TopicOccupancy running in this process, if any
+    :return: a dict of {'last_update', 'data'}
+    """
+    if occupancy and occupancy.is_current():
+        return occupancy.limits()
+
+    data = database.get_topic_occupancy(time.time() - TOPIC_OCCUPANCY_MAX_AGE.total_seconds())
+    if data:
+        return {'last_update': min(t['updated_at'] for t in data), 'data': data}
+
+    return TOPIC_LIMITS.get()
+
+
+def stats():
+    """
+    :return: the hit/miss/refresh counters of the shared caches, by cache name
+    """
+    caches = [SPECIAL_MEMBERS, TOPIC_META, TOPIC_LIMITS, LIQUIDITY_LEADERS,
+              *(r.cache for r in user_registry.REGISTRIES.values())]
+    return {c.name: c.stats() for c in caches}
@@ -0,0 +1,217 @@
+import json
+import logging
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+
+SNAPSHOT_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../temp/cache"))
+REQUEST_TIMEOUT = 30
+
+
+class RefreshingCache:
+    """
+    A json document downloaded from a url and kept in memory.
+
+    Reads never wait on the network once a value is available: when the value is older than the ttl the stale value
+    is returned and a refresh is started on a background thread (stale-while-revalidate).  Refreshes use a conditional
+    GET (ETag / If-Modified-Since) and the last good response is written to disk, so a restarted bot can serve the
+    snapshot while it revalidates.  A failed refresh keeps the previous value and does not reset the ttl, so the
+    next read tries again.
+    """
+
+    logger = logging.getLogger("donut_bot")
+
+    def __init__(self, name, location, ttl, transform=None, snapshot_dir=SNAPSHOT_DIR):
+        """
+        :param name: the name of the cache, used for logging and the snapshot file name
+        :param location: the url of the json document
+        :param ttl: a timedelta, how long a value is fresh
+        :param transform: optional function applied to the downloaded json, the result is what get() returns
+        :param snapshot_dir: where snapshots are written, None to disable snapshots
+        """
+        self.name = name
+        self.location = location
+        self.ttl = ttl
+        self.transform = transform
+        self.snapshot_path = os.path.join(snapshot_dir, f"{name}.json") if snapshot_dir else None
+
+        self._value = None
+        self._loaded = False
+        self._updated_at = 0.0
+        self._etag = None
+        self._last_modified = None
+
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.counters = {
+            'hits': 0,
+            'stale_hits': 0,
+            'misses': 0,
+            'refreshes': 0,
+            'not_modified': 0,
+            'failures': 0,
+            'refresh_seconds': 0.0,
+            'last_refresh_seconds': 0.0,
+        }
+
+    def get(self):
+        """
+        Returns the cached value.  Only blocks when nothing has been loaded yet (and there is no snapshot on disk).
+        :return: the (transformed) json document, or None if it has never been loaded successfully
+        """
+        if not self._loaded:
+            self.load_snapshot()
+
+        if not self._loaded:
+            self.counters['misses'] += 1
+            self.refresh()
+        elif self.is_stale():
+            self.counters['stale_hits'] += 1
+            self.refresh_in_background()
+        else:
+            self.counters['hits'] += 1
+
+        return self._value
+
+    def is_stale(self):
+        return time.monotonic() - self._updated_at >= self.ttl.total_seconds()
+
+    def refresh(self):
+        """
+        Downloads the document if it changed and swaps it in.  Concurrent calls are collapsed into one download.
+        :return: True if the cache holds a current value afterwards
+        """
+        if not self._refresh_lock.acquire(blocking=False):
+            # another thread is refreshing, wait for it rather than downloading twice
+            with self._refresh_lock:
+                return not self.is_stale()
+
+        try:
+            return self._refresh()
+        finally:
+            self._refresh_lock.release()
+
+    def refresh_in_background(self):
+        if self._refresh_lock.locked():
+            return
+
+        threading.Thread(target=self.refresh, name=f"{self.name}-refresh", daemon=True).start()
+
+    def start(self):
+        """
+        Keeps the cache fresh from a background thread, so that reads are never stale for long.
+        """
+        if self._thread and self._thread.is_alive():
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._refresh_loop, name=f"{self.name}-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _refresh_loop(self):
+        while not self._stop.wait(max(self.ttl.total_seconds() - (time.monotonic() - self._updated_at), 1)):
+            if self.is_stale():
+                self.refresh()
+
+    def _refresh(self):
+        request = urllib.request.Request(self.location)
+        if self._loaded and self._etag:
+            request.add_header("If-None-Match", self._etag)
+        if self._loaded and self._last_modified:
+            request.add_header("If-Modified-Since", self._last_modified)
+
+        started = time.perf_counter()
+        try:
+            try:
+                with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+                    document = json.load(response)
+                    etag = response.headers.get("ETag")
+                    last_modified = response.headers.get("Last-Modified")
+            except urllib.error.HTTPError as e:
+                if e.code != 304:
+                    raise
+
+                self.counters['not_modified'] += 1
+                self._updated_at = time.monotonic()
+                return True
+
+            value = self.transform(document) if self.transform else document
+        except Exception as e:
+            self.counters['failures'] += 1
+            self.logger.error(f"  failed to refresh {self.name} from {self.location} | {e}")
+            return False
+        finally:
+            elapsed = time.perf_counter() - started
+            self.counters['refreshes'] += 1
+            self.counters['refresh_seconds'] += elapsed
+            self.counters['last_refresh_seconds'] = elapsed
+
+        self._set(value, etag, last_modified)
+        self._updated_at = time.monotonic()
+        self.save_snapshot(document)
+        return True
+
+    def set(self, document):
+        """
+        Replaces the cached value without downloading, e.g. with a document that was obtained some other way.
+        :param document: the json document
+        """
+        self._set(self.transform(document) if self.transform else document, None, None)
+        self._updated_at = time.monotonic()
+
+    def _set(self, value, etag, last_modified):
+        self._value = value
+        self._etag = etag
+        self._last_modified = last_modified
+        self._loaded = True
+
+    def load_snapshot(self):
+        """
+        Loads the last good document from disk.  The snapshot is served as stale, so it is revalidated on first use.
+        :return: True if a snapshot was loaded
+        """
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return False
+
+        try:
+            with open(self.snapshot_path, 'r') as f:
+                snapshot = json.load(f)
+
+            document = snapshot['document']
+            self._set(self.transform(document) if self.transform else document,
+                      snapshot.get('etag'), snapshot.get('last_modified'))
+        except Exception as e:
+            self.logger.warning(f"  ignoring unreadable {self.name} snapshot | {e}")
+            return False
+
+        return True
+
+    def save_snapshot(self, document):
+        if not self.snapshot_path:
+            return
+
+        try:
+            os.makedirs(os.path.dirname(self.snapshot_path), exist_ok=True)
+
+            # write then rename so a crash never leaves a half written snapshot behind
+            temp_path = f"{self.snapshot_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'w') as f:
+                json.dump({'etag': self._etag, 'last_modified': self._last_modified, 'document': document}, f)
+            os.replace(temp_path, self.snapshot_path)
+        except OSError as e:
+            self.logger.warning(f"  unable to write {self.name} snapshot | {e}")
+
+    def stats(self):
+        """
+        :return: a copy of the counters, with the average refresh latency in seconds
+        """
+        stats = dict(self.counters)
+        stats['avg_refresh_seconds'] = stats['refresh_seconds'] / stats['refreshes'] if stats['refreshes'] else 0.0
+        return stats
@@ -0,0 +1,68 @@
+import time
+
+from cache.bloom_filter import BloomFilter
+from database import database
+
+# the filter is sized for twice the submissions recorded at load (and at least this many), so it stays accurate
+# while the bot records new ones
+MIN_CAPACITY = 100_000
+ERROR_RATE = 0.001
+
+
+class SubmissionLedger:
+    """
+    The submissions post-bot has processed: everything in post and rejected_post, in a bloom filter.  A submission
+    that is not in the filter was definitely never recorded, so the common case (a new submission) costs neither a
+    database lookup nor a reddit call.
+    """
+
+    def __init__(self, error_rate=ERROR_RATE):
+        self.error_rate = error_rate
+        self.bloom = None
+        self.loaded_at = None
+
+        self.counters = {
+            'negative': 0,
+            'maybe': 0,
+            'recorded': 0,
+        }
+
+    def load(self):
+        ids = database.get_processed_submission_ids()
+
+        self.bloom = BloomFilter(max(2 * len(ids), MIN_CAPACITY), self.error_rate)
+        for submission_id in ids:
+            self.bloom.add(submission_id.lower())
+
+        self.loaded_at = time.time()
+
+    def might_contain(self, fullname):
+        """
+        :return: False if the submission was definitely never recorded, True if it probably was
+        """
+        if self.bloom is None:
+            self.load()
+
+        if fullname.lower() in self.bloom:
+            self.counters['maybe'] += 1
+            return True
+
+        self.counters['negative'] += 1
+        return False
+
+    def record(self, fullname):
+        if self.bloom is None:
+            self.load()
+
+        self.bloom.add(fullname.lower())
+        self.counters['recorded'] += 1
+
+    def created_since_load(self, submission):
+        """
+        A submission created after the ledger was loaded can only have been processed by this process, which records
+        everything it processes in the ledger.
+        """
+        return self.loaded_at is not None and submission.created_utc > self.loaded_at
+
+    def stats(self):
+        return dict(self.counters)
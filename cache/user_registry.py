@@ -0,0 +1,134 @@
+import threading
+from datetime import timedelta
+
+from cache.refreshing_cache import RefreshingCache, SNAPSHOT_DIR
+
+USERS_LOCATION = "https://ethtrader.github.io/donut.distribution/users.json"
+REFRESH_INTERVAL = timedelta(minutes=30)
+
+REGISTRIES = {}
+REGISTRIES_LOCK = threading.Lock()
+
+
+def index_users(users):
+    """
+    Indexes a users.json document.
+    :param users: a list of users in the users.json format
+    :return: a tuple of (users, users by case-folded name, users by lowercase address)
+    """
+    by_name = {}
+    by_address = {}
+
+    for user in users:
+        if user.get('username'):
+            by_name.setdefault(user['username'].casefold(), user)
+        if user.get('address'):
+            by_address.setdefault(user['address'].lower(), user)
+
+    return users, by_name, by_address
+
+
+class UserRegistry:
+    """
+    In-memory copy of users.json, indexed by (case-folded) username and address.
+
+    Lookups are dict hits instead of scans of the user list.  A refresh builds a complete new index and swaps it in
+    with a single assignment, so readers on other threads always see either the old or the new users - never a
+    partially built index.
+    """
+
+    def __init__(self, location=USERS_LOCATION, refresh_interval=REFRESH_INTERVAL, snapshot_dir=SNAPSHOT_DIR):
+        self.cache = RefreshingCache("users", location, refresh_interval, transform=index_users,
+                                     snapshot_dir=snapshot_dir)
+
+    @property
+    def _index(self):
+        return self.cache.get() or ([], {}, {})
+
+    @property
+    def users(self):
+        return self._index[0]
+
+    def load(self, users):
+        """
+        Replaces the registry contents with the given users.
+        :param users: a list of users in the users.json format
+        """
+        self.cache.set(users)
+
+    def add(self, user):
+        """
+        Adds a single user to the registry.  The user is dropped again on the next refresh unless it is present in
+        the users file by then.
+        :param user: a user in the users.json format
+        """
+        users, by_name, by_address = self._index
+        users.append(user)
+
+        if user.get('username'):
+            by_name.setdefault(user['username'].casefold(), user)
+        if user.get('address'):
+            by_address.setdefault(user['address'].lower(), user)
+
+    def refresh(self):
+        """
+        Downloads the users file and swaps it in.  On failure the previous users are kept.
+        :return: True if the users are current
+        """
+        return self.cache.refresh()
+
+    def start(self):
+        """
+        Starts refreshing the registry on a background thread.
+        """
+        self.cache.start()
+
+    def stop(self):
+        self.cache.stop()
+
+    def by_name(self, name):
+        """
+        Returns the user with the given reddit name.
+        :param name: the reddit name, in any case
+        :return: the user, or None if they are not in the users file
+        """
+        if not name:
+            return None
+
+        return self._index[1].get(name.casefold())
+
+    def by_address(self, address):
+        """
+        Returns the user registered to the given address.
+        :param address: the wallet address, in any case
+        :return: the user, or None if the address is not in the users file
+        """
+        if not address:
+            return None
+
+        return self._index[2].get(address.lower())
+
+    def weight_of(self, name):
+        """
+        Returns the governance weight of a user.
+        :param name: the reddit name, in any case
+        :return: the users governance weight, 0 if they are not in the users file
+        """
+        user = self.by_name(name)
+        return int(user['weight']) if user else 0
+
+
+def get_registry(location=USERS_LOCATION):
+    """
+    Returns the shared registry for the given users file, starting its background refresh on first use.
+    :param location: the url of the users file
+    :return: a UserRegistry
+    """
+    with REGISTRIES_LOCK:
+        registry = REGISTRIES.get(location)
+        if registry is None:
+            registry = UserRegistry(location)
+            registry.start()
+            REGISTRIES[location] = registry
+
+    return registry
@@ -0,0 +1,131 @@
+import logging
+
+from eth_utils.abi import event_abi_to_log_topic
+from web3 import Web3
+
+from chain.logs import get_logs, topic_to_address, DEFAULT_BLOCK_RANGE
+from chain.multicall import Multicall
+from database import database
+
+# addresses read (and saved) per chunk, the progress of a crashed run is kept up to the last saved chunk
+CHUNK_SIZE = 2_000
+
+# the events that change the balance of the addresses in their indexed arguments
+TRANSFER_EVENTS = ("Transfer",)
+STAKING_EVENTS = ("Staked", "Withdrawn")
+
+
+class BalanceSnapshot:
+    """
+    The balances of a chain's tokens for a set of addresses, kept in the balance_snapshot table so that a run only
+    re-reads the addresses that had a balance changing event (e.g. a Transfer) since the previous snapshot.
+
+    A snapshot is taken at a single block.  The block the snapshot is complete at is the checkpoint, the block of a
+    snapshot in progress is kept too - after a crash, the next run first finishes that snapshot (skipping the
+    addresses already saved at its block) and then moves on to the current block.
+    """
+
+    logger = logging.getLogger("donut_bot")
+
+    def __init__(self, chain, w3, tokens, multicall=None, block_range=DEFAULT_BLOCK_RANGE, chunk_size=CHUNK_SIZE):
+        """
+        :param chain: the chain name, e.g. "eth"
+        :param w3: the chain's Web3 client
+        :param tokens: a dict of name -> (contract, names of the events that change balances)
+        :param multicall: the Multicall used to read the balances
+        :param block_range: blocks per eth_getLogs request
+        :param chunk_size: balances read and saved at a time
+        """
+        self.chain = chain
+        self.w3 = w3
+        self.tokens = tokens
+        self.multicall = multicall or Multicall(w3)
+        self.block_range = block_range
+        self.chunk_size = chunk_size
+
+        self.checkpoint_setting = f"balance_snapshot_{chain}_block"
+        self.pending_setting = f"balance_snapshot_{chain}_pending"
+
+        self.queried = 0
+
+    @property
+    def checkpoint(self):
+        value = database.get_setting(self.checkpoint_setting)
+        return int(value) if value else None
+
+    def changed_addresses(self, name, from_block, to_block):
+        """
+        :return: the lowercase addresses in the indexed arguments of the token's balance changing events
+        """
+        contract, events = self.tokens[name]
+        topics = [event_abi_to_log_topic(contract.events[event]().abi) for event in events]
+
+        changed = set()
+        for log in get_logs(self.w3, {"address": contract.address, "topics": [topics]}, from_block, to_block,
+                            self.block_range):
+            changed.update(topic_to_address(topic) for topic in log["topics"][1:])
+
+        return changed
+
+    def refresh(self, addresses, block_number):
+        """
+        Brings the snapshot of the addresses up to the given block.
+        :param addresses: the addresses to snapshot
+        :param block_number: the block to snapshot at
+        :return: the balances in wei, by token name and then by address (as given)
+        """
+        pending = database.get_setting(self.pending_setting)
+        if pending and int(pending) < block_number:
+            self.logger.info(f"  [{self.chain}] resuming the snapshot at block {pending}...")
+            self._advance(addresses, int(pending))
+
+        checkpoint = self.checkpoint
+        if checkpoint is None or checkpoint < block_number:
+            self._advance(addresses, block_number)
+
+        snapshot = database.get_balance_snapshot(self.chain)
+        return {name: {a: snapshot[name][a.lower()][0] for a in addresses} for name in self.tokens}
+
+    def _advance(self, addresses, block_number):
+        database.set_setting(self.pending_setting, str(block_number))
+
+        checkpoint = self.checkpoint
+        snapshot = database.get_balance_snapshot(self.chain)
+
+        for name, (contract, events) in self.tokens.items():
+            saved = snapshot.get(name, {})
+
+            # without a checkpoint every address is read, otherwise only the ones with a balance change
+            changed = None
+            if checkpoint is not None:
+                changed = self.changed_addresses(name, checkpoint + 1, block_number)
+
+            stale = []
+            unchanged = []
+            for a in dict.fromkeys(a.lower() for a in addresses):
+                saved_block = saved[a][1] if a in saved else None
+                if saved_block is not None and saved_block >= block_number:
+                    continue
+
+                # a row older than the checkpoint was not tracked for a while, so its events were not looked at
+                if changed is not None and saved_block is not None and saved_block >= checkpoint \
+                        and a not in changed:
+                    unchanged.append(a)
+                else:
+                    stale.append(a)
+
+            self.logger.info(f"  [{self.chain}] {name}: {len(stale)} of {len(addresses)} balances to read at "
+                             f"block {block_number}")
+
+            for start in range(0, len(stale), self.chunk_size):
+                chunk = stale[start:start + self.chunk_size]
+                balances = self.multicall.balances_of(contract, [Web3.to_checksum_address(a) for a in chunk],
+                                                      block_number)
+                database.save_balance_snapshot(self.chain, name, balances, block_number)
+                self.queried += len(chunk)
+
+            # the balances without events are still current, move them up to the block
+            database.touch_balance_snapshot(self.chain, name, unchanged, block_number)
+
+        database.set_setting(self.checkpoint_setting, str(block_number))
+        database.set_setting(self.pending_setting, None)
@@ -0,0 +1,272 @@
+import json
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+from web3 import Web3
+
+# read-only methods that are queued and sent together, everything else goes out on its own straight away
+BATCHED_METHODS = {
+    "eth_call",
+    "eth_getBlockByNumber",
+    "eth_getTransactionByHash",
+    "eth_getTransactionReceipt",
+}
+
+# json-rpc requests sent per batch
+BATCH_SIZE = 50
+
+# seconds a queued request waits for others to join its batch
+LINGER_SECONDS = 0.005
+
+# one limiter per endpoint, shared by every provider (and pool) in the process that talks to it
+RATE_LIMITERS = {}
+RATE_LIMITERS_LOCK = threading.Lock()
+
+
+class RateLimiter:
+    """
+    A token bucket: allows `rate` http requests per second on average, with bursts of up to `burst` requests.
+    acquire() blocks until the request is allowed.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(int(rate), 1)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+        self.waited = 0.0
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+            # take the token now, callers that arrive while this one sleeps queue up behind it
+            self.tokens -= 1
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0
+            self.waited += delay
+
+        if delay:
+            time.sleep(delay)
+
+
+def get_rate_limiter(endpoint, rate):
+    """
+    :param endpoint: the rpc endpoint
+    :param rate: http requests per second, only used when the endpoint's limiter is first created
+    :return: the process-wide limiter of the endpoint, None when there is no rate
+    """
+    if not rate:
+        return None
+
+    with RATE_LIMITERS_LOCK:
+        limiter = RATE_LIMITERS.get(endpoint)
+        if limiter is None:
+            limiter = RATE_LIMITERS[endpoint] = RateLimiter(rate)
+
+    return limiter
+
+
+class SessionHTTPProvider(Web3.HTTPProvider):
+    """
+    An HTTPProvider that sends every request through the given session.  The stock provider keeps a session per
+    thread, which means a new connection (and TLS handshake) for every thread that makes a call.
+    """
+
+    def __init__(self, endpoint_uri, session, request_kwargs=None):
+        super().__init__(endpoint_uri, request_kwargs=request_kwargs)
+        self.session = session
+
+    def make_request(self, method, params):
+        response = self.session.post(self.endpoint_uri, data=self.encode_rpc_request(method, params),
+                                     **self.get_request_kwargs())
+        response.raise_for_status()
+        return self.decode_rpc_response(response.content)
+
+    def make_batch_request(self, requests):
+        """
+        Sends several json-rpc requests in a single http request.
+        :param requests: a list of (method, params)
+        :return: the responses in the same order, each a dict with either a "result" or an "error"
+        """
+        payload = [{"jsonrpc": "2.0", "method": method, "params": params, "id": idx}
+                   for idx, (method, params) in enumerate(requests)]
+        response = self.session.post(self.endpoint_uri, data=json.dumps(payload), **self.get_request_kwargs())
+        response.raise_for_status()
+
+        by_id = {r.get("id"): r for r in response.json()}
+        return [by_id.get(idx, {"error": {"message": "missing from the batch response"}})
+                for idx in range(len(requests))]
+
+
+class BatchingHTTPProvider(SessionHTTPProvider):
+    """
+    A SessionHTTPProvider that coalesces concurrent read requests (BATCHED_METHODS) into json-rpc batches.  A
+    request is queued and a sender thread posts the queue once it holds batch_size requests or the oldest request
+    has waited linger seconds, a request that is alone in the queue is sent as a plain request.  Callers block until
+    their own response is in, so nothing changes for the web3 code above it.
+
+    Every http request first takes a token from the endpoint's rate limiter, if it has one.
+    """
+
+    logger = logging.getLogger("donut_bot")
+
+    def __init__(self, endpoint_uri, session, request_kwargs=None, batch_size=BATCH_SIZE, linger=LINGER_SECONDS,
+                 rate_limiter=None):
+        """
+        :param batch_size: requests per batch, 1 turns batching off
+        :param linger: seconds a queued request waits for others to join its batch
+        :param rate_limiter: a RateLimiter shared by everything that talks to the endpoint, or None
+        """
+        super().__init__(endpoint_uri, session, request_kwargs=request_kwargs)
+        self.batch_size = batch_size
+        self.linger = linger
+        self.rate_limiter = rate_limiter
+
+        self.pending = []
+        self.condition = threading.Condition()
+        self.sender = None
+        self.closed = False
+
+        self.stats_lock = threading.Lock()
+        self.requests = 0
+        self.batched = 0
+        self.posts = 0
+        self.batches = 0
+        self.errors = 0
+        self.latency = 0.0
+        self.max_latency = 0.0
+
+    def make_request(self, method, params):
+        if method not in BATCHED_METHODS or self.batch_size <= 1:
+            started = time.monotonic()
+            failed = True
+            try:
+                response = self._post(method, params)
+                failed = "error" in response
+                return response
+            finally:
+                self._record(1, time.monotonic() - started, errors=int(failed))
+
+        future = Future()
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("provider is closed")
+
+            self.pending.append((method, params, future, time.monotonic()))
+            if self.sender is None:
+                self.sender = threading.Thread(target=self._send_loop, name="rpc-batch", daemon=True)
+                self.sender.start()
+            self.condition.notify()
+
+        return future.result()
+
+    def make_batch_request(self, requests):
+        started = time.monotonic()
+        responses = None
+        try:
+            responses = self._post_batch(requests)
+            return responses
+        finally:
+            failed = len(requests) if responses is None else sum("error" in r for r in responses)
+            self._record(len(requests), time.monotonic() - started, errors=failed)
+
+    def _limit(self):
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+
+    def _post(self, method, params):
+        self._limit()
+        with self.stats_lock:
+            self.posts += 1
+
+        return super().make_request(method, params)
+
+    def _post_batch(self, requests):
+        self._limit()
+        with self.stats_lock:
+            self.posts += 1
+            self.batches += 1
+            self.batched += len(requests)
+
+        return super().make_batch_request(requests)
+
+    def _record(self, count, latency, errors=0):
+        with self.stats_lock:
+            self.requests += count
+            self.errors += errors
+            self.latency += latency * count
+            self.max_latency = max(self.max_latency, latency)
+
+    def _next_batch(self):
+        """
+        Waits for the queue to fill up or for the oldest request to linger long enough.
+        :return: the requests to send, None once the provider is closed
+        """
+        with self.condition:
+            while not self.pending and not self.closed:
+                self.condition.wait()
+
+            if self.closed:
+                return None
+
+            deadline = self.pending[0][3] + self.linger
+            while len(self.pending) < self.batch_size and not self.closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+
+            batch = self.pending[:self.batch_size]
+            del self.pending[:self.batch_size]
+            return batch
+
+    def _send_loop(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+
+            try:
+                if len(batch) == 1:
+                    method, params, _, _ = batch[0]
+                    responses = [self._post(method, params)]
+                else:
+                    responses = self._post_batch([(method, params) for method, params, _, _ in batch])
+            except Exception as e:
+                self.logger.warning(f"  [{self.endpoint_uri}] batch of {len(batch)} failed: {e}")
+                responses = None
+                error = e
+
+            now = time.monotonic()
+            for idx, (_, _, future, queued) in enumerate(batch):
+                if responses is None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(responses[idx])
+                self._record(1, now - queued, errors=int(responses is None or "error" in responses[idx]))
+
+    def metrics(self):
+        with self.stats_lock:
+            return {'requests': self.requests, 'batched': self.batched, 'posts': self.posts, 'batches': self.batches,
+                    'errors': self.errors,
+                    'avg_latency_ms': round(self.latency / self.requests * 1000, 2) if self.requests else 0,
+                    'max_latency_ms': round(self.max_latency * 1000, 2),
+                    'rate_limited_ms': round(self.rate_limiter.waited * 1000, 2) if self.rate_limiter else 0}
+
+    def close(self):
+        """
+        Stops the sender thread, requests still queued fail.
+        """
+        with self.condition:
+            self.closed = True
+            pending, self.pending = self.pending, []
+            self.condition.notify_all()
+
+        for _, _, future, _ in pending:
+            future.set_exception(RuntimeError("provider is closed"))
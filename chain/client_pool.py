@@ -0,0 +1,209 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from web3 import Web3
+from web3.middleware import simple_cache_middleware
+
+from chain.batching_provider import BATCH_SIZE, LINGER_SECONDS, BatchingHTTPProvider, get_rate_limiter
+
+# the environment variable holding the rpc endpoint of each chain
+PROVIDERS = {
+    "eth": "INFURA_ETH_PROVIDER",
+    "gno": "ANKR_API_PROVIDER",
+    "arb1": "CHAINSTACK_ARB1_PROVIDER",
+}
+
+# seconds a single rpc request may take before the chain is given up on
+DEFAULT_TIMEOUT = 10
+
+# concurrent requests per chain (and size of the keep-alive connection pool)
+CONNECTIONS_PER_CHAIN = 4
+
+POOLS = {}
+POOLS_LOCK = threading.Lock()
+
+
+class ChainClientPool:
+    """
+    One Web3 client per chain, each with its own persistent (keep-alive) http session, plus a cache of the contract
+    objects built on them.  Clients are created on first use and then shared, so repeated lookups reuse the open
+    connections instead of paying for a new TLS handshake every time.
+
+    read() runs a set of contract calls concurrently and returns whatever finished in time, a slow or failing chain
+    does not hold up (or fail) the calls to the other chains.
+
+    Concurrent reads on a chain are coalesced into json-rpc batches and every chain can be given a rate limit, see
+    chain.batching_provider.
+    """
+
+    logger = logging.getLogger("donut_bot")
+
+    def __init__(self, providers=None, timeouts=None, default_timeout=DEFAULT_TIMEOUT,
+                 connections_per_chain=CONNECTIONS_PER_CHAIN, batch_size=BATCH_SIZE, linger=LINGER_SECONDS,
+                 requests_per_second=None):
+        """
+        :param providers: rpc endpoint by chain, read from the PROVIDERS environment variables when not given
+        :param timeouts: seconds per chain, overrides default_timeout, e.g. {"eth": 15}
+        :param default_timeout: seconds a request may take on chains without their own timeout
+        :param connections_per_chain: size of each chain's connection pool
+        :param batch_size: requests per json-rpc batch, 1 turns batching off
+        :param linger: seconds a request waits for others to join its batch
+        :param requests_per_second: http requests per second by chain, chains without one are not limited
+        """
+        self.providers = providers if providers is not None else {chain: os.getenv(env)
+                                                                  for chain, env in PROVIDERS.items()}
+        self.timeouts = timeouts or {}
+        self.default_timeout = default_timeout
+        self.connections_per_chain = connections_per_chain
+        self.batch_size = batch_size
+        self.linger = linger
+        self.requests_per_second = requests_per_second or {}
+
+        self.clients = {}
+        self.sessions = {}
+        self.contracts = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max(len(self.providers), 1) * connections_per_chain,
+                                           thread_name_prefix="chain")
+
+        self.requests = 0
+        self.failures = 0
+        self.timed_out = 0
+
+    def timeout(self, chain):
+        return self.timeouts.get(chain, self.default_timeout)
+
+    def web3(self, chain):
+        """
+        :param chain: the chain name, e.g. "eth", "gno" or "arb1"
+        :return: the shared Web3 client of the chain
+        """
+        client = self.clients.get(chain)
+        if client is None:
+            with self.lock:
+                client = self.clients.get(chain)
+                if client is None:
+                    client = self.clients[chain] = self._build_client(chain)
+
+        return client
+
+    def _build_client(self, chain):
+        endpoint = self.providers.get(chain)
+        if not endpoint:
+            raise ValueError(f"no rpc provider configured for chain [{chain}]")
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.connections_per_chain)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        self.sessions[chain] = session
+
+        provider = BatchingHTTPProvider(endpoint, session, request_kwargs={"timeout": self.timeout(chain)},
+                                        batch_size=self.batch_size, linger=self.linger,
+                                        rate_limiter=get_rate_limiter(endpoint, self.requests_per_second.get(chain)))
+        w3 = Web3(provider)
+
+        # contract calls look up the chain id every time, it never changes so only ask for it once
+        w3.middleware_onion.add(simple_cache_middleware)
+        return w3
+
+    def contract(self, chain, address, abi):
+        """
+        :param chain: the chain the contract is deployed on
+        :param address: the contract address
+        :param abi: the contract abi, only used the first time the contract is requested
+        :return: the cached contract object
+        """
+        key = (chain, address.lower())
+        contract = self.contracts.get(key)
+        if contract is None:
+            w3 = self.web3(chain)
+            contract = w3.eth.contract(address=Web3.to_checksum_address(address), abi=abi)
+            with self.lock:
+                contract = self.contracts.setdefault(key, contract)
+
+        return contract
+
+    def read(self, calls):
+        """
+        Runs the calls concurrently.  Each call is given the timeout of its chain, calls that fail or do not finish
+        in time are left out of the result.
+        :param calls: a dict of name -> (chain, function), e.g.
+            {"eth": ("eth", contract.functions.balanceOf(address).call)}
+        :return: a tuple of (results by name, errors by name)
+        """
+        started = time.monotonic()
+        futures = {name: self.executor.submit(fn) for name, (chain, fn) in calls.items()}
+        deadlines = {name: started + self.timeout(chain) for name, (chain, fn) in calls.items()}
+
+        # every call is waited on until its own chain's deadline at the most
+        results = {}
+        errors = {}
+        for name, future in futures.items():
+            chain = calls[name][0]
+            try:
+                results[name] = future.result(timeout=max(deadlines[name] - time.monotonic(), 0))
+            except TimeoutError:
+                errors[name] = TimeoutError(f"[{chain}] did not respond within {self.timeout(chain)}s")
+            except Exception as e:
+                errors[name] = e
+
+        with self.lock:
+            self.requests += len(calls)
+            self.failures += len(errors)
+            self.timed_out += sum(isinstance(e, TimeoutError) for e in errors.values())
+
+        for name, e in errors.items():
+            self.logger.warning(f"  [{calls[name][0]}] {name} failed: {e}")
+
+        return results, errors
+
+    def balances_of(self, address, tokens):
+        """
+        Reads the balanceOf of an address on several token contracts at once.
+        :param address: the checksummed holder address
+        :param tokens: a dict of name -> (chain, token address, abi)
+        :return: a tuple of (balances in wei by name, errors by name)
+        """
+        calls = {name: (chain, self.contract(chain, token, abi).functions.balanceOf(address).call)
+                 for name, (chain, token, abi) in tokens.items()}
+        return self.read(calls)
+
+    def metrics(self):
+        with self.lock:
+            clients = dict(self.clients)
+            metrics = {'clients': len(clients), 'contracts': len(self.contracts), 'requests': self.requests,
+                       'failures': self.failures, 'timed_out': self.timed_out}
+
+        metrics['rpc'] = {chain: w3.provider.metrics() for chain, w3 in clients.items()}
+        return metrics
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        for w3 in list(self.clients.values()):
+            w3.provider.close()
+        for session in list(self.sessions.values()):
+            session.close()
+
+
+def get_pool(settings=None):
+    """
+    :param settings: the "chain_clients" section of the config, only used when the pool is first created
+    :return: the process-wide pool for the chains configured in the environment
+    """
+    settings = settings or {}
+    with POOLS_LOCK:
+        pool = POOLS.get("default")
+        if pool is None:
+            pool = POOLS["default"] = ChainClientPool(
+                timeouts=settings.get("timeout_seconds"),
+                batch_size=settings.get("batch_size", BATCH_SIZE),
+                linger=settings.get("linger_ms", LINGER_SECONDS * 1000) / 1000,
+                requests_per_second=settings.get("requests_per_second"))
+
+    return pool
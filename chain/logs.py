@@ -0,0 +1,50 @@
+import logging
+
+from web3 import Web3
+
+# blocks per eth_getLogs request, halved whenever a provider rejects a range (too many results / timeouts)
+DEFAULT_BLOCK_RANGE = 2_000
+MIN_BLOCK_RANGE = 1
+
+logger = logging.getLogger("donut_bot")
+
+
+def topic_to_address(topic):
+    """
+    :param topic: an indexed address topic (32 bytes, left padded)
+    :return: the lowercase address
+    """
+    return "0x" + Web3.to_hex(topic)[-40:].lower()
+
+
+def get_logs(w3, log_filter, from_block, to_block, block_range=DEFAULT_BLOCK_RANGE, max_block_range=None):
+    """
+    Fetches the logs matching a filter over a block range too large for a single request.  The range is walked in
+    chunks, a chunk that fails is retried at half the size.
+    :param w3: the chain's Web3 client
+    :param log_filter: the filter without fromBlock / toBlock, e.g. {"address": ..., "topics": [...]}
+    :param from_block: the first block, inclusive
+    :param to_block: the last block, inclusive
+    :param block_range: blocks per request to start with
+    :param max_block_range: when given, the chunk size doubles after every successful request, up to this size
+    :return: a generator of logs, in block order
+    """
+    start = from_block
+    while start <= to_block:
+        end = min(start + block_range - 1, to_block)
+
+        try:
+            logs = w3.eth.get_logs({**log_filter, "fromBlock": start, "toBlock": end})
+        except Exception as e:
+            if block_range <= MIN_BLOCK_RANGE:
+                raise
+
+            block_range = max(block_range // 2, MIN_BLOCK_RANGE)
+            logger.warning(f"  get_logs [{start} - {end}] failed ({e}), retrying with {block_range} blocks...")
+            continue
+
+        yield from logs
+        start = end + 1
+
+        if max_block_range:
+            block_range = min(block_range * 2, max_block_range)
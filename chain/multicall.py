@@ -0,0 +1,115 @@
+import json
+import logging
+import os
+import time
+
+from eth_utils.abi import collapse_if_tuple, function_abi_to_4byte_selector
+from web3 import Web3
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Multicall3 is deployed at the same address on mainnet, gnosis and arbitrum one
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+
+# sub-calls packed into a single aggregate3 call
+BATCH_SIZE = 500
+
+# attempts per aggregate3 call / per individually retried sub-call
+RETRIES = 5
+RETRY_BACKOFF_SECONDS = 2
+
+
+def load_multicall_abi():
+    with open(os.path.normpath(os.path.join(SCRIPT_DIR, "../contracts/multicall3_abi.json")), 'r') as f:
+        return json.load(f)
+
+
+def with_retries(fn, retries=RETRIES, backoff=RETRY_BACKOFF_SECONDS):
+    for attempt in range(1, retries + 1):
+        try:
+            return fn()
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(backoff * attempt)
+
+
+class Multicall:
+    """
+    Reads many contract view functions of a single chain with a few aggregate3 calls to Multicall3, all pinned to
+    the same block.  Sub-calls are sent with allowFailure, the ones that fail are retried one by one so a single
+    bad call does not fail its whole batch.
+    """
+
+    logger = logging.getLogger("donut_bot")
+
+    def __init__(self, w3, abi=None, address=MULTICALL3_ADDRESS, batch_size=BATCH_SIZE, retries=RETRIES,
+                 backoff=RETRY_BACKOFF_SECONDS):
+        self.w3 = w3
+        self.contract = w3.eth.contract(address=Web3.to_checksum_address(address), abi=abi or load_multicall_abi())
+        self.aggregate3 = self.contract.get_function_by_name("aggregate3").abi
+        self.batch_size = batch_size
+        self.retries = retries
+        self.backoff = backoff
+
+        self.aggregate_calls = 0
+        self.retried = 0
+
+    def call(self, functions, block_identifier, allow_failure=False):
+        """
+        :param functions: contract function calls, e.g. [token.functions.balanceOf(address), ...]
+        :param block_identifier: the block number all the calls are read at
+        :param allow_failure: when set, sub-calls that fail (e.g. revert) are not retried and come back as None
+        :return: the decoded result of every function, in the same order
+        """
+        results = []
+        for start in range(0, len(functions), self.batch_size):
+            results.extend(self._call_batch(functions[start:start + self.batch_size], block_identifier,
+                                            allow_failure))
+
+        return results
+
+    def _encode(self, abi, args):
+        # web3's own encoder validates and normalizes every argument, which is most of the time spent on a batch
+        # of hundreds of calls - the arguments are encoded directly against the function's abi instead
+        input_types = [collapse_if_tuple(i) for i in abi['inputs']]
+        return function_abi_to_4byte_selector(abi) + self.w3.codec.encode(input_types, args)
+
+    def _decode(self, abi, data):
+        decoded = self.w3.codec.decode([collapse_if_tuple(o) for o in abi['outputs']], data)
+        return decoded[0] if len(decoded) == 1 else list(decoded)
+
+    def _call_batch(self, functions, block_identifier, allow_failure=False):
+        calls = [(fn.address, True, self._encode(fn.abi, fn.args)) for fn in functions]
+        transaction = {"to": self.contract.address, "data": self._encode(self.aggregate3, [calls])}
+        raw = with_retries(lambda: self.w3.eth.call(transaction, block_identifier=block_identifier), self.retries,
+                           self.backoff)
+        response = self._decode(self.aggregate3, raw)
+        self.aggregate_calls += 1
+
+        results = []
+        for fn, (success, data) in zip(functions, response):
+            if success and data:
+                results.append(self._decode(fn.abi, data))
+                continue
+
+            if allow_failure:
+                results.append(None)
+                continue
+
+            self.logger.warning(f"  {fn.fn_name}{fn.args} failed in aggregate3, retrying on its own...")
+            self.retried += 1
+            results.append(with_retries(lambda: fn.call(block_identifier=block_identifier), self.retries,
+                                        self.backoff))
+
+        return results
+
+    def balances_of(self, token, addresses, block_identifier):
+        """
+        :param token: an erc20 contract object
+        :param addresses: the holder addresses
+        :param block_identifier: the block number the balances are read at
+        :return: a dict of address -> balance in wei
+        """
+        functions = [token.functions.balanceOf(Web3.to_checksum_address(a)) for a in addresses]
+        return dict(zip(addresses, self.call(functions, block_identifier)))
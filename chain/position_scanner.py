@@ -0,0 +1,82 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from web3 import Web3
+
+# aggregate3 calls in flight at the same time
+WORKERS = 4
+
+# indexes into the result of the position manager's positions(tokenId)
+TOKEN0 = 2
+TOKEN1 = 3
+TICK_LOWER = 5
+TICK_UPPER = 6
+LIQUIDITY = 7
+
+
+class PositionScanner:
+    """
+    Reads uniswap v3 style liquidity positions (the sushi position manager nfts) with Multicall3.  positions() and
+    ownerOf() of many token ids are packed into aggregate3 calls, a few of which are in flight at once, all pinned
+    to the same block.  Token ids that were burned (or not minted yet) revert and are left out.
+    """
+
+    logger = logging.getLogger("donut_bot")
+
+    def __init__(self, multicall, nft_contract, workers=WORKERS):
+        """
+        :param multicall: a Multicall on the position manager's chain
+        :param nft_contract: the position manager contract
+        """
+        self.multicall = multicall
+        self.nft_contract = nft_contract
+        self.workers = workers
+
+    def _call(self, functions, block_identifier):
+        size = self.multicall.batch_size
+        batches = [functions[start:start + size] for start in range(0, len(functions), size)]
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = executor.map(lambda b: self.multicall.call(b, block_identifier, allow_failure=True), batches)
+            return [r for batch in results for r in batch]
+
+    def positions(self, token_ids, block_identifier):
+        """
+        :return: the raw positions() result by token id, None for token ids that do not exist
+        """
+        functions = [self.nft_contract.functions.positions(i) for i in token_ids]
+        return dict(zip(token_ids, self._call(functions, block_identifier)))
+
+    def owners(self, token_ids, block_identifier):
+        """
+        :return: the checksummed owner address by token id
+        """
+        functions = [self.nft_contract.functions.ownerOf(i) for i in token_ids]
+        return {token_id: Web3.to_checksum_address(owner) if owner else None
+                for token_id, owner in zip(token_ids, self._call(functions, block_identifier))}
+
+    def scan(self, token_ids, token, block_identifier):
+        """
+        Finds the positions with the given token on either side.  Owners are only looked up for the positions that
+        hold liquidity, an empty position can be added to again later so it is still returned.
+        :param token_ids: the position manager token ids to look at
+        :param token: the token address, e.g. donut
+        :param block_identifier: the block number everything is read at
+        :return: a list of dicts with the id, owner (None without liquidity), liquidity, tick_lower and tick_upper
+        """
+        token = token.lower()
+        found = []
+        for token_id, position in self.positions(list(dict.fromkeys(token_ids)), block_identifier).items():
+            if position is None:
+                continue
+
+            if token in (position[TOKEN0].lower(), position[TOKEN1].lower()):
+                found.append({"id": token_id, "owner": None, "liquidity": position[LIQUIDITY],
+                              "tick_lower": position[TICK_LOWER], "tick_upper": position[TICK_UPPER]})
+
+        owners = self.owners([p["id"] for p in found if p["liquidity"] > 0], block_identifier)
+        for position in found:
+            position["owner"] = owners.get(position["id"])
+
+        self.logger.info(f"  scanned {len(token_ids)} token ids: {len(found)} positions, {len(owners)} with liquidity")
+        return found
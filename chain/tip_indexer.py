@@ -0,0 +1,127 @@
+import logging
+from collections import OrderedDict
+
+from eth_utils.abi import event_abi_to_log_topic
+
+from chain.logs import get_logs
+from database import database
+
+# blocks scanned on the very first run, before there is a cursor
+INITIAL_WINDOW = 5_000
+
+# blocks before the cursor that are scanned again, in case the end of the previous scan was reorganized
+REORG_BLOCKS = 20
+
+# eth_getLogs range to start with and the largest range it grows to
+BLOCK_RANGE = 5_000
+MAX_BLOCK_RANGE = 100_000
+
+# json-rpc requests sent per batch
+BATCH_SIZE = 100
+
+# block timestamps kept in memory
+TIMESTAMP_CACHE_SIZE = 10_000
+
+
+class TipIndexer:
+    """
+    Follows the Tip events of the tipping contract.  The last block processed is kept in the settings table, every
+    run only scans the blocks after it.  The receipt status and block timestamp of the new tips are looked up with
+    json-rpc batch requests, timestamps are cached since tips are often made in the same block.
+    """
+
+    logger = logging.getLogger("donut_bot")
+
+    def __init__(self, w3, contract, cursor_setting, initial_window=INITIAL_WINDOW, block_range=BLOCK_RANGE,
+                 max_block_range=MAX_BLOCK_RANGE, batch_size=BATCH_SIZE):
+        """
+        :param w3: the chain's Web3 client, its provider must support make_batch_request (see chain.client_pool)
+        :param contract: the tipping contract
+        :param cursor_setting: the name of the setting the last processed block is kept in
+        """
+        self.w3 = w3
+        self.contract = contract
+        self.event = contract.events.Tip()
+        self.cursor_setting = cursor_setting
+        self.initial_window = initial_window
+        self.block_range = block_range
+        self.max_block_range = max_block_range
+        self.batch_size = batch_size
+
+        self.timestamps = OrderedDict()
+
+    @property
+    def cursor(self):
+        value = database.get_setting(self.cursor_setting)
+        return int(value) if value else None
+
+    def save_cursor(self, block_number):
+        database.set_setting(self.cursor_setting, str(block_number))
+
+    def batch(self, requests):
+        """
+        :param requests: a list of (method, params)
+        :return: the results in the same order
+        """
+        results = []
+        for start in range(0, len(requests), self.batch_size):
+            for response in self.w3.provider.make_batch_request(requests[start:start + self.batch_size]):
+                if "error" in response:
+                    raise ValueError(f"json-rpc error: {response['error']}")
+                results.append(response.get("result"))
+
+        return results
+
+    def block_timestamps(self, block_numbers):
+        """
+        :return: the timestamp of each block, by block number
+        """
+        missing = [b for b in dict.fromkeys(block_numbers) if b not in self.timestamps]
+        blocks = self.batch([("eth_getBlockByNumber", [hex(b), False]) for b in missing])
+
+        for block_number, block in zip(missing, blocks):
+            self.timestamps[block_number] = int(block["timestamp"], 16)
+            if len(self.timestamps) > TIMESTAMP_CACHE_SIZE:
+                self.timestamps.popitem(last=False)
+
+        return {b: self.timestamps[b] for b in block_numbers}
+
+    def succeeded(self, tx_hashes):
+        """
+        :return: the transactions whose receipt has a success status, by hash
+        """
+        receipts = self.batch([("eth_getTransactionReceipt", [h]) for h in tx_hashes])
+        return {h: bool(r and int(r["status"], 16)) for h, r in zip(tx_hashes, receipts)}
+
+    def scan(self, to_block):
+        """
+        Finds the Tip events that are not in the onchain_tip table yet.
+        :param to_block: the last block to scan
+        :return: a list of (event, block timestamp) for the new, successful tips, in block order
+        """
+        cursor = self.cursor
+        if cursor is None:
+            from_block = max(to_block - self.initial_window, 0)
+        else:
+            from_block = max(cursor - REORG_BLOCKS + 1, 0)
+
+        topic = event_abi_to_log_topic(self.event.abi)
+        logs = get_logs(self.w3, {"address": self.contract.address, "topics": [topic]}, from_block, to_block,
+                        self.block_range, self.max_block_range)
+        events = [self.event.process_log(log) for log in logs]
+
+        if not events:
+            return []
+
+        known = database.get_onchain_tip_hashes([e.transactionHash.hex() for e in events])
+        events = [e for e in events if e.transactionHash.hex().lower() not in known]
+
+        if not events:
+            return []
+
+        succeeded = self.succeeded([e.transactionHash.hex() for e in events])
+        events = [e for e in events if succeeded[e.transactionHash.hex()]]
+        timestamps = self.block_timestamps([e.blockNumber for e in events])
+
+        self.logger.info(f"  scanned blocks {from_block} - {to_block}: {len(events)} new tips")
+        return [(e, timestamps[e.blockNumber]) for e in events]
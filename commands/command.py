@@ -1,31 +1,49 @@
 import abc
+import itertools
 import logging
-import re
 
 
 class Command:
     __metaclass__ = abc.ABCMeta
     command_text = ''
+    # when False, the command text must be followed by whitespace (or the end of the comment) to match
+    match_anywhere = False
     logger = logging.getLogger("donut_bot")
     config = {}
 
     def __init__(self, config, reddit):
         self.config = config
         self.reddit = reddit
+        self._dispatcher = None
 
-    def can_handle(self, comment):
+    def match_tokens(self):
+        """
+        Returns the lowercased literals that identify this command in a comment body.  The CommandDispatcher
+        combines the tokens of every command into a single matcher.
+        :return: a list of literal strings
+        """
         if isinstance(self.command_text, str):
-            p = re.compile(f'{self.command_text.lower()}($|\\s)')
-            return p.search(comment.lower())
+            return [self.command_text.lower()] if self.command_text else []
+
+        if self.match_anywhere:
+            return [cmd.lower() for cmd in self.command_text]
+
+        tokens = []
+        for cmd in self.command_text:
+            # reddit escapes square brackets in the comment body (e.g. '\[AutoModApprove\]'), so
+            # match every combination of escaped and unescaped brackets
+            parts = [[c, '\\' + c] if c in '[]' else [c] for c in cmd.lower()]
+            tokens.extend(''.join(p) for p in itertools.product(*parts))
 
-        elif isinstance(self.command_text, list):
-            for cmd in self.command_text:
-                cmd = cmd.replace('[', '\[').replace(']', '\]')
-                p = re.compile(f'{cmd.lower()}($|\\s)')
-                if p.search(comment.lower().replace('\\[', '[').replace('\\]', ']')):
-                    return True
+        return tokens
+
+    def can_handle(self, comment):
+        # command_text is assigned in the subclass constructor, so build the matcher on first use
+        if getattr(self, '_dispatcher', None) is None:
+            from commands.dispatcher import CommandDispatcher
+            self._dispatcher = CommandDispatcher([self])
 
-        return False
+        return len(self._dispatcher.dispatch(comment)) > 0
 
     @abc.abstractmethod
     def process_comment(self, comment):
@@ -7,6 +7,7 @@ from pathlib import Path
 from web3 import Web3
 from web3.gas_strategies.time_based import medium_gas_price_strategy
 
+from chain.client_pool import get_pool
 from database import database as db
 from web3.gas_strategies.rpc import rpc_gas_price_strategy
 from commands.command import Command
@@ -59,7 +60,8 @@ class FaucetCommand(Command):
         for i in range(1, 8):
             try:
                 self.logger.info(f"  connect to ankr rpc service ... attempt {i}")
-                w3 = Web3(Web3.HTTPProvider(os.getenv('ANKR_API_PROVIDER')))
+                chains = get_pool(self.config.get("chain_clients"))
+                w3 = chains.web3("gno")
                 if w3.is_connected():
                     self.logger.info("  connected to ankr")
                 else:
@@ -71,7 +73,7 @@ class FaucetCommand(Command):
                     user_address = Web3.to_checksum_address(user_address)
 
 
-                w3_arb1 = Web3(Web3.HTTPProvider(os.getenv('CHAINSTACK_ARB1_PROVIDER')))
+                w3_arb1 = chains.web3("arb1")
                 if not w3_arb1.is_connected():
                     continue
 
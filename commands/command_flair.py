@@ -1,8 +1,5 @@
-import json
-import urllib.request
-
-from datetime import datetime, timedelta
 from pathlib import Path
+from cache import cache
 from database import database
 from commands.command import Command
 
@@ -11,7 +8,6 @@ class FlairCommand(Command):
     def __init__(self, config, reddit):
         super(FlairCommand, self).__init__(config, reddit)
         self.command_text = "!flair"
-        self.special_membership = {}
 
     def leave_comment_reply(self, comment, reply):
         database.set_processed_content(comment.fullname, Path(__file__).stem)
@@ -28,12 +24,6 @@ class FlairCommand(Command):
 
         user = comment.author.name
 
-        if "last_update" not in self.special_membership or datetime.now() - timedelta(minutes=12) >= \
-                self.special_membership["last_update"]:
-            self.special_membership['last_update'] = datetime.now()
-            self.special_membership['members'] = (
-                json.load(urllib.request.urlopen(self.config["membership"]["members"])))
-
         # handle the command not starting with `!flair`
         if not comment.body.lower().startswith(self.command_text):
             self.leave_comment_reply(comment, "Improper use of command.  Command should start with `!flair` and "
@@ -41,8 +31,7 @@ class FlairCommand(Command):
             return
 
         community = comment.subreddit.display_name.lower()
-        special_member = next((m for m in self.special_membership['members'] if m['redditor'].lower() == user.lower()
-                               and (m['community'].lower() == community or m['community'] == 'all')), None)
+        special_member = cache.get_special_member(user, community)
 
         if not special_member:
             self.leave_comment_reply(comment, f"Sorry u/{user}, "
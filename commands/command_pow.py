@@ -1,12 +1,8 @@
-import json
-import urllib.request
-
-from datetime import datetime, timedelta
 from pathlib import Path
+from cache import user_registry
 from database import database
 from commands.command import Command
 
-GOVERNANCE_WEIGHT = {}
 MIN_WEIGHT_REQUIRED_TO_PARTICIPATE = 20_000
 MAX_WEIGHT_PER_VOTE = 500_000
 
@@ -29,7 +25,7 @@ class PostOfTheWeekCommand(Command):
                 'response': e[0]['reason']
             }
 
-        user = next((u for u in GOVERNANCE_WEIGHT['users'] if u['username'].lower() == name.lower()), None)
+        user = user_registry.get_registry(self.config["users_location"]).by_name(name)
         if not user or int(user['weight']) < MIN_WEIGHT_REQUIRED_TO_PARTICIPATE:
             return {
                 'is_eligible': 0,
@@ -74,12 +70,6 @@ class PostOfTheWeekCommand(Command):
                 self.leave_comment_reply(comment, f"Sorry u/{user}, this command can only be used to vote for posts!")
                 return
 
-            # update governance weight (if needed)
-            if ("last_update" not in GOVERNANCE_WEIGHT or
-                    datetime.now() - timedelta(minutes=60) >= GOVERNANCE_WEIGHT["last_update"]):
-                GOVERNANCE_WEIGHT['users'] = json.load(urllib.request.urlopen(self.config["users_location"]))
-                GOVERNANCE_WEIGHT['last_update'] = datetime.now()
-
             community = comment.subreddit.display_name.lower()
 
             eligibility_check = self.is_eligible(user, comment.parent_id, community)
@@ -1,9 +1,7 @@
-import os
 import random
 from pathlib import Path
 
-from web3 import Web3
-
+from chain.client_pool import get_pool
 from database import database
 from commands.command import Command
 import re
@@ -105,7 +103,7 @@ class RegisterCommand(Command):
             self.logger.info("  attempting to resolve ENS...")
 
             try:
-                w3 = Web3(Web3.HTTPProvider(os.getenv('INFURA_ETH_PROVIDER')))
+                w3 = get_pool(self.config.get("chain_clients")).web3("eth")
                 if w3.is_connected():
                     self.logger.info("  connected to INFURA_ETH_PROVIDER...")
 
@@ -1,25 +1,16 @@
-import json
-import sqlite3
-import urllib.request
 from pathlib import Path
+from cache import cache
 from database import database
-from datetime import datetime, timedelta
 from commands.command import Command
 
 class SpecialMembershipCommand(Command):
+    # gif tags can appear anywhere in the comment (e.g. inside a link)
+    match_anywhere = True
 
     def __init__(self, config, reddit):
         super(SpecialMembershipCommand, self).__init__(config, reddit)
         self.gif_tags = [".gif", ".gifv", "![gif]", "giphy.com", "gfycat.com"]
         self.command_text = ["!membership", *self.gif_tags]
-        self.special_membership = {}
-
-    def can_handle(self, comment):
-        for item in self.command_text:
-            if item.lower() in comment.lower():
-                return True
-
-        return False
 
     def leave_comment_reply(self, comment, reply):
         database.set_processed_content(comment.fullname, Path(__file__).stem)
@@ -39,17 +30,9 @@ class SpecialMembershipCommand(Command):
 
         # active_seasons = database.get_active_membership_seasons()
         # if active_seasons:
-        if "last_update" not in self.special_membership or datetime.now() - timedelta(minutes=12) >= \
-                self.special_membership["last_update"]:
-            self.special_membership['last_update'] = datetime.now()
-            self.special_membership['members'] = json.load(urllib.request.urlopen(
-                "https://raw.githubusercontent.com/EthTrader/memberships/main/members.json"))
 
         # check if the comment author is a special member
-        member = next((m for m in self.special_membership['members']
-                       if m['redditor']
-                       and m['redditor'].lower() == user.lower()
-                       and (m['community'].lower() == community.lower() or m['community'].lower() == 'all')), None)
+        member = cache.get_special_member(user, community)
 
         if member and "!membership" in comment.body.lower():
             self.leave_comment_reply(comment, f"u/{user}, thank you for being a special member in the "
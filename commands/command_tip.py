@@ -1,17 +1,14 @@
-import json
 import os
 import re
-import urllib.request
 
-from datetime import datetime, timedelta
+from datetime import datetime
 from pathlib import Path
+from cache import user_registry
 from database import database
 from commands.command import Command
 from commands.command_register import RegisterCommand
 from models.offchaintip import OffchainTip
-
-USERS = {}
-
+from tips.tip_service import TipService
 
 class TipCommand(Command):
     VERSION = 'v0.1.20240111-tip'
@@ -27,6 +24,8 @@ class TipCommand(Command):
         earn2tip_pattern = f"{self.command_text}\s+([uU]\/[A-Za-z0-9_-]+\s+)*([0-9]*\.*[0-9]+)\s*(\w+)*"
         self.earn2tip_regex = re.compile(earn2tip_pattern)
 
+        self.tip_service = TipService()
+
         self.tip_status_regex = re.compile(f'{self.command_text}\\s+status')
         self.tip_sub_regex = re.compile(f'{self.command_text}\\s+sub')
 
@@ -62,13 +61,77 @@ class TipCommand(Command):
             self.logger.error(f'  {e}')
             return -1
 
-    def parse_comments_for_tips(self, comment):
+    def parse_comments_for_tips(self, comment, context=None):
         """
         Parses and returns a list of tips parsed from the passed in comment.
         :param comment: the reddit comment
+        :param context: the TipContext of the comment, fetched if not given
         :return: a list of tips parsed from the comment
         """
+        context = context or self.tip_service.prefetch(comment)
+
+        with self.tip_service.timed("parse"):
+            candidates = self.parse_tip_lines(comment, context)
+
+        # one lookup for the senders and recipients of every line
+        users = self.tip_service.resolve_users([name for c in candidates if c["is_valid"]
+                                                for name in (c["sender"], c["recipient"])])
+
         tips = []
+        for candidate in candidates:
+            sender = candidate["sender"]
+            recipient = candidate["recipient"]
+            amount = candidate["amount"]
+            token = candidate["token"]
+            is_valid = candidate["is_valid"]
+            message = candidate["message"]
+
+            recipient_exists = False
+            if is_valid:
+                sender_exists = sender.lower() in users
+                recipient_user = users.get(recipient.lower())
+                if recipient_user:
+                    # use the 'official' reddit name, not what was typed in
+                    recipient = recipient_user["username"]
+                    recipient_exists = True
+
+                if not sender_exists:
+                    is_valid = False
+                    reg = RegisterCommand(self.config, self.reddit)
+                    self.logger.info("  sender not registered")
+                    message = (f"❌ Sorry u/{comment.author.name} - you are not registered.  Please use "
+                               f"the [{reg.command_text} command]({self.config['e2t_post']}) to register.")
+
+            user = user_registry.get_registry(self.config['users_location']).by_name(sender)
+            if not user or int(amount) < 1:
+                weight = 0
+            else:
+                weight = round(min(int(user['weight']) / self.config['comment2vote']['max_weight'], 1.0), 4)
+
+            if is_valid:
+                message = f"u/{sender} has tipped u/{recipient} {amount} {token} (weight: {weight})"
+                # message = f"u/{sender} has tipped u/{recipient} {amount} {token}"
+
+                if not recipient_exists:
+                    self.logger.info("  parent is not registered")
+                    message += (f"\n\n⚠️ u/{recipient} is not currently registered and will not receive "
+                                f"this tip unless they [register]({self.config['e2t_post']}) before this round ends.")
+
+            tip = OffchainTip(sender, recipient, amount, weight, token,
+                              comment.fullname, context.parent_fullname,
+                              context.submission_id, context.community, is_valid, message)
+
+            self.logger.info(f"  {tip}")
+            tips.append(tip)
+
+        return tips
+
+    def parse_tip_lines(self, comment, context):
+        """
+        Parses the tip lines of a comment and validates what can be checked without the database.
+        :return: a dict of sender, recipient, amount, token, is_valid and message for each tip line
+        """
+        candidates = []
 
         comment_lines = self.newline_regex.split(comment.body.lower())
 
@@ -88,20 +151,19 @@ class TipCommand(Command):
                 is_valid = True
                 message = ""
 
-                community = comment.subreddit.display_name.lower()
-                sender = comment.author.name
+                community = context.community
+                sender = context.sender
 
                 if recipient:
                     # recipient supplied in the format u/username
                     # so we need to strip the u/ off
                     recipient = recipient[2:].strip()
                 else:
-                    parent_author = comment.parent().author
-                    if not parent_author:
+                    if not context.parent_author:
                         self.logger.error(f"  parent_author missing! skipping tip...")
                         continue
 
-                    recipient = parent_author.name
+                    recipient = context.parent_author
 
                 if not token:
                     default_token = next(x for x in self.valid_tokens[community] if x["is_default"])
@@ -139,48 +201,10 @@ class TipCommand(Command):
                     else:
                         amount = normalized_amount
 
-                sender_exists = False
-                recipient_exists = False
-                if is_valid:
-                    result = database.get_users_by_name([sender, recipient])
-                    for r in result:
-                        if r["username"].lower() == sender.lower():
-                            sender_exists = True
-                        if r["username"].lower() == recipient.lower():
-                            # use the 'official' reddit name, not what was typed in
-                            recipient = r["username"]
-                            recipient_exists = True
-
-                    if not sender_exists:
-                        is_valid = False
-                        reg = RegisterCommand(self.config, self.reddit)
-                        self.logger.info("  sender not registered")
-                        message = (f"❌ Sorry u/{comment.author.name} - you are not registered.  Please use "
-                                   f"the [{reg.command_text} command]({self.config['e2t_post']}) to register.")
-
-                user = next((u for u in USERS['users'] if u['username'].lower() == sender.lower()), None)
-                if not user or int(amount) < 1:
-                    weight = 0
-                else:
-                    weight = round(min(int(user['weight']) / self.config['comment2vote']['max_weight'], 1.0), 4)
-
-                if is_valid:
-                    message = f"u/{sender} has tipped u/{recipient} {amount} {token} (weight: {weight})"
-                    # message = f"u/{sender} has tipped u/{recipient} {amount} {token}"
+                candidates.append({"sender": sender, "recipient": recipient, "amount": amount, "token": token,
+                                   "is_valid": is_valid, "message": message})
 
-                    if not recipient_exists:
-                        self.logger.info("  parent is not registered")
-                        message += (f"\n\n⚠️ u/{recipient} is not currently registered and will not receive "
-                                    f"this tip unless they [register]({self.config['e2t_post']}) before this round ends.")
-
-                tip = OffchainTip(sender, recipient, amount, weight, token,
-                                  comment.fullname, comment.parent().fullname,
-                                  comment.submission.id, community, is_valid, message)
-
-                self.logger.info(f"  {tip}")
-                tips.append(tip)
-
-        return tips
+        return candidates
 
     def handle_tip_status(self, comment):
         self.logger.info("  user checking status")
@@ -249,16 +273,16 @@ class TipCommand(Command):
 
         self.leave_comment_reply(comment, tip_text + token_reply)
 
-    def do_onchain_or_fallback_tip(self, comment):
+    def do_onchain_or_fallback_tip(self, comment, context):
         # just !tip (or some sort of edge case that fell through and will
         # get a default comment)
 
         # first get parent 'thing' information
-        parent_author = comment.parent().author.name
+        parent_author = context.parent_author
         parent_result = database.get_user_by_name(parent_author)
 
         self.logger.info("  on-chain tipping (or fallback)")
-        content_id = comment.parent().fullname
+        content_id = context.parent_fullname
         desktop_link = f"https://www.donut.finance/tip/?action=tip&contentId={content_id}"
 
         if content_id[:3] == "t1_":
@@ -271,16 +295,15 @@ class TipCommand(Command):
                           "System Default Browser in the Reddit Client (Settings > Open Links > Default Browser)*")
         self.leave_comment_reply(comment, comment_reply)
 
-    def leave_comment_reply(self, comment, reply, set_processed=True, use_tip_thread=False, archive_result=None):
+    def leave_comment_reply(self, comment, reply, set_processed=True, use_tip_thread=False, archive_result=None,
+                            tip_thread_id=None):
         sig = f'\n\n^(donut-bot {self.VERSION} | Learn more about [Earn2Tip]({self.config["e2t_post"]}))'
 
         if set_processed:
             database.set_processed_content(comment.fullname, Path(__file__).stem)
 
         if use_tip_thread:
-            # check if post meta contains a central comment to attach tips to
-            tip_thread_id = database.get_comment_thread_for_submission(comment.submission.fullname)
-
+            # tip_thread_id is the central comment from the post meta to attach tips to (read with the tips)
             if tip_thread_id:
                 # we have a 'pinned' message that we should tuck this comment
                 # under (instead of replying to this comment)
@@ -321,16 +344,6 @@ class TipCommand(Command):
 
         self.logger.info(f"  comment link: https://reddit.com/comments/{comment.submission.id}/_/{comment.id}")
 
-        # maintain a fresh copy of the users file which will be used later to determine tip weight
-        try:
-            if "last_update" not in USERS or datetime.now() - timedelta(
-                    hours=self.config['comment2vote']['update_interval_hours']) >= USERS["last_update"]:
-                USERS['users'] = json.load(urllib.request.urlopen(self.config['users_location']))
-                USERS['last_update'] = datetime.now()
-        except Exception as e:
-            self.logger.error(f"  failed to download updated users file | {e}")
-            pass
-
         # handle '!tip status' command
         if self.tip_status_regex.search(comment.body.lower()):
             self.handle_tip_status(comment)
@@ -341,9 +354,11 @@ class TipCommand(Command):
             self.handle_tip_sub(comment)
             return
 
-        tips = self.parse_comments_for_tips(comment)
+        context = self.tip_service.prefetch(comment)
+
+        tips = self.parse_comments_for_tips(comment, context)
         if not tips:
-            self.do_onchain_or_fallback_tip(comment)
+            self.do_onchain_or_fallback_tip(comment, context)
             return
 
         reply = ""
@@ -355,10 +370,16 @@ class TipCommand(Command):
         valid_tips = [t for t in tips if t.is_valid]
         if not valid_tips:
             self.leave_comment_reply(comment, reply)
-        elif database.process_earn2tips(valid_tips, Path(__file__).stem):
+            return
+
+        success, tip_thread_id = self.tip_service.commit(valid_tips, Path(__file__).stem, context.submission_fullname)
+        if success:
             self.logger.info("  success...")
-            archive_result = self.archive_comment(comment, max(valid_tips, key=lambda x: x.amount).amount)
-            self.leave_comment_reply(comment, reply, False, True, archive_result)
+            with self.tip_service.timed("archive"):
+                archive_result = self.archive_comment(comment, max(valid_tips, key=lambda x: x.amount).amount)
+
+            with self.tip_service.timed("reply"):
+                self.leave_comment_reply(comment, reply, False, True, archive_result, tip_thread_id)
 
             # todo: uncomment for tip2vote
             if archive_result['should_remove']:
@@ -1,8 +1,5 @@
-import json
-import urllib.request
-
-from datetime import datetime, timedelta
 from pathlib import Path
+from cache import cache
 from database import database
 from commands.command import Command
 
@@ -11,7 +8,6 @@ class TopicCommand(Command):
     def __init__(self, config, reddit):
         super(TopicCommand, self).__init__(config, reddit)
         self.command_text = "!topics"
-        self.topics = {}
 
     def leave_comment_reply(self, comment, reply):
         database.set_processed_content(comment.fullname, Path(__file__).stem)
@@ -28,13 +24,9 @@ class TopicCommand(Command):
 
         community = comment.subreddit.display_name.lower()
 
-        if "last_update" not in self.topics or datetime.now() - timedelta(minutes=5) >= \
-                self.topics["last_update"]:
-            self.topics['last_update'] = datetime.now()
-            self.topics['limits'] = (json.load(urllib.request.urlopen("https://raw.githubusercontent.com/EthTrader/"
-                                                                      "topic-limiting/main/topic_limits.json")))
+        limits = cache.get_topic_limits()
 
-        at_or_above_limit = [t for t in self.topics['limits']['data'] if t['current'] >= t['limit']
+        at_or_above_limit = [t for t in limits['data'] if t['current'] >= t['limit']
                              and t['community'] == community]
 
         if len(at_or_above_limit) > 0:
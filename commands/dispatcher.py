@@ -0,0 +1,52 @@
+import logging
+import re
+
+
+class CommandDispatcher:
+    """
+    Routes a comment to every command that can handle it.
+
+    The tokens of all commands are combined into a single regex of literals when the dispatcher is built, so each
+    comment body is lowercased once and scanned once instead of once per command.
+    """
+
+    logger = logging.getLogger("donut_bot")
+
+    def __init__(self, commands):
+        self.commands = list(commands)
+
+        # token -> [(command index, must be followed by whitespace)]
+        self.tokens = {}
+        for idx, command in enumerate(self.commands):
+            tokens = command.match_tokens()
+            if not tokens:
+                self.logger.warning(f"  {type(command).__name__} has no command text, it will never be dispatched")
+
+            for token in tokens:
+                self.tokens.setdefault(token, []).append((idx, not command.match_anywhere))
+
+        # longest tokens first so that e.g. '.gifv' is preferred over '.gif' at the same position
+        alternatives = sorted(self.tokens, key=len, reverse=True)
+        self.regex = re.compile('|'.join(map(re.escape, alternatives))) if alternatives else None
+
+    def dispatch(self, body):
+        """
+        Returns the commands that can handle the comment body.
+        :param body: the comment body
+        :return: a list of commands, in the order they were registered with the dispatcher
+        """
+        if not body or self.regex is None:
+            return []
+
+        body = body.lower()
+        matched = set()
+
+        for m in self.regex.finditer(body):
+            end = m.end()
+            at_boundary = end == len(body) or body[end].isspace()
+
+            for idx, needs_boundary in self.tokens[m.group()]:
+                if at_boundary or not needs_boundary:
+                    matched.add(idx)
+
+        return [self.commands[idx] for idx in sorted(matched)]
@@ -0,0 +1,184 @@
+import logging
+import queue
+import threading
+import time
+import zlib
+
+# default number of workers per command class, overridden by the "executor" section of config.json
+DEFAULT_WORKERS = 1
+DEFAULT_QUEUE_SIZE = 100
+
+# commands whose check-then-act writes are not safe to run side by side (e.g. two !register comments of one user, or
+# of two users claiming one address, on different submissions), they always get a single worker
+SINGLE_WORKER_COMMANDS = {"RegisterCommand"}
+
+
+class CommandLane:
+    """
+    The workers of a single command class.  Every worker owns a bounded queue, and comments are routed to a worker by
+    their submission, so comments on the same submission are processed in the order they were streamed.
+    """
+
+    logger = logging.getLogger("donut_bot")
+
+    def __init__(self, name, workers, queue_size):
+        self.name = name
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in range(max(workers, 1))]
+        self.threads = [threading.Thread(target=self._work, args=(q,), name=f"{name}-{idx}", daemon=True)
+                        for idx, q in enumerate(self.queues)]
+
+        self.lock = threading.Lock()
+        self.processed = 0
+        self.errors = 0
+        self.backpressure = 0
+        self.run_seconds = 0.0
+        self.max_run_seconds = 0.0
+        self.wait_seconds = 0.0
+
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, command, comment):
+        # crc32 rather than hash() so routing is stable across runs
+        key = getattr(comment, 'link_id', None) or comment.fullname
+        q = self.queues[zlib.crc32(key.encode()) % len(self.queues)]
+
+        item = (command, comment, time.perf_counter())
+        try:
+            q.put_nowait(item)
+        except queue.Full:
+            with self.lock:
+                self.backpressure += 1
+            self.logger.warning(f"  {self.name} queue is full, waiting...")
+            q.put(item)
+
+    def stop(self):
+        # the sentinel is queued behind any remaining work, so the workers drain their queue before exiting
+        for q in self.queues:
+            q.put(None)
+
+    def join(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self.threads:
+            thread.join(None if deadline is None else max(deadline - time.monotonic(), 0))
+
+        return not any(t.is_alive() for t in self.threads)
+
+    def _work(self, q):
+        while True:
+            item = q.get()
+            if item is None:
+                return
+
+            command, comment, queued_at = item
+            started = time.perf_counter()
+            failed = False
+
+            try:
+                command.process_comment(comment)
+            except Exception as e:
+                failed = True
+                self.logger.error(f'  Exception: {e}')
+
+            finished = time.perf_counter()
+            with self.lock:
+                self.processed += 1
+                self.errors += failed
+                self.run_seconds += finished - started
+                self.max_run_seconds = max(self.max_run_seconds, finished - started)
+                self.wait_seconds += started - queued_at
+
+    def metrics(self):
+        with self.lock:
+            processed = self.processed
+            return {
+                'workers': len(self.threads),
+                'queue_depth': sum(q.qsize() for q in self.queues),
+                'processed': processed,
+                'errors': self.errors,
+                'backpressure': self.backpressure,
+                'avg_seconds': self.run_seconds / processed if processed else 0.0,
+                'max_seconds': self.max_run_seconds,
+                'avg_wait_seconds': self.wait_seconds / processed if processed else 0.0,
+            }
+
+
+class CommandExecutor:
+    """
+    Runs commands on worker threads, so that a slow command (e.g. a faucet drip waiting on a transaction receipt)
+    does not hold up the comment stream or the other commands.
+
+    Each command class gets its own lane of workers.  When a lane's queue is full, submit() blocks, which slows the
+    stream down instead of buffering comments without limit.
+    """
+
+    logger = logging.getLogger("donut_bot")
+
+    def __init__(self, config=None):
+        """
+        :param config: the "executor" section of config.json, e.g.
+            {"queue_size": 100, "workers": {"TipCommand": 2}, "default_workers": 1}
+        """
+        config = config or {}
+        self.workers = config.get('workers', {})
+        self.default_workers = config.get('default_workers', DEFAULT_WORKERS)
+        self.queue_size = config.get('queue_size', DEFAULT_QUEUE_SIZE)
+
+        self.lanes = {}
+        self.lock = threading.Lock()
+        self.accepting = True
+
+    def submit(self, command, comment):
+        """
+        Queues the command to process the comment.  Blocks while the command's queue is full.
+        :param command: the command
+        :param comment: the reddit comment
+        """
+        if not self.accepting:
+            raise RuntimeError("executor is shutting down")
+
+        self._lane(type(command).__name__).submit(command, comment)
+
+    def _lane(self, name):
+        lane = self.lanes.get(name)
+        if lane is None:
+            with self.lock:
+                lane = self.lanes.get(name)
+                if lane is None:
+                    workers = 1 if name in SINGLE_WORKER_COMMANDS else self.workers.get(name, self.default_workers)
+                    lane = CommandLane(name, workers, self.queue_size)
+                    self.lanes[name] = lane
+
+        return lane
+
+    def shutdown(self, timeout=None):
+        """
+        Stops accepting comments and waits for the queued and in-flight commands to finish.
+        :param timeout: seconds to wait for, None to wait until everything has drained
+        :return: True if every command finished
+        """
+        self.accepting = False
+
+        lanes = list(self.lanes.values())
+        for lane in lanes:
+            lane.stop()
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        drained = True
+        for lane in lanes:
+            drained &= lane.join(None if deadline is None else max(deadline - time.monotonic(), 0))
+
+        return drained
+
+    def metrics(self):
+        """
+        :return: queue depth and latency metrics, by command class
+        """
+        return {name: lane.metrics() for name, lane in list(self.lanes.items())}
+
+    def log_metrics(self):
+        for name, m in self.metrics().items():
+            self.logger.info(f"  [{name}] workers: {m['workers']} | queue depth: {m['queue_depth']} | "
+                             f"processed: {m['processed']} | errors: {m['errors']} | "
+                             f"backpressure: {m['backpressure']} | avg: {m['avg_seconds']:.3f}s | "
+                             f"max: {m['max_seconds']:.3f}s | avg wait: {m['avg_wait_seconds']:.3f}s")
@@ -0,0 +1,84 @@
+import os
+import sqlite3
+import threading
+from decimal import Decimal
+
+DB_PATH = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "donut-bot.db"))
+
+# tuned for a small, write-light database shared by several long-running processes
+PRAGMAS = [
+    "PRAGMA journal_mode = WAL;",
+    "PRAGMA synchronous = NORMAL;",
+    "PRAGMA mmap_size = 268435456;",
+    "PRAGMA cache_size = -16000;",
+    "PRAGMA temp_store = MEMORY;",
+]
+
+# number of prepared statements sqlite3 keeps per connection
+CACHED_STATEMENTS = 256
+
+_local = threading.local()
+
+
+def adapt_decimal(d):
+    return str(d)
+
+
+def convert_decimal(s):
+    return Decimal(s)
+
+
+sqlite3.register_adapter(Decimal, adapt_decimal)
+sqlite3.register_converter("Decimal", convert_decimal)
+
+
+def dict_factory(cursor, row):
+    return dict(zip([col[0] for col in cursor.description], row))
+
+
+def get_connection():
+    """
+    Returns the long-lived connection for the calling thread, opening it on first use.  Use the connection as a
+    context manager (``with get_connection() as db:``) to commit on success and roll back on error - unlike
+    sqlite3.connect(), leaving the block does not close it.
+    :return: a sqlite3 connection
+    """
+    db = getattr(_local, 'connection', None)
+
+    # reopen if the path was changed (e.g. tests pointing at a scratch database)
+    if db is not None and _local.path != DB_PATH:
+        close_connection()
+        db = None
+
+    if db is None:
+        db = sqlite3.connect(DB_PATH, cached_statements=CACHED_STATEMENTS)
+        for pragma in PRAGMAS:
+            db.execute(pragma)
+
+        _local.connection = db
+        _local.path = DB_PATH
+
+    return db
+
+
+def dict_cursor(db):
+    """
+    Returns a cursor on the given connection whose rows are returned as dicts.
+    :param db: the connection
+    :return: a sqlite3 cursor
+    """
+    cursor = db.cursor()
+    cursor.row_factory = dict_factory
+    return cursor
+
+
+def close_connection():
+    """
+    Closes the calling thread's connection (if one is open).
+    """
+    db = getattr(_local, 'connection', None)
+    if db is not None:
+        db.close()
+
+    _local.connection = None
+    _local.path = None
@@ -1,19 +1,13 @@
-import os
+import json
 import sqlite3
 from datetime import datetime
-from decimal import Decimal
 
-
-def adapt_decimal(d):
-    return str(d)
-
-
-def convert_decimal(s):
-    return Decimal(s)
+from database import connection, processed_content
+from database.connection import dict_cursor
 
 
 def get_comment_thread_for_submission(submission_fullname):
-    with sqlite3.connect(get_db_path()) as db:
+    with connection.get_connection() as db:
         update_sql = """
            select tip_comment_id
            from post
@@ -30,7 +24,7 @@ def get_comment_thread_for_submission(submission_fullname):
 
 
 def update_funded_account(tx_hash):
-    with sqlite3.connect(get_db_path()) as db:
+    with connection.get_connection() as db:
         update_sql = """
            update funded_account set processed_at = ? where tx_hash = ?;
         """
@@ -39,35 +33,27 @@ def update_funded_account(tx_hash):
 
 
 def get_max_multisig_block():
-    with sqlite3.connect(get_db_path()) as db:
-        db.row_factory = lambda c, r: dict(zip([col[0] for col in c.description], r))
-        cursor = db.cursor()
+    with connection.get_connection() as db:
+        cursor = dict_cursor(db)
         cursor.execute("select max(block_number) block from funded_account;")
         return cursor.fetchone()['block']
 
 
 def get_funded_accounts_to_notify():
-    sqlite3.register_adapter(Decimal, adapt_decimal)
-    sqlite3.register_converter("Decimal", convert_decimal)
-
-    with sqlite3.connect(get_db_path()) as db:
+    with connection.get_connection() as db:
         notify_sql = """
                 SELECT u.username, fa.* from funded_account fa
                 inner join users u on fa.from_address = u.address
                 where processed_at is null;
             """
 
-        db.row_factory = lambda c, r: dict(zip([col[0] for col in c.description], r))
-        cursor = db.cursor()
+        cursor = dict_cursor(db)
         cursor.execute(notify_sql)
         return cursor.fetchall()
 
 
 def insert_funded_account(from_address, amount, token, block, tx_hash, timestamp):
-    sqlite3.register_adapter(Decimal, adapt_decimal)
-    sqlite3.register_converter("Decimal", convert_decimal)
-
-    with sqlite3.connect(get_db_path()) as db:
+    with connection.get_connection() as db:
         insert_sql = """
             INSERT INTO funded_account (from_user, from_address, amount, token, block_number, tx_hash, tx_timestamp, created_at)
             SELECT (select username from users where address =?), ?, ?, ?, ?, ?, ?, ?
@@ -79,20 +65,30 @@ def insert_funded_account(from_address, amount, token, block, tx_hash, timestamp
 
 
 def get_faucet_eligible(user):
-    with sqlite3.connect(get_db_path()) as db:
+    with connection.get_connection() as db:
+        # view_faucet_can_request for a single user, the view groups the whole faucet table before filtering
         faucet_sql = """
-            SELECT * 
-            FROM view_faucet_can_request
-            WHERE username=?;
+            SELECT u.username,
+                   u.address,
+                   s.created_date
+            FROM users u
+                 LEFT JOIN
+                 (
+                     SELECT max(created_date) created_date
+                     FROM faucet
+                     WHERE username = ? AND direction = 'OUTBOUND'
+                 )
+                 s
+            WHERE u.username = ?
+              AND (s.created_date IS NULL OR s.created_date <= Datetime('now', '-28 days', 'localtime'));
         """
-        db.row_factory = lambda c, r: dict(zip([col[0] for col in c.description], r))
-        cur = db.cursor()
-        cur.execute(faucet_sql, [user])
+        cur = dict_cursor(db)
+        cur.execute(faucet_sql, [user, user])
         return cur.fetchone()
 
 
 def add_faucet_history(user, address, direction, amount, tx_hash, block):
-    with sqlite3.connect(get_db_path()) as db:
+    with connection.get_connection() as db:
         insert_sql = """
             INSERT INTO faucet (username,
                        address,
@@ -104,66 +100,54 @@ def add_faucet_history(user, address, direction, amount, tx_hash, block):
             VALUES (?, ?, ?, ?, ?, ?, ?)
             RETURNING *;
         """
-        db.row_factory = lambda c, r: dict(zip([col[0] for col in c.description], r))
-        cur = db.cursor()
+        cur = dict_cursor(db)
         cur.execute(insert_sql, [user, address, direction, amount, tx_hash, block, datetime.now()])
         return cur.fetchone()
 
 
 def get_user_by_name(user):
-    with sqlite3.connect(get_db_path()) as db:
-        db.row_factory = lambda c, r: dict(zip([col[0] for col in c.description], r))
-        cur = db.cursor()
+    with connection.get_connection() as db:
+        cur = dict_cursor(db)
         cur.execute("SELECT * FROM users WHERE username=?;", [user])
         return cur.fetchone()
 
 
 def get_users_by_name(users):
-    with sqlite3.connect(get_db_path()) as db:
-        db.row_factory = lambda c, r: dict(zip([col[0] for col in c.description], r))
-        cur = db.cursor()
+    with connection.get_connection() as db:
+        cur = dict_cursor(db)
         cur.execute('SELECT * FROM users WHERE username IN (%s);' %
                     ','.join('?' * len(users)), users)
         return cur.fetchall()
 
 
 def get_user_by_address(address):
-    with sqlite3.connect(get_db_path()) as db:
-        db.row_factory = lambda c, r: dict(zip([col[0] for col in c.description], r))
-        cur = db.cursor()
+    with connection.get_connection() as db:
+        cur = dict_cursor(db)
         cur.execute("SELECT * FROM users WHERE address=?;", [address])
         return cur.fetchone()
 
 
 def has_processed_content(content_id, command):
-    with sqlite3.connect(get_db_path()) as db:
-        db.row_factory = lambda c, r: dict(zip([col[0] for col in c.description], r))
-        cur = db.cursor()
-        cur.execute('SELECT id FROM history WHERE content_id = ? and command = ?;', [content_id, command])
-        return cur.fetchone()
+    # answered from memory where possible, see processed_content.ProcessedContentLedger
+    return processed_content.LEDGER.has(content_id, command)
 
 
 def set_processed_content(content_id, command):
-    with sqlite3.connect(get_db_path()) as db:
-        db.row_factory = lambda c, r: dict(zip([col[0] for col in c.description], r))
-        cur = db.cursor()
-        cur.execute('INSERT INTO history (content_id, command) VALUES(?,?) RETURNING *;', [content_id, command])
-        return cur.fetchone()
+    # the history row is written behind, in a batch with the other records
+    return processed_content.LEDGER.record(content_id, command)
 
 
 # def remove_processed_content(content_id, command):
-#     with sqlite3.connect(get_db_path()) as db:
-#         db.row_factory = lambda c, r: dict(zip([col[0] for col in c.description], r))
-#         cur = db.cursor()
+#     with connection.get_connection() as db:
+#         cur = dict_cursor(db)
 #         cur.execute("DELETE FROM history_tips WHERE content_id = ? and command = ?;", [content_id, command])
 
 
 def insert_or_update_address(user, address, content_id):
     user_result = get_user_by_name(user)
 
-    with sqlite3.connect(get_db_path()) as db:
-        db.row_factory = lambda c, r: dict(zip([col[0] for col in c.description], r))
-        cursor = db.cursor()
+    with connection.get_connection() as db:
+        cursor = dict_cursor(db)
 
         if user_result:
             sql = """
@@ -185,13 +169,37 @@ def insert_or_update_address(user, address, content_id):
 
 
 def process_earn2tips(tips, command):
+    return process_tip_comment(tips, command)[0]
+
+
+def process_tip_comment(tips, command, submission_fullname=None):
+    """
+    Saves the tips of a comment and its history record in one transaction, and reads the submission's tip thread
+    (post.tip_comment_id) in it.
+    :return: (True, the tip thread or None) on success, (False, None) if the transaction was rolled back
+    """
     sql = """
         INSERT INTO earn2tip (from_user, to_user, amount, weight, token, content_id, 
                               parent_content_id, submission_content_id, community, created_date)
         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) ;
     """
 
-    history_sql = "INSERT INTO history (content_id, command) VALUES(?,?) RETURNING *;"
+    history_sql = "INSERT INTO history (content_id, command) VALUES(?,?);"
+    tip_thread_sql = "select tip_comment_id from post where submission_id = ?;"
+
+    round_sql = """
+        select distribution_round
+        from distribution_rounds
+        where ? between from_date and to_date;
+    """
+
+    totals_sql = """
+        insert into tip_round_totals (distribution_round, username, direction, community, token, tip_count, amount)
+        values (?, ?, ?, ?, ?, ?, ?)
+        on conflict (distribution_round, username, direction, community, token)
+        do update set tip_count = tip_count + excluded.tip_count, amount = amount + excluded.amount;
+    """
+
     content_id = tips[0].content_id
 
     created_date = datetime.now()
@@ -203,30 +211,62 @@ def process_earn2tips(tips, command):
             (tip.sender_name, tip.recipient_name, tip.amount, tip.weight, tip.token,
              tip.content_id, tip.parent_content_id, tip.submission_content_id, tip.community, created_date))
 
-    with sqlite3.connect(get_db_path()) as db:
-        db.isolation_level = None
-        cur = db.cursor()
+    db = connection.get_connection()
+    tip_thread = None
 
-        cur.execute("begin")
-        try:
+    try:
+        # the tips and the history record are committed together, or rolled back together (a comment that was
+        # already processed fails the unique history index)
+        with db:
+            cur = db.cursor()
             cur.executemany(sql, data)
             cur.execute(history_sql, [content_id, command])
-            cur.execute("commit")
-            return True
-        except sqlite3.Error as e:
-            cur.execute("rollback")
-            return False
+
+            # the round totals are kept in step with earn2tip (see migration 0008)
+            cur.execute(round_sql, [created_date])
+            result = cur.fetchone()
+            if result:
+                cur.executemany(totals_sql, group_tip_round_totals(tips, result[0]))
+
+            if submission_fullname:
+                cur.execute(tip_thread_sql, [submission_fullname])
+                result = cur.fetchone()
+                tip_thread = result[0] if result else None
+
+        processed_content.LEDGER.remember(content_id, command)
+        return True, tip_thread
+    except sqlite3.Error as e:
+        return False, None
+
+
+def group_tip_round_totals(tips, distribution_round):
+    """
+    :return: the tip_round_totals rows the tips add to, [round, username, direction, community, token, count, amount]
+    """
+    totals = {}
+    for tip in tips:
+        for username, direction in [(tip.sender_name, 'sent'), (tip.recipient_name, 'received'), ('', 'sub')]:
+            key = (username.lower(), direction, tip.community.lower(), tip.token.lower())
+            total = totals.setdefault(key, [distribution_round, username, direction, tip.community, tip.token, 0, 0])
+            total[5] += 1
+            total[6] += tip.amount
+
+    return list(totals.values())
 
 
 def get_sub_status_for_current_round(subreddit):
     sql = """
     select
-        *
+        community,
+        token,
+        distribution_round,
+        tip_count,
+        amount,
+        cast(amount as real) / tip_count 'average_tip_amount'
     from
-        main.view_sub_distribution_tips
+        tip_round_totals
     where
-        community = ?
-        and distribution_round = (
+        distribution_round = (
             select
                 distribution_round
             from
@@ -234,46 +274,46 @@ def get_sub_status_for_current_round(subreddit):
             where
                 DATETIME() between from_date
                 and to_date
-        );
+        )
+        and username = ''
+        and direction = 'sub'
+        and community = ?;
     """
-    with sqlite3.connect(get_db_path()) as db:
-        db.row_factory = lambda c, r: dict(zip([col[0] for col in c.description], r))
-        cur = db.cursor()
+    with connection.get_connection() as db:
+        cur = dict_cursor(db)
         cur.execute(sql, [subreddit])
         return cur.fetchall()
 
 
 def get_tips_sent_for_current_round_by_user(user):
     sql = """
-    SELECT from_user, token, count(tip.id) 'count', sum(amount) 'amount' 
-    FROM earn2tip tip 	
-      inner join distribution_rounds dr 
-    WHERE tip.created_date BETWEEN dr.from_date and dr.to_date 
-      and from_user = ? 
-      and DATETIME() between dr.from_date and dr.to_date
-    GROUP BY from_user, token;
-    """
-    with sqlite3.connect(get_db_path()) as db:
-        db.row_factory = lambda c, r: dict(zip([col[0] for col in c.description], r))
-        cur = db.cursor()
+    SELECT username 'from_user', token, sum(tip_count) 'count', sum(amount) 'amount' 
+    FROM tip_round_totals 
+    WHERE distribution_round = (select distribution_round from distribution_rounds 
+                                where DATETIME() between from_date and to_date)
+      and username = ? 
+      and direction = 'sent'
+    GROUP BY username, token;
+    """
+    with connection.get_connection() as db:
+        cur = dict_cursor(db)
         cur.execute(sql, [user])
         return cur.fetchall()
 
 
 def get_tips_received_for_current_round_by_user(user):
     sql = """
-    SELECT to_user, token, count(tip.id) 'count', sum(amount) 'amount' 
-    FROM earn2tip tip 	
-      inner join distribution_rounds dr 
-    WHERE tip.created_date BETWEEN dr.from_date and dr.to_date 
-        and to_user = ? 
-        and DATETIME() between dr.from_date and dr.to_date
-    GROUP BY to_user, token;
+    SELECT username 'to_user', token, sum(tip_count) 'count', sum(amount) 'amount' 
+    FROM tip_round_totals 
+    WHERE distribution_round = (select distribution_round from distribution_rounds 
+                                where DATETIME() between from_date and to_date)
+        and username = ? 
+        and direction = 'received'
+    GROUP BY username, token;
     """
 
-    with sqlite3.connect(get_db_path()) as db:
-        db.row_factory = lambda c, r: dict(zip([col[0] for col in c.description], r))
-        cur = db.cursor()
+    with connection.get_connection() as db:
+        cur = dict_cursor(db)
         cur.execute(sql, [user])
         return cur.fetchall()
 
@@ -290,17 +330,14 @@ def get_funded_for_current_round_by_user(user):
     GROUP BY u.username, token;
     """
 
-    with sqlite3.connect(get_db_path()) as db:
-        db.row_factory = lambda c, r: dict(zip([col[0] for col in c.description], r))
-        cur = db.cursor()
+    with connection.get_connection() as db:
+        cur = dict_cursor(db)
         cur.execute(sql, [user])
         return cur.fetchall()
 
 
 def get_db_path():
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    db_path = os.path.join(base_dir, "donut-bot.db")
-    return os.path.normpath(db_path)
+    return connection.DB_PATH
 
 
 def get_post_status(user):
@@ -314,9 +351,8 @@ def get_post_status(user):
     where row_number = 3;
         """
 
-    with sqlite3.connect(get_db_path()) as db:
-        db.row_factory = lambda c, r: dict(zip([col[0] for col in c.description], r))
-        cur = db.cursor()
+    with connection.get_connection() as db:
+        cur = dict_cursor(db)
         cur.execute(sql, [user])
         return cur.fetchall()
 
@@ -333,9 +369,8 @@ def get_post_cooldown(user, minutes):
         limit 1;
     """
 
-    with sqlite3.connect(get_db_path()) as db:
-        db.row_factory = lambda c, r: dict(zip([col[0] for col in c.description], r))
-        cur = db.cursor()
+    with connection.get_connection() as db:
+        cur = dict_cursor(db)
         cur.execute(sql, [user])
         return cur.fetchone()
 
@@ -349,9 +384,8 @@ def get_post_count_in_last_24h(user):
          and created_date >= datetime('now', '-24 hour')
             """
 
-    with sqlite3.connect(get_db_path()) as db:
-        db.row_factory = lambda c, r: dict(zip([col[0] for col in c.description], r))
-        cur = db.cursor()
+    with connection.get_connection() as db:
+        cur = dict_cursor(db)
         cur.execute(sql, [user])
         return cur.fetchone()
 
@@ -378,9 +412,8 @@ def get_potd_eligible(user, post_id, community):
 
         """
 
-    with sqlite3.connect(get_db_path()) as db:
-        db.row_factory = lambda c, r: dict(zip([col[0] for col in c.description], r))
-        cur = db.cursor()
+    with connection.get_connection() as db:
+        cur = dict_cursor(db)
         cur.execute(sql, [user, community, user, post_id])
         return cur.fetchall()
 
@@ -391,7 +424,7 @@ def insert_potd_vote(post_id, redditor, weight, community):
         values (?, ?, ?, ?, ?)
     """
 
-    with sqlite3.connect(get_db_path()) as db:
+    with connection.get_connection() as db:
         cursor = db.cursor()
         cursor.execute(sql, [post_id, redditor, weight, datetime.now(), community])
 
@@ -404,7 +437,7 @@ def set_daily_pin(submission_id, comment_id):
             returning *
         """
 
-    with sqlite3.connect(get_db_path()) as db:
+    with connection.get_connection() as db:
         cursor = db.cursor()
         cursor.execute(sql, [comment_id, submission_id])
         return cursor.fetchone()
@@ -417,7 +450,7 @@ def get_distribution_round():
      where DATETIME() between from_date and to_date
     """
 
-    with sqlite3.connect(get_db_path()) as db:
+    with connection.get_connection() as db:
         cursor = db.cursor()
         cursor.execute(sql)
         return cursor.fetchone()
@@ -430,9 +463,8 @@ def get_active_membership_seasons():
                      or datetime() >= start_date and end_date is null;
                 """
 
-    with sqlite3.connect(get_db_path()) as db:
-        db.row_factory = lambda c, r: dict(zip([col[0] for col in c.description], r))
-        cursor = db.cursor()
+    with connection.get_connection() as db:
+        cursor = dict_cursor(db)
 
         cursor.execute(query).execute(query)
         return cursor.fetchall()
@@ -446,7 +478,7 @@ def set_custom_flair(user, custom_flair):
         returning *
     """
 
-    with sqlite3.connect(get_db_path()) as db:
+    with connection.get_connection() as db:
         cursor = db.cursor()
         cursor.execute(sql, [custom_flair, user])
         return cursor.fetchone()
@@ -460,7 +492,285 @@ def reset_custom_flair(user):
         returning *
     """
 
-    with sqlite3.connect(get_db_path()) as db:
+    with connection.get_connection() as db:
         cursor = db.cursor()
         cursor.execute(sql, [user])
         return cursor.fetchone()
+
+
+def get_setting(setting):
+    sql = """
+        select value
+        from settings
+        where setting = ?
+        order by id desc
+        limit 1;
+    """
+
+    with connection.get_connection() as db:
+        cursor = db.cursor()
+        cursor.execute(sql, [setting])
+        result = cursor.fetchone()
+        return result[0] if result else None
+
+
+def set_setting(setting, value):
+    update_sql = """
+        update settings
+        set value = ?, updated_at = ?
+        where setting = ?;
+    """
+
+    insert_sql = """
+        insert into settings (setting, value, updated_at, created_at)
+        values (?, ?, ?, ?);
+    """
+
+    with connection.get_connection() as db:
+        cursor = db.cursor()
+        cursor.execute(update_sql, [value, datetime.now(), setting])
+        if cursor.rowcount == 0:
+            cursor.execute(insert_sql, [setting, value, datetime.now(), datetime.now()])
+
+
+def get_balance_snapshot(chain):
+    sql = """
+        select token, address, balance, block_number
+        from balance_snapshot
+        where chain = ?;
+    """
+
+    with connection.get_connection() as db:
+        cursor = db.cursor()
+        cursor.execute(sql, [chain])
+
+        snapshot = {}
+        for token, address, balance, block_number in cursor.fetchall():
+            snapshot.setdefault(token, {})[address] = (int(balance), block_number)
+
+        return snapshot
+
+
+def save_balance_snapshot(chain, token, balances, block_number):
+    sql = """
+        insert or replace into balance_snapshot (chain, token, address, balance, block_number)
+        values (?, ?, ?, ?, ?);
+    """
+
+    with connection.get_connection() as db:
+        cursor = db.cursor()
+        cursor.executemany(sql, [[chain, token, address.lower(), str(balance), block_number]
+                                 for address, balance in balances.items()])
+
+
+def touch_balance_snapshot(chain, token, addresses, block_number):
+    sql = """
+        update balance_snapshot
+        set block_number = ?
+        where chain = ? and token = ? and address = ?;
+    """
+
+    with connection.get_connection() as db:
+        cursor = db.cursor()
+        cursor.executemany(sql, [[block_number, chain, token, address.lower()] for address in addresses])
+
+
+def get_onchain_tip_hashes(tx_hashes):
+    sql = f"""
+        select tx_hash
+        from onchain_tip
+        where tx_hash in ({','.join('?' * len(tx_hashes))});
+    """
+
+    if not tx_hashes:
+        return set()
+
+    with connection.get_connection() as db:
+        cursor = db.cursor()
+        cursor.execute(sql, list(tx_hashes))
+        return {row[0].lower() for row in cursor.fetchall()}
+
+
+def insert_onchain_tips(tips):
+    sql = """
+        insert or ignore into onchain_tip (from_address, to_address, tx_hash, chain_id, block, amount, token, 
+        content_id, timestamp, weight) 
+        values (?,?,?,?,?,?,?,?,?,?);
+    """
+
+    with connection.get_connection() as db:
+        cursor = db.cursor()
+        cursor.executemany(sql, tips)
+        return cursor.rowcount
+
+
+def get_registered_addresses():
+    sql = """
+        select username, address
+        from users
+        where address is not null
+        order by address;
+    """
+
+    with connection.get_connection() as db:
+        cursor = db.cursor()
+        cursor.execute(sql)
+        return {address.lower(): username for username, address in cursor.fetchall()}
+
+
+def get_liquidity_position_ids():
+    sql = """
+        select nft_id
+        from liquidity_positions
+        order by nft_id;
+    """
+
+    with connection.get_connection() as db:
+        cursor = db.cursor()
+        cursor.execute(sql)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def save_liquidity_positions(nft_ids, max_idx):
+    insert_sql = """
+        insert into liquidity_positions(nft_id)
+        select (select ?)
+        where not exists (select 1 from liquidity_positions where nft_id = ?);
+    """
+
+    update_sql = """
+        update settings
+        set value = ?, updated_at = ?
+        where setting = 'liquidity_max_idx';
+    """
+
+    setting_sql = """
+        insert into settings (setting, value, updated_at, created_at)
+        values ('liquidity_max_idx', ?, ?, ?);
+    """
+
+    # the new positions and the index they were scanned up to are committed together
+    with connection.get_connection() as db:
+        cursor = db.cursor()
+        cursor.executemany(insert_sql, [[nft_id, nft_id] for nft_id in nft_ids])
+        cursor.execute(update_sql, [max_idx, datetime.now()])
+        if cursor.rowcount == 0:
+            cursor.execute(setting_sql, [max_idx, datetime.now(), datetime.now()])
+
+
+def get_topic_occupancy(since):
+    sql = """
+        select community, display_name, topic_limit, current, submissions, updated_at
+        from topic_occupancy
+        order by community, display_name;
+    """
+
+    with connection.get_connection() as db:
+        cursor = db.cursor()
+        cursor.execute(sql)
+        rows = [dict(zip(['community', 'display_name', 'limit', 'current', 'submissions', 'updated_at'], row))
+                for row in cursor.fetchall()]
+
+    # every row is written by the same poll, a stale row means the tracker stopped
+    if not rows or min(r['updated_at'] for r in rows) < since:
+        return None
+
+    for row in rows:
+        row['submissions'] = json.loads(row['submissions'])
+
+    return rows
+
+
+def save_topic_occupancy(topics, updated_at):
+    delete_sql = """
+        delete from topic_occupancy;
+    """
+
+    insert_sql = """
+        insert into topic_occupancy (community, display_name, topic_limit, current, submissions, updated_at)
+        values (?, ?, ?, ?, ?, ?);
+    """
+
+    # replaced as a whole, so a topic dropped from topic_meta.json does not linger
+    with connection.get_connection() as db:
+        cursor = db.cursor()
+        cursor.execute(delete_sql)
+        cursor.executemany(insert_sql, [[t['community'], t['display_name'], t['limit'], t['current'],
+                                         json.dumps(t['submissions']), updated_at] for t in topics])
+
+
+def get_processed_submission_ids():
+    post_sql = """
+        select submission_id
+        from post
+        order by submission_id;
+    """
+
+    rejected_sql = """
+        select submission_id
+        from rejected_post
+        order by submission_id;
+    """
+
+    with connection.get_connection() as db:
+        cursor = db.cursor()
+        cursor.execute(post_sql)
+        ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute(rejected_sql)
+        ids.extend(row[0] for row in cursor.fetchall())
+        return ids
+
+
+def get_rejected_post(submission_id):
+    sql = """
+        select *
+        from rejected_post
+        where submission_id = ?;
+    """
+
+    with connection.get_connection() as db:
+        cursor = dict_cursor(db)
+        cursor.execute(sql, [submission_id])
+        return cursor.fetchone()
+
+
+def insert_rejected_post(submission_id, author, reason, community):
+    sql = """
+        insert or ignore into rejected_post (submission_id, author, reason, community, created_date)
+        values (?, ?, ?, ?, ?);
+    """
+
+    with connection.get_connection() as db:
+        cursor = db.cursor()
+        cursor.execute(sql, [submission_id, author, reason, community, datetime.now()])
+
+
+def get_flair_states(users):
+    sql = f"""
+        select username, address, hash, custom_flair, eligible
+        from view_flair_can_update
+        where username in ({','.join('?' * len(users))});
+    """
+
+    if not users:
+        return []
+
+    with connection.get_connection() as db:
+        cursor = dict_cursor(db)
+        cursor.execute(sql, list(users))
+        return cursor.fetchall()
+
+
+def save_flairs(flairs):
+    sql = """
+        insert or replace into flair (user_id, hash, last_update, custom_flair)
+        select id, ?, ?, ?
+        from users
+        where username = ?;
+    """
+
+    # users that are not registered have no flair row and are skipped
+    with connection.get_connection() as db:
+        cursor = db.cursor()
+        cursor.executemany(sql, [[flair_hash, last_update, custom_flair, user]
+                                 for user, flair_hash, last_update, custom_flair in flairs])
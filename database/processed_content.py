@@ -0,0 +1,240 @@
+import atexit
+import logging
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from cache.bloom_filter import BloomFilter
+from database import connection
+
+# (content_id, command) pairs kept in memory, most recently used first
+LRU_SIZE = 50_000
+
+# the bloom filter is sized for twice the history at load (and at least this many)
+MIN_CAPACITY = 1_000_000
+ERROR_RATE = 0.001
+
+# records written per transaction, and the longest a record waits before it is written
+FLUSH_SIZE = 100
+FLUSH_INTERVAL = 2
+
+
+class ProcessedContentLedger:
+    """
+    The (content_id, command) pairs in the history table, with an LRU of the recent ones and a bloom filter of all
+    of them in front of sqlite.  A pair that is not in the filter was never recorded, so the common case (a comment
+    nobody processed yet) is answered without a query.
+
+    Records are written behind: they are buffered and inserted in batches of FLUSH_SIZE, or after FLUSH_INTERVAL
+    seconds, and the buffer is flushed (and the WAL checkpointed) when the process exits.  Buffered records count as
+    processed right away.
+
+    The filter only knows what is in history when it is loaded and what this process records after that, the
+    commands must therefore be run by a single process (main.py or async_main.py).
+    """
+
+    logger = logging.getLogger("donut_bot")
+
+    def __init__(self, lru_size=LRU_SIZE, flush_size=FLUSH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.lru_size = lru_size
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._reset()
+
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.counters = {
+            'lru_hits': 0,
+            'negative': 0,
+            'queries': 0,
+            'recorded': 0,
+            'flushes': 0,
+            'flushed': 0,
+        }
+
+    def _reset(self):
+        self.lru = OrderedDict()
+        self.pending = OrderedDict()
+        self.bloom = None
+        self.path = connection.DB_PATH
+
+    @staticmethod
+    def _bloom_key(content_id, command):
+        return f"{command}\x00{content_id}"
+
+    def _check_path(self):
+        # the database was switched (e.g. tests pointing at a scratch database), nothing known applies to it
+        if self.path != connection.DB_PATH:
+            self._reset()
+
+    def load(self):
+        sql = """
+            select content_id, command
+            from history
+            order by content_id, command;
+        """
+
+        with connection.get_connection() as db:
+            cursor = db.cursor()
+            cursor.execute(sql)
+            rows = cursor.fetchall()
+
+        bloom = BloomFilter(max(2 * len(rows), MIN_CAPACITY), ERROR_RATE)
+        for content_id, command in rows:
+            bloom.add(self._bloom_key(content_id, command))
+
+        with self._lock:
+            self.bloom = bloom
+            for content_id, command in self.pending:
+                bloom.add(self._bloom_key(content_id, command))
+
+    def has(self, content_id, command):
+        """
+        :return: a dict of the content_id and command if the content was processed by the command, otherwise None
+        """
+        key = (content_id, command)
+
+        with self._lock:
+            self._check_path()
+
+            if key in self.lru:
+                self.lru.move_to_end(key)
+                self.counters['lru_hits'] += 1
+                return self.lru[key]
+
+            if key in self.pending:
+                return {'content_id': content_id, 'command': command}
+
+            if self.bloom is None:
+                self.load()
+
+            if self._bloom_key(content_id, command) not in self.bloom:
+                self.counters['negative'] += 1
+                return None
+
+        self.counters['queries'] += 1
+        with connection.get_connection() as db:
+            cursor = connection.dict_cursor(db)
+            cursor.execute("select id from history where content_id = ? and command = ?;", [content_id, command])
+            row = cursor.fetchone()
+
+        if row is not None:
+            self.remember(content_id, command)
+
+        return row
+
+    def remember(self, content_id, command):
+        """
+        Notes a pair that is already in the history table (e.g. written together with the tips of a comment).
+        """
+        key = (content_id, command)
+
+        with self._lock:
+            self._check_path()
+
+            self.lru[key] = {'content_id': content_id, 'command': command}
+            self.lru.move_to_end(key)
+            if len(self.lru) > self.lru_size:
+                self.lru.popitem(last=False)
+
+            if self.bloom is not None:
+                self.bloom.add(self._bloom_key(content_id, command))
+
+        return self.lru[key]
+
+    def record(self, content_id, command):
+        """
+        Records that the content was processed by the command, the history row is written with the next flush.
+        """
+        key = (content_id, command)
+
+        with self._lock:
+            record = self.remember(content_id, command)
+            self.pending[key] = (content_id, command, datetime.now())
+            self.counters['recorded'] += 1
+            full = len(self.pending) >= self.flush_size
+
+        self._start()
+        if full:
+            self.flush()
+
+        return record
+
+    def flush(self, checkpoint=False):
+        """
+        Writes the buffered records in one transaction.
+        :param checkpoint: also checkpoint the WAL into the database file, so the records are on disk (shutdown)
+        :return: the number of records written
+        """
+        sql = """
+            insert or ignore into history (content_id, command, created_at)
+            values (?, ?, ?);
+        """
+
+        with self._flush_lock:
+            with self._lock:
+                self._check_path()
+                records = list(self.pending.values())
+
+            if records:
+                with connection.get_connection() as db:
+                    db.cursor().executemany(sql, records)
+
+                with self._lock:
+                    for content_id, command, _ in records:
+                        self.pending.pop((content_id, command), None)
+
+                self.counters['flushes'] += 1
+                self.counters['flushed'] += len(records)
+
+            if checkpoint:
+                connection.get_connection().execute("PRAGMA wal_checkpoint(FULL);")
+
+            return len(records)
+
+    def _start(self):
+        if self._thread and self._thread.is_alive():
+            return
+
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+
+            self._thread = threading.Thread(target=self._flush_loop, name="history-writer", daemon=True)
+            self._thread.start()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                # the records stay buffered, the next flush tries again
+                self.logger.error(f"  failed to write the processed content history | {e}")
+
+    def close(self):
+        """
+        Flushes the buffered records and checkpoints the WAL, called when the process exits.
+        """
+        self._stop.set()
+        if not self.counters['recorded'] or not os.path.exists(connection.DB_PATH):
+            return
+
+        try:
+            self.flush(checkpoint=True)
+        except Exception as e:
+            self.logger.error(f"  failed to write the processed content history on exit | {e}")
+
+    def stats(self):
+        stats = dict(self.counters)
+        stats['pending'] = len(self.pending)
+        stats['lru'] = len(self.lru)
+        return stats
+
+
+LEDGER = ProcessedContentLedger()
+atexit.register(LEDGER.close)
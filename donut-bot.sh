@@ -12,23 +12,41 @@
 #  exit 4
 #fi
 
-echo "start donut-bot..."
-nohup python3.11 main.py > nohup.log 2>&1 &
-echo $! > pid.txt
+# ./donut-bot.sh bus runs the commands, post-bot and flair-bot in a single process (main.py --bus) that polls
+# reddit once for all three, ./donut-bot.sh async does the same on asyncio (async_main.py)
+if [ "$1" == "bus" ] || [ "$1" == "async" ]; then
+  echo "start donut-bot ($1)..."
+  if [ "$1" == "bus" ]; then
+    nohup python3.11 main.py --bus > nohup.log 2>&1 &
+  else
+    nohup python3.11 async_main.py > nohup.log 2>&1 &
+  fi
+  echo $! > pid.txt
 
-echo "donut-bot is now running..."
+  # no separate bots are running in this mode
+  rm -f bots/flair.pid bots/post.pid
+  echo "donut-bot is now running..."
+else
+  echo "start donut-bot..."
+  nohup python3.11 main.py > nohup.log 2>&1 &
+  echo $! > pid.txt
 
-cd bots
+  echo "donut-bot is now running..."
 
-echo "start flair-bot..."
-nohup python3.11 flair-bot.py > flair.nohup 2>&1 &
-echo $! > flair.pid
-echo "flair-bot is now running..."
+  cd bots
 
-echo "start post-bot..."
-nohup python3.11 post-bot.py > post.nohup 2>&1 &
-echo $! > post.pid
-echo "post-bot is now running..."
+  echo "start flair-bot..."
+  nohup python3.11 flair-bot.py > flair.nohup 2>&1 &
+  echo $! > flair.pid
+  echo "flair-bot is now running..."
+
+  echo "start post-bot..."
+  nohup python3.11 post-bot.py > post.nohup 2>&1 &
+  echo $! > post.pid
+  echo "post-bot is now running..."
+
+  cd ..
+fi
 
 # have to sleep 1 otherwise it sometimes will not pick up the newly started python processes
 sleep 1
@@ -0,0 +1,288 @@
+import json
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+from database import database
+
+COMMENT = "comment"
+SUBMISSION = "submission"
+
+# seconds between polls of the listings when nothing new was found
+POLL_INTERVAL = 5
+
+# number of fullnames remembered for de-duplication
+DEDUPE_SIZE = 10_000
+
+
+class HighWaterMark:
+    """
+    The newest item handled on a listing, persisted in the settings table so a restart does not replay items that
+    were already handled.  Items created in the same second are told apart by their fullname.
+
+    The mark only moves past an item once every subscriber it was handed to has finished it, items are tracked in
+    the order they were published and the mark stops at the first one still queued or running.  An item that was
+    queued but not handled when the process died (a crash, an OOM kill, SIGKILL) is therefore published again after
+    the restart, the commands de-duplicate it through the history table.
+
+    Only the mark restored at startup is used for filtering.  Within a run, items that show up in the listing late
+    (e.g. approved out of the spam filter) are older than the current mark but have not been published yet, those
+    are caught by the fullname de-duplication instead.
+    """
+
+    def __init__(self, setting):
+        self.setting = setting
+        self.created_utc = 0.0
+        self.fullnames = set()
+        self.dirty = False
+
+        # fullname -> [item, subscribers that have not finished it], in the order the items were published
+        self.in_flight = OrderedDict()
+        self._lock = threading.Lock()
+
+        value = database.get_setting(setting)
+        if value:
+            saved = json.loads(value)
+            self.created_utc = saved['created_utc']
+            self.fullnames = set(saved['fullnames'])
+
+        self.restored_created_utc = self.created_utc
+        self.restored_fullnames = set(self.fullnames)
+
+    @property
+    def exists(self):
+        return self.restored_created_utc > 0
+
+    def published_before_restart(self, item):
+        return item.created_utc < self.restored_created_utc or \
+            (item.created_utc == self.restored_created_utc and item.fullname in self.restored_fullnames)
+
+    def started(self, item, subscribers):
+        """
+        Tracks an item handed to a number of subscribers (0 if none of them receives it).
+        """
+        with self._lock:
+            self.in_flight[item.fullname] = [item, subscribers]
+            self._advance_finished()
+
+    def finished(self, item):
+        """
+        Called by a subscriber once it has handled the item (successfully or not).
+        """
+        with self._lock:
+            entry = self.in_flight.get(item.fullname)
+            if entry:
+                entry[1] -= 1
+            self._advance_finished()
+
+    def _advance_finished(self):
+        while self.in_flight:
+            item, unfinished = next(iter(self.in_flight.values()))
+            if unfinished > 0:
+                return
+
+            self.in_flight.popitem(last=False)
+            self._advance(item)
+
+    def _advance(self, item):
+        if item.created_utc > self.created_utc:
+            self.created_utc = item.created_utc
+            self.fullnames = {item.fullname}
+        elif item.created_utc == self.created_utc:
+            self.fullnames.add(item.fullname)
+        else:
+            return
+
+        self.dirty = True
+
+    def save(self):
+        with self._lock:
+            if not self.dirty:
+                return
+
+            value = json.dumps({'created_utc': self.created_utc, 'fullnames': sorted(self.fullnames)})
+            self.dirty = False
+
+        database.set_setting(self.setting, value)
+
+
+class Subscriber:
+    """
+    A handler fed from its own queue on its own thread, so a slow subscriber (e.g. the flair bot waiting on RPC
+    calls) does not hold up the others.
+    """
+
+    logger = logging.getLogger("donut_bot")
+
+    def __init__(self, name, handler, kinds, skip_backlog, queue_size):
+        self.name = name
+        self.handler = handler
+        self.kinds = set(kinds)
+        self.skip_backlog = skip_backlog
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.processed = 0
+        self.errors = 0
+        self.thread = threading.Thread(target=self._work, name=f"subscriber-{name}", daemon=True)
+        self.thread.start()
+
+    def _work(self):
+        while True:
+            entry = self.queue.get()
+            if entry is None:
+                return
+
+            # the watermark of the item's listing is told when the item is done
+            item, watermark = entry
+            try:
+                self.handler(item)
+            except Exception as e:
+                self.errors += 1
+                self.logger.error(f'  [{self.name}] Exception: {e}')
+            finally:
+                watermark.finished(item)
+
+            self.processed += 1
+
+
+class EventBus:
+    """
+    Polls the comment and submission listings of the subreddits once and fans every new item out to the
+    subscribers (the commands, post moderation and flair updates), instead of each of them polling reddit.
+
+    Items are de-duplicated by fullname and only items newer than the persisted high water mark are published.
+    When the bus runs for the first time (no high water mark yet) the first batch of each listing is the backlog
+    of existing items, subscribers can opt out of it with skip_backlog.
+    """
+
+    logger = logging.getLogger("donut_bot")
+
+    def __init__(self, reddit, subs, poll_interval=POLL_INTERVAL, dedupe_size=DEDUPE_SIZE):
+        self.reddit = reddit
+        self.subs = subs
+        self.poll_interval = poll_interval
+        self.dedupe_size = dedupe_size
+
+        self.subscribers = []
+        self.seen = OrderedDict()
+        self.streams = {}
+        # the kinds whose first batch has been consumed, later batches are never the backlog
+        self.caught_up = set()
+        self.watermarks = {kind: HighWaterMark(f"event_bus_{kind}_hwm") for kind in (COMMENT, SUBMISSION)}
+
+        self.polls = 0
+        self.published = 0
+        self.duplicates = 0
+
+    def subscribe(self, name, handler, kinds=(COMMENT, SUBMISSION), skip_backlog=False, queue_size=1000):
+        """
+        Registers a handler.  It is called on the subscriber's own thread, in the order the items were created.
+        :param name: name of the subscriber, used for logging and metrics
+        :param handler: function called with each praw comment / submission
+        :param kinds: the kinds of items to receive (COMMENT and / or SUBMISSION)
+        :param skip_backlog: True to not receive the existing items the first time the bus runs
+        :param queue_size: how far the subscriber can fall behind before the bus waits for it
+        :return: the subscriber
+        """
+        subscriber = Subscriber(name, handler, kinds, skip_backlog, queue_size)
+        self.subscribers.append(subscriber)
+        return subscriber
+
+    def publish(self, kind, item, backlog=False):
+        """
+        Hands an item to the subscribers of its kind, unless it was published before.
+        :return: True if the item was published
+        """
+        watermark = self.watermarks[kind]
+        if item.fullname in self.seen or watermark.published_before_restart(item):
+            self.duplicates += 1
+            return False
+
+        self.seen[item.fullname] = True
+        if len(self.seen) > self.dedupe_size:
+            self.seen.popitem(last=False)
+
+        self.published += 1
+
+        subscribers = [s for s in self.subscribers if kind in s.kinds and not (backlog and s.skip_backlog)]
+
+        # tracked before it is queued, so a fast subscriber cannot finish it first
+        watermark.started(item, len(subscribers))
+        for subscriber in subscribers:
+            subscriber.queue.put((item, watermark))
+
+        return True
+
+    def _stream(self, kind):
+        stream = self.streams.get(kind)
+        if stream is None:
+            subreddit = self.reddit.subreddit(self.subs)
+            listing = subreddit.stream.comments if kind == COMMENT else subreddit.stream.submissions
+            # pause_after=-1 makes the stream yield None after each request instead of sleeping between requests,
+            # so a poll ends after one request.  That request returns at most 100 new items, a poll that is further
+            # behind than that misses the rest.
+            stream = self.streams[kind] = listing(pause_after=-1)
+
+        return stream
+
+    def poll_once(self):
+        """
+        Publishes the new items of both listings.
+        :return: the number of items published
+        """
+        published = 0
+
+        for kind, watermark in self.watermarks.items():
+            # without a high water mark, the first batch is the backlog of existing items
+            backlog = not watermark.exists and kind not in self.caught_up
+
+            try:
+                for item in self._stream(kind):
+                    if item is None:
+                        self.caught_up.add(kind)
+                        break
+
+                    published += self.publish(kind, item, backlog)
+            except Exception:
+                # the stream is recreated on the next poll, replayed items are filtered out by publish()
+                self.streams.pop(kind, None)
+                raise
+            finally:
+                watermark.save()
+
+        self.polls += 1
+        return published
+
+    def shutdown(self, timeout=None):
+        """
+        Waits for the subscribers to process the items they have been handed, then saves the high water marks.
+        :param timeout: seconds to wait for, None to wait until everything has drained
+        """
+        for subscriber in self.subscribers:
+            subscriber.queue.put(None)
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for subscriber in self.subscribers:
+            subscriber.thread.join(None if deadline is None else max(deadline - time.monotonic(), 0))
+
+        # the marks moved while the queues drained, items that were not finished in time are replayed
+        for watermark in self.watermarks.values():
+            watermark.save()
+
+    def metrics(self):
+        return {
+            'polls': self.polls,
+            'published': self.published,
+            'duplicates': self.duplicates,
+            'subscribers': {s.name: {'queue_depth': s.queue.qsize(), 'processed': s.processed, 'errors': s.errors}
+                            for s in self.subscribers},
+        }
+
+    def log_metrics(self):
+        m = self.metrics()
+        self.logger.info(f"  [event bus] polls: {m['polls']} | published: {m['published']} | "
+                         f"duplicates: {m['duplicates']}")
+        for name, s in m['subscribers'].items():
+            self.logger.info(f"  [{name}] queue depth: {s['queue_depth']} | processed: {s['processed']} | "
+                             f"errors: {s['errors']}")
@@ -0,0 +1,322 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from eth_utils.abi import event_abi_to_log_topic
+
+from chain.logs import get_logs, topic_to_address, DEFAULT_BLOCK_RANGE
+from database import database
+
+# seconds between runs of the scheduler
+SCHEDULE_INTERVAL = 60
+
+# a flair is recomputed after this many seconds even without a known change (e.g. an ENS address, whose transfers
+# cannot be matched to the user)
+MAX_AGE = 12 * 60 * 60
+
+# the users whose flair is kept up to date, least recently active users are forgotten first
+TRACKED_USERS = 10_000
+
+# usernames per database lookup
+LOOKUP_CHUNK = 500
+
+UNREGISTERED = "Not Registered"
+
+
+def flair_hash(flair_text):
+    # md5 instead of the built-in hash, so the hashes are the same between restarts
+    return hashlib.md5(flair_text.encode('utf-8')).hexdigest()
+
+
+class TransferWatcher:
+    """
+    Follows the Transfer events of the tokens shown in the flair on one chain.  The last block scanned is kept in
+    the settings table.
+    """
+
+    logger = logging.getLogger("flair_bot")
+
+    def __init__(self, chain, w3, contracts, block_range=DEFAULT_BLOCK_RANGE):
+        """
+        :param chain: the chain name, e.g. "arb1"
+        :param w3: the chain's Web3 client
+        :param contracts: the token contracts, their abi must have the Transfer event
+        """
+        self.chain = chain
+        self.w3 = w3
+        self.contracts = contracts
+        self.block_range = block_range
+        self.cursor_setting = f"flair_transfers_{chain}_block"
+
+    def changed_addresses(self):
+        """
+        :return: the lowercase addresses that sent or received tokens since the previous call
+        """
+        to_block = self.w3.eth.block_number
+        cursor = database.get_setting(self.cursor_setting)
+
+        changed = set()
+        if cursor is not None:
+            # no history on the very first run, every flair is computed the first time its user is seen anyway
+            for contract in self.contracts:
+                topic = event_abi_to_log_topic(contract.events.Transfer().abi)
+                for log in get_logs(self.w3, {"address": contract.address, "topics": [topic]}, int(cursor) + 1,
+                                    to_block, self.block_range):
+                    changed.update(topic_to_address(t) for t in log["topics"][1:3])
+
+        if cursor is None or int(cursor) < to_block:
+            database.set_setting(self.cursor_setting, str(to_block))
+
+        return changed
+
+
+class FlairScheduler:
+    """
+    Keeps the flairs of the active users up to date without doing any work per comment.  A comment only marks its
+    author as active, a background thread then recomputes (in batches) the flairs that may have changed:
+
+    - the user is seen for the first time and the flair was not updated within the last hour
+    - a Transfer of one of the flair's tokens touched the user's address
+    - the user's special membership, custom flair (!flair) or share of the liquidity pool changed
+    - the flair is older than max_age
+
+    The last rendered text and hash of every active user are kept in memory, so an active user costs no database
+    or rpc calls while nothing changes.
+    """
+
+    logger = logging.getLogger("flair_bot")
+
+    def __init__(self, render, apply, watchers=(), is_special_member=None, lp_share=None,
+                 interval=SCHEDULE_INTERVAL, max_age=MAX_AGE, tracked_users=TRACKED_USERS):
+        """
+        :param render: render(user, state, community, special_member) returns the flair text or None when it cannot
+        be computed right now, state is the user's view_flair_can_update row
+        :param apply: apply(user, community, flair_text) sets the flair on reddit and saves its hash (see FlairWriter)
+        :param watchers: the TransferWatchers of the flair's tokens
+        :param is_special_member: is_special_member(user, community)
+        :param lp_share: lp_share(address) returns the share of the liquidity pool of an address
+        :param interval: seconds between runs
+        :param max_age: seconds after which a flair is recomputed regardless
+        :param tracked_users: how many active users are kept
+        """
+        self.render = render
+        self.apply = apply
+        self.watchers = watchers
+        self.is_special_member = is_special_member or (lambda user, community: False)
+        self.lp_share = lp_share or (lambda address: None)
+        self.interval = interval
+        self.max_age = max_age
+        self.tracked_users = tracked_users
+
+        # (lowercase user, community) -> the last flair set for that user in the community, a dict of user,
+        # community, address, text, hash, special, lp, rendered_at and force.  text is None until the first render.
+        self.flairs = OrderedDict()
+        self.dirty = set()
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.counters = {
+            'seen': 0,
+            'runs': 0,
+            'rendered': 0,
+            'applied': 0,
+            'unchanged': 0,
+            'render_failures': 0,
+            'transfers': 0,
+            'failures': 0,
+        }
+
+    def seen(self, user, community):
+        """
+        Marks a user as active in a community.  Called for every comment and submission, never blocks on I/O.
+        """
+        key = (user.lower(), community.lower())
+
+        with self._lock:
+            self.counters['seen'] += 1
+            flair = self.flairs.get(key)
+
+            if flair is None:
+                self.flairs[key] = {"user": user, "community": key[1], "address": None, "text": None, "hash": None,
+                                    "special": None, "lp": None, "rendered_at": None, "force": False}
+                self.dirty.add(key)
+
+                if len(self.flairs) > self.tracked_users:
+                    forgotten, _ = self.flairs.popitem(last=False)
+                    self.dirty.discard(forgotten)
+            else:
+                self.flairs.move_to_end(key)
+                if flair["rendered_at"] and time.time() - flair["rendered_at"] >= self.max_age:
+                    self.dirty.add(key)
+
+    def mark_dirty(self, user, community):
+        """
+        Recomputes the user's flair on the next run, e.g. after it could not be applied.
+        """
+        key = (user.lower(), community.lower())
+
+        with self._lock:
+            flair = self.flairs.get(key)
+            if flair is not None:
+                # the flair on reddit is not known to match any saved hash, it is applied even if unchanged
+                flair["force"] = True
+                self.dirty.add(key)
+
+    def mark_changes(self):
+        """
+        Marks the tracked users whose flair inputs changed since the previous run as dirty.
+        """
+        changed_addresses = set()
+        for watcher in self.watchers:
+            try:
+                changed_addresses |= watcher.changed_addresses()
+            except Exception as e:
+                # the cursor was not moved, these transfers are picked up by the next run
+                self.logger.error(f"  [{watcher.chain}] failed to read transfers | {e}")
+
+        with self._lock:
+            for key, flair in self.flairs.items():
+                if flair["text"] is None:
+                    continue
+
+                address = (flair["address"] or "").lower()
+                if address in changed_addresses:
+                    self.counters['transfers'] += 1
+                    self.dirty.add(key)
+                elif flair["special"] != bool(self.is_special_member(flair["user"], flair["community"])):
+                    self.dirty.add(key)
+                elif address and flair["lp"] != self.lp_share(address):
+                    self.dirty.add(key)
+
+    def lookup(self, keys):
+        """
+        :return: the view_flair_can_update rows of the users, by lowercase username (unregistered users are missing)
+        """
+        users = list(dict.fromkeys(user for user, _ in keys))
+        states = {}
+        for start in range(0, len(users), LOOKUP_CHUNK):
+            for state in database.get_flair_states(users[start:start + LOOKUP_CHUNK]):
+                states[state["username"].lower()] = state
+
+        return states
+
+    def run_once(self):
+        """
+        Recomputes the flairs that may have changed, see the class documentation.
+        :return: the number of flairs set on reddit
+        """
+        self.mark_changes()
+
+        with self._lock:
+            # custom flairs are changed by !flair in another process, so the special members (and users who were
+            # not registered yet) are looked up in every run
+            candidates = [key for key, flair in self.flairs.items() if key in self.dirty or flair["special"]
+                          or flair["text"] == UNREGISTERED]
+
+        states = self.lookup(candidates)
+        saved = []
+        applied = 0
+
+        for key in candidates:
+            user, community = key
+            with self._lock:
+                flair = self.flairs.get(key)
+            if flair is None:
+                continue
+
+            state = states.get(user)
+            if key not in self.dirty and not self._changed_outside(flair, state):
+                continue
+
+            special_member = bool(self.is_special_member(flair["user"], community))
+
+            rendered = False
+            if state is None:
+                text = UNREGISTERED
+            elif flair["text"] is None and not state["eligible"] and state["hash"] and state["custom_flair"]:
+                # set within the last hour (e.g. before a restart), the text saved with the hash is still current
+                text = state["custom_flair"]
+            else:
+                text = self.render(flair["user"], state, community, special_member)
+                rendered = True
+                self.counters['rendered'] += 1
+
+            if text is None:
+                # e.g. an rpc failure, tried again on the next run
+                self.counters['render_failures'] += 1
+                continue
+
+            text_hash = flair_hash(text)
+            known_hash = flair["hash"] or (state["hash"] if state else None)
+
+            if flair["force"] or (text_hash != known_hash and
+                                  not (text == UNREGISTERED and flair["text"] == UNREGISTERED)):
+                # the apply callback records the hash once the flair is set
+                self.apply(flair["user"], community, text)
+                applied += 1
+            else:
+                self.counters['unchanged'] += 1
+
+                # last_update is saved with every render, it is what the one hour gate after a restart is based on
+                if rendered:
+                    saved.append([flair["user"], text_hash, datetime.now(), text])
+
+            with self._lock:
+                flair.update({"address": state["address"] if state else None, "text": text, "hash": text_hash,
+                              "special": special_member,
+                              "lp": self.lp_share(state["address"].lower()) if state and state["address"] else None,
+                              "rendered_at": time.time(), "force": False})
+                self.dirty.discard(key)
+
+        # the hashes of the whole run are saved in one transaction
+        if saved:
+            database.save_flairs(saved)
+
+        self.counters['runs'] += 1
+        self.counters['applied'] += applied
+        return applied
+
+    @staticmethod
+    def _changed_outside(flair, state):
+        """
+        :return: True if the user registered or their custom flair was changed (by !flair) since the last render
+        """
+        if flair["text"] == UNREGISTERED:
+            return state is not None
+
+        return state is not None and flair["special"] and (state["custom_flair"] or "") != flair["text"]
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run_loop, name="flair-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Stops the background thread, a run in progress is finished first (its flairs are handed to apply).
+        """
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run_loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                self.counters['failures'] += 1
+                self.logger.error(f"  flair scheduler run failed | {e}")
+
+    def stats(self):
+        stats = dict(self.counters)
+        stats['tracked'] = len(self.flairs)
+        stats['dirty'] = len(self.dirty)
+        return stats
@@ -0,0 +1,239 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from database import database
+from flair.scheduler import flair_hash
+
+# flaircsv takes at most 100 lines per request
+BATCH_SIZE = 100
+
+# seconds a change waits before it is flushed, unless FLUSH_THRESHOLD changes are waiting
+FLUSH_INTERVAL = 5
+FLUSH_THRESHOLD = 100
+
+# flushes a failed change is tried in before it is given up
+MAX_ATTEMPTS = 3
+
+
+class FlairWriter:
+    """
+    A write-behind queue for flairs.  Changes are collected and sent with subreddit.flair.update (flaircsv), 100
+    users per request, instead of a flair.set call per user.  A later change of the same user replaces the queued
+    one.
+
+    flaircsv sets the text and css class only, a change whose template has no css class in css_classes is sent with
+    flair.set on its own.  The hashes of the applied flairs are saved in one transaction per flush.
+    """
+
+    logger = logging.getLogger("flair_bot")
+
+    def __init__(self, reddit, css_classes=None, flush_interval=FLUSH_INTERVAL, flush_threshold=FLUSH_THRESHOLD,
+                 max_attempts=MAX_ATTEMPTS, on_failure=None):
+        """
+        :param reddit: a praw instance
+        :param css_classes: the css class of each flair template, for the templates that can be sent in bulk.  Only
+        map a template after checking on the subreddit that its css class alone renders the same flair (emojis and
+        styling included), flaircsv drops the template id
+        :param flush_interval: seconds between flushes
+        :param flush_threshold: a flush starts early once this many changes are queued
+        :param max_attempts: flushes a change is tried in
+        :param on_failure: on_failure(user, community) is called for a change that was given up
+        """
+        self.reddit = reddit
+        self.css_classes = css_classes or {}
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.max_attempts = max_attempts
+        self.on_failure = on_failure
+
+        # (lowercase user, community) -> the queued change
+        self.pending = OrderedDict()
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.counters = {
+            'queued': 0,
+            'flushes': 0,
+            'flushed': 0,
+            'requests': 0,
+            # changes sent with flair.update and with flair.set
+            'bulk': 0,
+            'single': 0,
+            'retried': 0,
+            'dropped': 0,
+        }
+
+    def enqueue(self, user, community, text, template=None):
+        """
+        Queues a flair change, it is sent with the next flush.
+        """
+        key = (user.lower(), community.lower())
+
+        with self._lock:
+            attempts = self.pending.pop(key, {}).get("attempts", 0)
+            self.pending[key] = {"user": user, "community": key[1], "text": text, "template": template,
+                                 "attempts": attempts}
+            self.counters['queued'] += 1
+            depth = len(self.pending)
+
+        if depth >= self.flush_threshold:
+            self._wake.set()
+
+    def flush(self):
+        """
+        Sends the queued changes.
+        :return: the number of flairs applied
+        """
+        with self._flush_lock:
+            with self._lock:
+                changes = list(self.pending.values())
+                self.pending.clear()
+
+            if not changes:
+                return 0
+
+            by_community = OrderedDict()
+            for change in changes:
+                by_community.setdefault(change["community"], []).append(change)
+
+            applied = []
+            failed = []
+            sent_bulk = 0
+            sent_single = 0
+            for community, community_changes in by_community.items():
+                bulk = []
+                single = []
+                for change in community_changes:
+                    if change["template"] is None or change["template"] in self.css_classes:
+                        bulk.append(change)
+                    else:
+                        single.append(change)
+
+                sent_bulk += len(bulk)
+                sent_single += len(single)
+
+                for start in range(0, len(bulk), BATCH_SIZE):
+                    ok, not_ok = self._update(community, bulk[start:start + BATCH_SIZE])
+                    applied.extend(ok)
+                    failed.extend(not_ok)
+
+                for change in single:
+                    ok, not_ok = self._set(community, change)
+                    applied.extend(ok)
+                    failed.extend(not_ok)
+
+            if applied:
+                database.save_flairs([[c["user"], flair_hash(c["text"]), datetime.now(), c["text"]] for c in applied])
+
+            self._retry(failed)
+
+            self.counters['flushes'] += 1
+            self.counters['flushed'] += len(applied)
+            self.counters['bulk'] += sent_bulk
+            self.counters['single'] += sent_single
+
+            # single changes cost a request each, a template missing from css_classes shows up here
+            self.logger.info(f"  flushed {len(applied)} of {len(changes)} flairs | bulk: {sent_bulk} | "
+                             f"single: {sent_single}")
+            return len(applied)
+
+    def _update(self, community, changes):
+        flair_list = [{"user": c["user"], "flair_text": c["text"],
+                       "flair_css_class": self.css_classes.get(c["template"], "")} for c in changes]
+
+        self.counters['requests'] += 1
+        try:
+            results = self.reddit.subreddit(community).flair.update(flair_list)
+        except Exception as e:
+            self.logger.error(f"  flair update of {len(changes)} users in {community} failed | {e}")
+            return [], changes
+
+        ok = []
+        not_ok = []
+        for change, result in zip(changes, results):
+            if result.get("ok"):
+                ok.append(change)
+            else:
+                self.logger.warning(f"  flair for [user] {change['user']} not applied | {result.get('errors')}")
+                not_ok.append(change)
+
+        # a response shorter than the request leaves the rest unconfirmed
+        not_ok.extend(changes[len(results):])
+        return ok, not_ok
+
+    def _set(self, community, change):
+        self.counters['requests'] += 1
+        try:
+            self.reddit.subreddit(community).flair.set(change["user"], text=change["text"],
+                                                       flair_template_id=change["template"])
+        except Exception as e:
+            self.logger.error(f"  flair for [user] {change['user']} not applied | {e}")
+            return [], [change]
+
+        return [change], []
+
+    def _retry(self, failed):
+        dropped = []
+
+        with self._lock:
+            for change in failed:
+                key = (change["user"].lower(), change["community"])
+                if key in self.pending:
+                    # a newer change was queued while flushing, it replaces this one
+                    continue
+
+                change["attempts"] += 1
+                if change["attempts"] < self.max_attempts:
+                    self.pending[key] = change
+                    self.counters['retried'] += 1
+                else:
+                    self.counters['dropped'] += 1
+                    dropped.append(change)
+
+        for change in dropped:
+            self.logger.error(f"  giving up on the flair of [user] {change['user']} in {change['community']}")
+            if self.on_failure:
+                self.on_failure(change["user"], change["community"])
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._flush_loop, name="flair-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Stops the background thread, the changes still queued are flushed first.
+        """
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+        # whatever a flush in progress put back for a retry
+        self.flush()
+
+    def _flush_loop(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+
+            try:
+                self.flush()
+            except Exception as e:
+                self.logger.error(f"  flair flush failed | {e}")
+                time.sleep(1)
+
+    def stats(self):
+        stats = dict(self.counters)
+        stats['queue_depth'] = len(self.pending)
+        return stats
@@ -0,0 +1,143 @@
+from functools import lru_cache
+
+import numpy as np
+
+TICK_BASE = 1.0001
+
+Q96 = 2 ** 96
+
+# the range of ticks a uniswap v3 pool supports
+MIN_TICK = -887272
+MAX_TICK = 887272
+
+# sqrt ratios kept per tick, positions share a handful of popular ticks
+SQRT_RATIO_CACHE_SIZE = 65_536
+
+# TickMath.getSqrtRatioAtTick: 2**128 / sqrt(1.0001) ** (2 ** bit), by bit of the absolute tick
+TICK_FACTORS = [
+    (0x2, 0xfff97272373d413259a46990580e213a),
+    (0x4, 0xfff2e50f5f656932ef12357cf3c7fdcc),
+    (0x8, 0xffe5caca7e10e4e61c3624eaa0941cd0),
+    (0x10, 0xffcb9843d60f6159c9db58835c926644),
+    (0x20, 0xff973b41fa98c081472e6896dfb254c0),
+    (0x40, 0xff2ea16466c96a3843ec78b326b52861),
+    (0x80, 0xfe5dee046a99a2a811c461f1969c3053),
+    (0x100, 0xfcbe86c7900a88aedcffc83b479aa3a4),
+    (0x200, 0xf987a7253ac413176f2b074cf7815e54),
+    (0x400, 0xf3392b0822b70005940c7a398e4b70f3),
+    (0x800, 0xe7159475a2c29b7443b29c7fa6e889d9),
+    (0x1000, 0xd097f3bdfd2022b8845ad8f792aa5825),
+    (0x2000, 0xa9f746462d870fdf8a65dc1f90e061e5),
+    (0x4000, 0x70d869a156d2a1b890bb3df62baf32f7),
+    (0x8000, 0x31be135f97d08fd981231505542fcfa6),
+    (0x10000, 0x9aa508b5b7a84e1c677de54f3e99bc9),
+    (0x20000, 0x5d6af8dedb81196699c329225ee604),
+    (0x40000, 0x2216e584f5fa1ea926041bedfe98),
+    (0x80000, 0x48a170391f7dc42444e8fa2),
+]
+
+
+def tick_to_price(tick):
+    return TICK_BASE ** tick
+
+
+def position_amounts(liquidity, tick_lower, tick_upper, current_tick, current_sqrt_price):
+    """
+    Calculates the token amounts held by many positions at once, in floating point.
+    :param liquidity: the liquidity of every position
+    :param tick_lower: the lower tick of every position
+    :param tick_upper: the upper tick of every position
+    :param current_tick: the pool's current tick
+    :param current_sqrt_price: the pool's current sqrt price (sqrtPriceX96 / 2 ** 96)
+    :return: a tuple of (token0 amounts, token1 amounts) arrays, in the tokens' smallest unit
+    """
+    liquidity = np.asarray(liquidity, dtype=np.float64)
+    tick_lower = np.asarray(tick_lower, dtype=np.float64)
+    tick_upper = np.asarray(tick_upper, dtype=np.float64)
+
+    sa = np.power(TICK_BASE, tick_lower / 2)
+    sb = np.power(TICK_BASE, tick_upper / 2)
+
+    # only token1 is locked below the current tick, both tokens inside the range, only token0 above it
+    below = tick_upper <= current_tick
+    inside = (tick_lower < current_tick) & (current_tick < tick_upper)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        amount0 = np.where(below, 0.0, np.where(inside, liquidity * (sb - current_sqrt_price) /
+                                                (current_sqrt_price * sb), liquidity * (sb - sa) / (sa * sb)))
+        amount1 = np.where(below, liquidity * (sb - sa), np.where(inside, liquidity * (current_sqrt_price - sa), 0.0))
+
+    return amount0, amount1
+
+
+@lru_cache(maxsize=SQRT_RATIO_CACHE_SIZE)
+def sqrt_ratio_at_tick(tick):
+    """
+    TickMath.getSqrtRatioAtTick, bit for bit.
+    :return: sqrt(1.0001 ** tick) as a Q64.96 integer
+    """
+    abs_tick = abs(tick)
+    if abs_tick > MAX_TICK:
+        raise ValueError(f"tick {tick} is out of range")
+
+    ratio = 0xfffcb933bd6fad37aa2d162d1a594001 if abs_tick & 0x1 else 0x100000000000000000000000000000000
+    for bit, factor in TICK_FACTORS:
+        if abs_tick & bit:
+            ratio = (ratio * factor) >> 128
+
+    if tick > 0:
+        ratio = (2 ** 256 - 1) // ratio
+
+    # Q128.128 to Q64.96, rounded up
+    return (ratio >> 32) + (1 if ratio % (1 << 32) else 0)
+
+
+def amount0_delta(sqrt_ratio_a, sqrt_ratio_b, liquidity):
+    """
+    LiquidityAmounts.getAmount0ForLiquidity: the token0 between two sqrt ratios, rounded down.
+    """
+    if sqrt_ratio_a > sqrt_ratio_b:
+        sqrt_ratio_a, sqrt_ratio_b = sqrt_ratio_b, sqrt_ratio_a
+
+    return (liquidity << 96) * (sqrt_ratio_b - sqrt_ratio_a) // sqrt_ratio_b // sqrt_ratio_a
+
+
+def amount1_delta(sqrt_ratio_a, sqrt_ratio_b, liquidity):
+    """
+    LiquidityAmounts.getAmount1ForLiquidity: the token1 between two sqrt ratios, rounded down.
+    """
+    if sqrt_ratio_a > sqrt_ratio_b:
+        sqrt_ratio_a, sqrt_ratio_b = sqrt_ratio_b, sqrt_ratio_a
+
+    return liquidity * (sqrt_ratio_b - sqrt_ratio_a) // Q96
+
+
+def position_amounts_exact(liquidity, tick_lower, tick_upper, sqrt_price_x96):
+    """
+    Calculates the token amounts held by many positions with the integer math of the pool contracts
+    (LiquidityAmounts.getAmountsForLiquidity), so the amounts match what burning the positions would return.
+    :param liquidity: the liquidity of every position
+    :param tick_lower: the lower tick of every position
+    :param tick_upper: the upper tick of every position
+    :param sqrt_price_x96: the pool's sqrtPriceX96 (slot0)
+    :return: a tuple of (token0 amounts, token1 amounts) lists of ints, in the tokens' smallest unit
+    """
+    amount0 = []
+    amount1 = []
+
+    for liq, lower, upper in zip(liquidity, tick_lower, tick_upper):
+        liq = int(liq)
+        sqrt_a = sqrt_ratio_at_tick(int(lower))
+        sqrt_b = sqrt_ratio_at_tick(int(upper))
+
+        if sqrt_price_x96 <= sqrt_a:
+            amount0.append(amount0_delta(sqrt_a, sqrt_b, liq))
+            amount1.append(0)
+        elif sqrt_price_x96 < sqrt_b:
+            amount0.append(amount0_delta(sqrt_price_x96, sqrt_b, liq))
+            amount1.append(amount1_delta(sqrt_a, sqrt_price_x96, liq))
+        else:
+            amount0.append(0)
+            amount1.append(amount1_delta(sqrt_a, sqrt_b, liq))
+
+    return amount0, amount1
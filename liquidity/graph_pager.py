@@ -0,0 +1,96 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from gql import gql
+
+from chain.multicall import with_retries
+
+# positions per request, the most the graph returns at once
+PAGE_SIZE = 1000
+
+# attempts per page, a failed page is asked for again from the last id that was read
+RETRIES = 5
+RETRY_BACKOFF_SECONDS = 2
+
+POSITIONS_QUERY = """query get_positions($pool_id: ID!, $first: Int!, $last_id: ID!) {
+  positions(first: $first, orderBy: id, orderDirection: asc, where: {pool: $pool_id, id_gt: $last_id}) {
+    id
+    owner
+    liquidity
+    tickLower { tickIdx }
+    tickUpper { tickIdx }
+  }
+}"""
+
+
+def to_position(position):
+    """
+    :param position: a position as returned by the subgraph
+    :return: the position in the format of chain.position_scanner
+    """
+    return {"id": position["id"], "owner": position["owner"], "liquidity": int(position["liquidity"]),
+            "tick_lower": int(position["tickLower"]["tickIdx"]), "tick_upper": int(position["tickUpper"]["tickIdx"])}
+
+
+class PositionPager:
+    """
+    Walks the positions of a pool on a uniswap v3 style subgraph, ordered by id.  Every page asks for the positions
+    after the last id of the previous page (id_gt) rather than skipping over them, so a page costs the same no
+    matter how deep into the positions it is.  The next page is fetched on a background thread while the caller
+    works through the current one.
+
+    last_id is the checkpoint: it only moves once a page has been handed out, and a page that fails is asked for
+    again from there.
+    """
+
+    logger = logging.getLogger("donut_bot")
+
+    def __init__(self, session, pool_id, page_size=PAGE_SIZE, last_id="", retries=RETRIES,
+                 backoff=RETRY_BACKOFF_SECONDS):
+        """
+        :param session: a connected gql session (``with client as session:``), shared by every page
+        :param pool_id: the pool address
+        :param last_id: start after this position id
+        """
+        self.session = session
+        self.pool_id = pool_id
+        self.page_size = page_size
+        self.last_id = last_id
+        self.retries = retries
+        self.backoff = backoff
+        self.query = gql(POSITIONS_QUERY)
+
+        self.pages = 0
+        self.positions = 0
+
+    def fetch(self, last_id):
+        variables = {"pool_id": self.pool_id, "first": self.page_size, "last_id": last_id}
+        response = with_retries(lambda: self.session.execute(self.query, variable_values=variables), self.retries,
+                                self.backoff)
+        return response["positions"]
+
+    def iter_pages(self):
+        """
+        :return: a generator of pages, each a list of positions (see to_position)
+        """
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="graph") as executor:
+            future = executor.submit(self.fetch, self.last_id)
+
+            while future is not None:
+                page = future.result()
+                if not page:
+                    return
+
+                # a short page is the last one, otherwise the next one is fetched while this one is processed
+                future = executor.submit(self.fetch, page[-1]["id"]) if len(page) == self.page_size else None
+
+                yield [to_position(p) for p in page]
+
+                self.last_id = page[-1]["id"]
+                self.pages += 1
+                self.positions += len(page)
+                self.logger.info(f"  page {self.pages}: {self.positions} positions, up to id {self.last_id}")
+
+    def __iter__(self):
+        for page in self.iter_pages():
+            yield from page
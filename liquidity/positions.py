@@ -0,0 +1,106 @@
+from liquidity.amounts import Q96, position_amounts, position_amounts_exact
+
+# the sushi pool is weth (token0) / donut (token1)
+DECIMALS0 = 18
+DECIMALS1 = 18
+
+
+class Leaderboard:
+    """
+    Sums up liquidity positions by owner.  Positions can be added a page at a time, only the per owner totals are
+    kept so the memory used does not grow with the number of positions.
+    """
+
+    def __init__(self, current_tick, sqrt_price_x96, users, multisig, exact=False):
+        """
+        :param current_tick: the pool's current tick
+        :param sqrt_price_x96: the pool's sqrtPriceX96
+        :param users: usernames by lowercase address
+        :param multisig: the multi-sig wallet address
+        :param exact: calculate the amounts with the pools' integer math instead of floating point
+        """
+        self.current_tick = current_tick
+        self.sqrt_price_x96 = int(sqrt_price_x96)
+        self.exact = exact
+        self.users = users
+        self.multisig = multisig.lower()
+
+        self.owners = {}
+        self.total_liquidity = 0
+
+    def add(self, positions):
+        """
+        :param positions: dicts with the id, owner, liquidity, tick_lower and tick_upper (see chain.position_scanner)
+        """
+        positions = [p for p in positions if int(p["liquidity"]) > 0]
+        if not positions:
+            return
+
+        liquidity = [int(p["liquidity"]) for p in positions]
+        tick_lower = [p["tick_lower"] for p in positions]
+        tick_upper = [p["tick_upper"] for p in positions]
+
+        if self.exact:
+            amount0, amount1 = position_amounts_exact(liquidity, tick_lower, tick_upper, self.sqrt_price_x96)
+            eth_in_lp = [a / 10 ** DECIMALS0 for a in amount0]
+            donut_in_lp = [a / 10 ** DECIMALS1 for a in amount1]
+        else:
+            amount0, amount1 = position_amounts(liquidity, tick_lower, tick_upper, self.current_tick,
+                                                self.sqrt_price_x96 / Q96)
+            eth_in_lp = (amount0 / 10 ** DECIMALS0).tolist()
+            donut_in_lp = (amount1 / 10 ** DECIMALS1).tolist()
+
+        for position, eth, donut in zip(positions, eth_in_lp, donut_in_lp):
+            self.total_liquidity += int(position["liquidity"])
+
+            owner = position["owner"].lower()
+            existing = self.owners.get(owner)
+
+            if existing:
+                existing["id"] = f"{existing['id']},{position['id']}"
+                existing["liquidity"] += int(position["liquidity"])
+                existing["eth_in_lp"] += eth
+                existing["donut_in_lp"] += donut
+                continue
+
+            if owner == self.multisig:
+                user = 'r/EthTrader Multi-Sig Wallet'
+            else:
+                user = self.users.get(owner)
+
+            self.owners[owner] = {
+                "id": position["id"],
+                "owner": position["owner"],
+                "liquidity": int(position["liquidity"]),
+                "user": user,
+                "eth_in_lp": eth,
+                "donut_in_lp": donut
+            }
+
+    def results(self):
+        """
+        :return: a list of owners (liquidity_leaders.json format), largest liquidity first
+        """
+        for owner in self.owners.values():
+            owner["percent_of_pool"] = owner["liquidity"] / self.total_liquidity * 100
+
+        return sorted(self.owners.values(), key=lambda k: k["liquidity"], reverse=True)
+
+
+def leaderboard(positions, current_tick, sqrt_price_x96, users, multisig, exact=False):
+    """
+    Sums up the positions by owner.
+    :param positions: dicts with the id, owner, liquidity, tick_lower and tick_upper (see chain.position_scanner)
+    :return: a list of owners (liquidity_leaders.json format), largest liquidity first
+    """
+    board = Leaderboard(current_tick, sqrt_price_x96, users, multisig, exact)
+    board.add(positions)
+    return board.results()
+
+
+def pool_share_by_owner(leaders):
+    """
+    :param leaders: a liquidity_leaders.json document
+    :return: the percent of the pool owned, by lowercase owner address
+    """
+    return {leader["owner"].lower(): leader["percent_of_pool"] for leader in leaders or []}
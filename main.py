@@ -1,16 +1,27 @@
+import argparse
 import json
 import os
 import logging
+import signal
+import threading
 import time
 
 import praw
 
 from commands import *
 from commands.command import Command
+from commands.dispatcher import CommandDispatcher
+from commands.executor import CommandExecutor
+from events.event_bus import EventBus, COMMENT, SUBMISSION, POLL_INTERVAL
 from logging.handlers import RotatingFileHandler
 from dotenv import load_dotenv
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bus", action="store_true",
+                        help="also host post-bot and flair-bot, polling reddit once for all three")
+    args = parser.parse_args()
+
     # load environment variables
     load_dotenv()
 
@@ -57,21 +68,84 @@ if __name__ == '__main__':
     for cls in Command.__subclasses__():
         commands.append(cls(config, reddit))
 
-    while True:
-        try:
-            # for comment in reddit.subreddit(subs).stream.comments(skip_existing=True):
-            for comment in reddit.subreddit(subs).stream.comments():
-                if not comment.author or comment.author.name == username or comment.author == "EthTrader_Reposter":
-                    continue
-
-                # find any command that can handle this comment and then process that comment
-                for command in commands:
-                    if command.can_handle(comment.body):
-                        try:
-                            command.process_comment(comment)
-                        except Exception as e:
-                            logger.error(f'  Exception: {e}')
-        except Exception as e:
-            logger.error(e)
-            logger.info('sleeping 30 seconds ...')
-            time.sleep(30)
+    dispatcher = CommandDispatcher(commands)
+    executor = CommandExecutor(config.get("executor"))
+
+    def handle_comment(comment):
+        if not comment.author or comment.author.name == username or comment.author == "EthTrader_Reposter":
+            return
+
+        # find any command that can handle this comment and then queue it for processing
+        for command in dispatcher.dispatch(comment.body):
+            executor.submit(command, comment)
+
+    metrics_interval = config.get("executor", {}).get("metrics_interval_seconds", 300)
+    last_metrics = time.monotonic()
+
+    if args.bus:
+        from bots.loader import load_bot
+
+        post_bot = load_bot("post-bot")
+        post_bot.setup(reddit)
+
+        flair_bot = load_bot("flair-bot")
+        flair_bot.setup()
+
+        # the listings are polled once and every new item is handed to the subscribers
+        bus = EventBus(reddit, subs, config.get("event_bus", {}).get("poll_interval_seconds", POLL_INTERVAL))
+        bus.subscribe("commands", handle_comment, kinds=[COMMENT])
+        bus.subscribe("post-bot", post_bot.process_submission, kinds=[SUBMISSION], skip_backlog=True)
+        bus.subscribe("flair-bot", flair_bot.handle_item)
+
+        # update.sh sends SIGTERM first, stop polling and let the queued items finish before exiting
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+
+        while not stop.is_set():
+            try:
+                if not bus.poll_once():
+                    stop.wait(bus.poll_interval)
+            except Exception as e:
+                logger.error(e)
+                logger.info('sleeping 30 seconds ...')
+                stop.wait(30)
+
+            if time.monotonic() - last_metrics >= metrics_interval:
+                bus.log_metrics()
+                executor.log_metrics()
+                last_metrics = time.monotonic()
+
+        logger.info('shutting down, waiting for queued items to finish ...')
+        bus.shutdown()
+        executor.shutdown()
+        flair_bot.shutdown()
+        bus.log_metrics()
+        executor.log_metrics()
+        logger.info('shutdown complete')
+        exit(0)
+
+    # update.sh sends SIGTERM first, leave the stream loop and let the queued commands finish before exiting
+    def handle_sigterm(signum, frame):
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, handle_sigterm)
+
+    try:
+        while True:
+            try:
+                # for comment in reddit.subreddit(subs).stream.comments(skip_existing=True):
+                for comment in reddit.subreddit(subs).stream.comments():
+                    if time.monotonic() - last_metrics >= metrics_interval:
+                        executor.log_metrics()
+                        last_metrics = time.monotonic()
+
+                    handle_comment(comment)
+            except Exception as e:
+                logger.error(e)
+                logger.info('sleeping 30 seconds ...')
+                time.sleep(30)
+    finally:
+        logger.info('shutting down, waiting for queued commands to finish ...')
+        executor.shutdown()
+        executor.log_metrics()
+        logger.info('shutdown complete')
@@ -0,0 +1,220 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from eth_abi import decode, encode
+from eth_utils import function_signature_to_4byte_selector
+from web3 import Web3
+
+from chain.multicall import MULTICALL3_ADDRESS
+
+BALANCE_OF = function_signature_to_4byte_selector("balanceOf(address)")
+POSITIONS = function_signature_to_4byte_selector("positions(uint256)")
+OWNER_OF = function_signature_to_4byte_selector("ownerOf(uint256)")
+POSITION_TYPES = ["uint96", "address", "address", "address", "uint24", "int24", "int24", "uint128", "uint256",
+                  "uint256", "uint128", "uint128"]
+
+
+def block_timestamp(block_number):
+    return 1_700_000_000 + block_number * 12
+
+
+def balance(address):
+    """
+    :return: the balance the fake node reports for an address that was not given one in FakeNode.balances
+    """
+    return int(address, 16) % 10 ** 24
+
+
+class FakeNode(BaseHTTPRequestHandler):
+    """
+    A json-rpc node that knows erc20 tokens (every address holds balance(address) unless set in balances), the
+    positions / ownerOf of a position manager, Multicall3's aggregate3 and eth_getLogs.
+    """
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    block_number = 1000
+
+    # balance by lowercase address, overriding balance()
+    balances = {}
+
+    # addresses whose balanceOf fails the first time it is part of an aggregate3 call
+    flaky = set()
+
+    # the logs eth_getLogs filters by address, block range and the first topic
+    logs = []
+
+    # number of aggregate3 calls to answer before failing them all
+    fail_after = None
+
+    # receipt status by transaction hash, transactions not in here succeeded
+    statuses = {}
+
+    # position manager positions() results and owners by token id, other token ids revert
+    positions = {}
+    owners = {}
+
+    calls = []
+    batches = []
+
+    @classmethod
+    def reset(cls):
+        cls.block_number = 1000
+        cls.balances = {}
+        cls.flaky = set()
+        cls.logs = []
+        cls.fail_after = None
+        cls.statuses = {}
+        cls.positions = {}
+        cls.owners = {}
+        cls.calls = []
+        cls.batches = []
+
+    def balance_of(self, holder):
+        return self.balances.get(holder.lower(), balance(holder))
+
+    def call(self, data, flaky=False):
+        """
+        :return: a tuple of (success, return data) for a call to a token or the position manager
+        """
+        selector, args = data[:4], data[4:]
+
+        if selector == BALANCE_OF:
+            holder = decode(["address"], args)[0]
+            if flaky and holder in self.flaky:
+                FakeNode.flaky.discard(holder)
+                return False, b""
+            return True, encode(["uint256"], [self.balance_of(holder)])
+
+        token_id = decode(["uint256"], args)[0]
+        if selector == POSITIONS and token_id in self.positions:
+            return True, encode(POSITION_TYPES, self.positions[token_id])
+        if selector == OWNER_OF and token_id in self.owners:
+            return True, encode(["address"], [self.owners[token_id]])
+
+        return False, b""
+
+    def eth_call(self, tx, block):
+        FakeNode.calls.append((tx["to"].lower(), block))
+        data = Web3.to_bytes(hexstr=tx["data"])
+
+        if tx["to"].lower() != MULTICALL3_ADDRESS.lower():
+            success, result = self.call(data)
+            if not success:
+                raise ValueError("execution reverted")
+            return "0x" + result.hex()
+
+        if FakeNode.fail_after is not None:
+            if FakeNode.fail_after == 0:
+                raise ValueError("node is down")
+            FakeNode.fail_after -= 1
+
+        (calls,) = decode(["(address,bool,bytes)[]"], data[4:])
+        results = [self.call(call_data, flaky=True) for target, allow_failure, call_data in calls]
+
+        return "0x" + encode(["(bool,bytes)[]"], [results]).hex()
+
+    def eth_get_logs(self, log_filter):
+        FakeNode.calls.append(("eth_getLogs", log_filter["fromBlock"], log_filter["toBlock"]))
+        from_block, to_block = int(log_filter["fromBlock"], 16), int(log_filter["toBlock"], 16)
+        topics = log_filter["topics"][0]
+        addresses = log_filter["address"] if isinstance(log_filter["address"], list) else [log_filter["address"]]
+        addresses = [a.lower() for a in addresses]
+
+        return [log for log in self.logs
+                if log["address"].lower() in addresses
+                and from_block <= int(log["blockNumber"], 16) <= to_block
+                and log["topics"][0] in topics]
+
+    def handle_request(self, request):
+        response = {"jsonrpc": "2.0", "id": request["id"]}
+        method, params = request["method"], request["params"]
+
+        try:
+            if method == "eth_chainId":
+                response["result"] = "0x1"
+            elif method == "eth_blockNumber":
+                response["result"] = hex(self.block_number)
+            elif method == "eth_getLogs":
+                response["result"] = self.eth_get_logs(params[0])
+            elif method == "eth_getTransactionReceipt":
+                FakeNode.calls.append((method, params[0]))
+                response["result"] = {"transactionHash": params[0], "status": hex(self.statuses.get(params[0], 1))}
+            elif method == "eth_getBlockByNumber":
+                FakeNode.calls.append((method, params[0]))
+                response["result"] = {"number": params[0], "timestamp": hex(block_timestamp(int(params[0], 16)))}
+            else:
+                response["result"] = self.eth_call(*params)
+        except ValueError as e:
+            response["error"] = {"code": -32000, "message": str(e)}
+
+        return response
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+
+        if isinstance(request, list):
+            FakeNode.batches.append([r["method"] for r in request])
+            response = [self.handle_request(r) for r in request]
+        else:
+            response = self.handle_request(request)
+
+        body = json.dumps(response).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeNodeServer(ThreadingHTTPServer):
+    # the tests open many connections at once, the default backlog of 5 has them wait on syn retransmits
+    request_queue_size = 128
+
+
+def start_fake_node():
+    """
+    Resets the fake node and serves it on a free port.
+    :return: the server, shut it down with server.shutdown() and server.server_close()
+    """
+    FakeNode.reset()
+
+    server = FakeNodeServer(("127.0.0.1", 0), FakeNode)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def transfer_log(token, block_number, from_address, to_address, topic):
+    """
+    :return: a log for eth_getLogs, with the two addresses as its indexed arguments
+    """
+    return {"address": token, "blockNumber": hex(block_number), "topics": [
+        Web3.to_hex(topic), address_topic(from_address), address_topic(to_address)],
+        "data": "0x" + "00" * 32, "transactionHash": "0x" + "11" * 32, "blockHash": "0x" + "22" * 32,
+        "logIndex": "0x0", "transactionIndex": "0x0", "removed": False}
+
+
+def position(token0, token1, tick_lower, tick_upper, liquidity):
+    """
+    :return: a positions() result of the position manager
+    """
+    return [0, "0x" + "00" * 20, token0, token1, 3000, tick_lower, tick_upper, liquidity, 0, 0, 0, 0]
+
+
+def address_topic(address):
+    return "0x" + address[2:].lower().rjust(64, "0")
+
+
+def tip_log(contract, block_number, tx_hash, from_address, to_address, amount, token, content_id, topic):
+    """
+    :return: a Tip event log of the tipping contract for eth_getLogs
+    """
+    data = encode(["uint256", "bytes32"], [amount, content_id.encode().ljust(32, b"\x00")])
+    return {"address": contract, "blockNumber": hex(block_number), "topics": [
+        Web3.to_hex(topic), address_topic(from_address), address_topic(to_address), address_topic(token)],
+        "data": "0x" + data.hex(), "transactionHash": tx_hash, "blockHash": "0x" + "22" * 32,
+        "logIndex": "0x0", "transactionIndex": "0x0", "removed": False}
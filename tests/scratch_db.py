@@ -0,0 +1,30 @@
+import os
+import sqlite3
+import tempfile
+
+from ad_hoc.setup import migrate
+from database import connection
+
+SCHEMA_PATH = os.path.normpath(os.path.join(os.path.dirname(__file__), "../ad_hoc/setup/schema.sql"))
+
+
+def create_scratch_db(migrated=True):
+    """
+    Builds an empty database from schema.sql in a temp directory and points the connection layer at it.
+    :param migrated: whether to also apply the migrations in ad_hoc/setup/migrations
+    :return: the path of the scratch database
+    """
+    db_path = os.path.join(tempfile.mkdtemp(), "donut-bot.db")
+
+    with open(SCHEMA_PATH, 'r') as f:
+        schema = f.read()
+
+    with sqlite3.connect(db_path) as db:
+        db.executescript(schema)
+
+    if migrated:
+        migrate.migrate(db_path)
+
+    connection.DB_PATH = db_path
+    connection.close_connection()
+    return db_path
@@ -0,0 +1,78 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+import asyncpraw
+import praw
+
+from async_main import BotRuntime, get_subs, to_praw
+
+
+class TestToPraw(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.async_reddit = asyncpraw.Reddit(client_id="id", client_secret="secret", user_agent="test")
+        self.reddit = praw.Reddit(client_id="id", client_secret="secret", user_agent="test", check_for_updates=False)
+
+    async def asyncTearDown(self):
+        await self.async_reddit.close()
+
+    async def test_comment(self):
+        comment = asyncpraw.models.Comment(self.async_reddit, _data={
+            "id": "abc", "name": "t1_abc", "body": "!tip 5", "author": "donut_fan", "subreddit": "ethtrader",
+            "link_id": "t3_xyz", "parent_id": "t3_xyz", "created_utc": 1700000000.0})
+
+        converted = to_praw(comment, self.reddit)
+
+        self.assertIsInstance(converted, praw.models.Comment)
+        self.assertIs(self.reddit, converted._reddit)
+        self.assertEqual("t1_abc", converted.fullname)
+        self.assertEqual("!tip 5", converted.body)
+        self.assertEqual("donut_fan", converted.author.name)
+        self.assertEqual("ethtrader", converted.subreddit.display_name)
+        self.assertEqual("xyz", converted.submission.id)
+
+    async def test_submission(self):
+        submission = asyncpraw.models.Submission(self.async_reddit, _data={
+            "id": "xyz", "name": "t3_xyz", "title": "a post", "author": "donut_fan", "subreddit": "ethtrader",
+            "is_self": True, "selftext": "body"})
+
+        converted = to_praw(submission, self.reddit)
+
+        self.assertIsInstance(converted, praw.models.Submission)
+        self.assertEqual("t3_xyz", converted.fullname)
+        self.assertEqual("a post", converted.title)
+        self.assertEqual("donut_fan", converted.author.name)
+
+
+class FakeStream:
+    def __init__(self, items):
+        self.items = items
+
+    async def submissions(self, pause_after=None):
+        for item in self.items:
+            yield item
+
+
+class FakeSubreddit:
+    def __init__(self, items):
+        self.stream = FakeStream(items)
+
+
+class TestBotRuntime(IsolatedAsyncioTestCase):
+
+    async def test_existing_submissions_are_only_flaired(self):
+        runtime = BotRuntime.__new__(BotRuntime)
+        runtime.posts = asyncio.Queue()
+        runtime.flairs = asyncio.Queue()
+
+        await runtime.stream_submissions(FakeSubreddit(["old_1", "old_2", None, "new_1", None, "new_2"]))
+
+        self.assertEqual(["new_1", "new_2"], [runtime.posts.get_nowait() for _ in range(runtime.posts.qsize())])
+        self.assertEqual(4, runtime.flairs.qsize())
+
+
+class TestGetSubs(TestCase):
+
+    def test_get_subs(self):
+        config = {"community_tokens": [{"community": "r/ethtrader"}, {"community": "donut"}]}
+        self.assertEqual("ethtrader+donut", get_subs(config))
@@ -0,0 +1,109 @@
+import json
+import os
+from unittest import TestCase
+
+from eth_utils.abi import event_abi_to_log_topic
+from web3 import Web3
+
+from chain.balance_snapshot import BalanceSnapshot, TRANSFER_EVENTS
+from chain.client_pool import ChainClientPool
+from chain.multicall import Multicall
+from database import connection, database
+from tests.fake_node import FakeNode, balance, start_fake_node, transfer_log
+from tests.scratch_db import create_scratch_db
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+TOKEN = '0xC0F9bD5Fa5698B6505F643900FFA515Ea5dF54A9'
+
+
+class TestBalanceSnapshot(TestCase):
+
+    def setUp(self):
+        self.original_path = connection.DB_PATH
+        create_scratch_db()
+
+        self.server = start_fake_node()
+        self.pool = ChainClientPool(providers={"eth": f"http://127.0.0.1:{self.server.server_port}"})
+
+        with open(os.path.normpath(os.path.join(SCRIPT_DIR, "../contracts/donut_mainnet_abi.json")), 'r') as f:
+            self.token = self.pool.contract("eth", TOKEN, json.load(f))
+
+        self.transfer = event_abi_to_log_topic(self.token.events.Transfer().abi)
+        self.addresses = [Web3.to_checksum_address(f"0x{i:040x}") for i in range(1, 101)]
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+        connection.close_connection()
+        connection.DB_PATH = self.original_path
+
+    def snapshot(self, **kwargs):
+        multicall = Multicall(self.pool.web3("eth"), batch_size=10, retries=1, backoff=0)
+        return BalanceSnapshot("eth", self.pool.web3("eth"), {"donut": (self.token, TRANSFER_EVENTS)}, multicall,
+                               **kwargs)
+
+    def test_first_run_reads_everything(self):
+        snapshot = self.snapshot()
+        balances = snapshot.refresh(self.addresses, 1000)
+
+        self.assertEqual({a: balance(a) for a in self.addresses}, balances["donut"])
+        self.assertEqual(100, snapshot.queried)
+        self.assertEqual("1000", database.get_setting("balance_snapshot_eth_block"))
+
+        # every balance is read at the snapshot block
+        self.assertEqual({hex(1000)}, {call[1] for call in FakeNode.calls})
+
+    def test_only_changed_addresses_are_read(self):
+        self.snapshot().refresh(self.addresses, 1000)
+
+        sender, receiver = self.addresses[5], self.addresses[50]
+        FakeNode.balances = {sender.lower(): 1, receiver.lower(): 2, self.addresses[70].lower(): 3}
+        FakeNode.logs = [transfer_log(TOKEN, 1500, sender, receiver, self.transfer),
+                         transfer_log(TOKEN, 900, self.addresses[70], receiver, self.transfer)]
+        FakeNode.calls = []
+
+        snapshot = self.snapshot(block_range=300)
+        balances = snapshot.refresh(self.addresses, 2000)
+
+        # the log before the previous snapshot is not looked at
+        self.assertEqual(2, snapshot.queried)
+        self.assertEqual(1, balances["donut"][sender])
+        self.assertEqual(2, balances["donut"][receiver])
+        self.assertEqual(balance(self.addresses[70]), balances["donut"][self.addresses[70]])
+
+        # the range after the checkpoint is scanned in chunks
+        scans = [(int(c[1], 16), int(c[2], 16)) for c in FakeNode.calls if c[0] == "eth_getLogs"]
+        self.assertEqual([(1001, 1300), (1301, 1600), (1601, 1900), (1901, 2000)], scans)
+
+        # unchanged balances are moved up to the new block
+        self.assertEqual({2000}, {block for _, block in database.get_balance_snapshot("eth")["donut"].values()})
+
+    def test_new_addresses_are_read(self):
+        self.snapshot().refresh(self.addresses[:50], 1000)
+
+        snapshot = self.snapshot()
+        snapshot.refresh(self.addresses, 2000)
+
+        self.assertEqual(50, snapshot.queried)
+
+    def test_resumes_after_a_crash(self):
+        # the node goes down after three chunks of ten
+        FakeNode.fail_after = 3
+        with self.assertRaises(ValueError):
+            self.snapshot(chunk_size=10).refresh(self.addresses, 1000)
+
+        self.assertIsNone(database.get_setting("balance_snapshot_eth_block"))
+        self.assertEqual("1000", database.get_setting("balance_snapshot_eth_pending"))
+
+        FakeNode.fail_after = None
+        snapshot = self.snapshot(chunk_size=10)
+        balances = snapshot.refresh(self.addresses, 1200)
+
+        # the snapshot at 1000 is finished first, then brought up to 1200
+        self.assertEqual(70, snapshot.queried)
+        self.assertEqual({a: balance(a) for a in self.addresses}, balances["donut"])
+        self.assertEqual("1200", database.get_setting("balance_snapshot_eth_block"))
+        self.assertFalse(database.get_setting("balance_snapshot_eth_pending"))
@@ -0,0 +1,113 @@
+import json
+import os
+import threading
+import time
+from unittest import TestCase
+
+from web3 import Web3
+
+from chain.batching_provider import RateLimiter, get_rate_limiter
+from chain.client_pool import ChainClientPool
+from tests.fake_node import FakeNode, balance, start_fake_node
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+TOKEN = '0xC0F9bD5Fa5698B6505F643900FFA515Ea5dF54A9'
+
+
+class TestBatchingProvider(TestCase):
+
+    def setUp(self):
+        self.server = start_fake_node()
+        self.endpoint = f"http://127.0.0.1:{self.server.server_port}"
+
+        with open(os.path.normpath(os.path.join(SCRIPT_DIR, "../contracts/donut_mainnet_abi.json")), 'r') as f:
+            self.abi = json.load(f)
+
+        self.addresses = [Web3.to_checksum_address(f"0x{i:040x}") for i in range(1, 21)]
+        self.pools = []
+
+    def tearDown(self):
+        for pool in self.pools:
+            pool.close()
+
+        self.server.shutdown()
+        self.server.server_close()
+
+    def pool(self, **kwargs):
+        pool = ChainClientPool(providers={"eth": self.endpoint}, **kwargs)
+        self.pools.append(pool)
+        return pool
+
+    def read_concurrently(self, pool):
+        token = pool.contract("eth", TOKEN, self.abi)
+        token.w3.eth.chain_id
+
+        results = {}
+        start = threading.Barrier(len(self.addresses))
+
+        def read(address):
+            start.wait()
+            results[address] = token.functions.balanceOf(address).call()
+
+        threads = [threading.Thread(target=read, args=(a,)) for a in self.addresses]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        return results
+
+    def test_concurrent_calls_are_batched(self):
+        pool = self.pool(batch_size=10, linger=1)
+        results = self.read_concurrently(pool)
+
+        self.assertEqual({a: balance(a) for a in self.addresses}, results)
+        self.assertEqual([["eth_call"] * 10, ["eth_call"] * 10], FakeNode.batches)
+
+        metrics = pool.metrics()["rpc"]["eth"]
+        self.assertEqual(2, metrics["batches"])
+        self.assertEqual(20, metrics["batched"])
+        self.assertEqual(0, metrics["errors"])
+        self.assertGreater(metrics["avg_latency_ms"], 0)
+
+    def test_a_lone_request_is_sent_on_its_own(self):
+        pool = self.pool(linger=0.01)
+        token = pool.contract("eth", TOKEN, self.abi)
+
+        self.assertEqual(balance(self.addresses[0]), token.functions.balanceOf(self.addresses[0]).call())
+        self.assertEqual([], FakeNode.batches)
+
+    def test_batching_can_be_turned_off(self):
+        pool = self.pool(batch_size=1)
+        self.read_concurrently(pool)
+
+        self.assertEqual([], FakeNode.batches)
+        self.assertEqual(20, len([c for c in FakeNode.calls if c[0] == TOKEN.lower()]))
+
+    def test_requests_are_rate_limited(self):
+        pool = self.pool(requests_per_second={"eth": 20})
+        w3 = pool.web3("eth")
+
+        started = time.monotonic()
+        for _ in range(30):
+            w3.eth.block_number
+
+        # the first 20 requests are a burst, the other 10 are spread out at 20 a second
+        self.assertGreaterEqual(time.monotonic() - started, 0.45)
+        self.assertEqual(30, pool.metrics()["rpc"]["eth"]["posts"])
+
+    def test_endpoints_share_a_rate_limiter(self):
+        self.assertIs(get_rate_limiter(self.endpoint, 5), get_rate_limiter(self.endpoint, 50))
+        self.assertIsNone(get_rate_limiter(self.endpoint + "/other", None))
+
+    def test_rate_limiter_bursts(self):
+        limiter = RateLimiter(10, burst=5)
+
+        started = time.monotonic()
+        for _ in range(5):
+            limiter.acquire()
+        self.assertLess(time.monotonic() - started, 0.05)
+
+        limiter.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
@@ -0,0 +1,122 @@
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+
+from web3 import Web3
+
+from chain.client_pool import ChainClientPool
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+TOKEN = '0xC0F9bD5Fa5698B6505F643900FFA515Ea5dF54A9'
+HOLDER = '0x95D9bED31423eb7d5B68511E0352Eae39a3CDD20'
+
+
+class FakeRpc(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    # balance (in wei) returned by each chain, by request path
+    balances = {"/eth": 10 ** 18, "/gno": 2 * 10 ** 18, "/arb1": 3 * 10 ** 18}
+    delay = {}
+    connections = set()
+    calls = []
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        FakeRpc.connections.add(self.client_address)
+        FakeRpc.calls.append((self.path, request["method"]))
+
+        if request["method"] == "eth_call":
+            time.sleep(self.delay.get(self.path, 0))
+
+        if self.path not in self.balances:
+            self.send_response(500)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        result = "0x" + self.balances[self.path].to_bytes(32, "big").hex()
+        body = json.dumps({"jsonrpc": "2.0", "id": request["id"], "result": result}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestChainClientPool(TestCase):
+
+    def setUp(self):
+        FakeRpc.delay = {}
+        FakeRpc.connections = set()
+        FakeRpc.calls = []
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeRpc)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        url = f"http://127.0.0.1:{self.server.server_port}"
+        self.pool = ChainClientPool(providers={"eth": f"{url}/eth", "gno": f"{url}/gno", "arb1": f"{url}/arb1",
+                                               "down": f"{url}/down"},
+                                    timeouts={"gno": 0.5})
+
+        with open(os.path.normpath(os.path.join(SCRIPT_DIR, "../contracts/donut_mainnet_abi.json")), 'r') as f:
+            self.abi = json.load(f)
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def tokens(self, *chains):
+        return {chain: (chain, TOKEN, self.abi) for chain in chains}
+
+    def test_balances(self):
+        balances, errors = self.pool.balances_of(HOLDER, self.tokens("eth", "gno", "arb1"))
+
+        self.assertEqual({}, errors)
+        self.assertEqual({"eth": 10 ** 18, "gno": 2 * 10 ** 18, "arb1": 3 * 10 ** 18}, balances)
+        self.assertEqual(1, Web3.from_wei(balances["eth"], "ether"))
+
+    def test_clients_and_contracts_are_reused(self):
+        for _ in range(5):
+            self.pool.balances_of(HOLDER, self.tokens("eth"))
+
+        self.assertIs(self.pool.web3("eth"), self.pool.web3("eth"))
+        self.assertIs(self.pool.contract("eth", TOKEN, self.abi), self.pool.contract("eth", TOKEN.lower(), None))
+        self.assertEqual(1, self.pool.metrics()['contracts'])
+
+        # sequential calls share a single kept-alive connection, whichever worker thread makes them
+        # the chain id is only looked up once
+        self.assertEqual([("/eth", "eth_chainId")] + [("/eth", "eth_call")] * 5, FakeRpc.calls)
+        self.assertEqual(1, len(FakeRpc.connections))
+
+    def test_calls_run_concurrently(self):
+        FakeRpc.delay = {"/eth": 0.3, "/arb1": 0.3}
+
+        started = time.monotonic()
+        balances, errors = self.pool.balances_of(HOLDER, self.tokens("eth", "arb1"))
+
+        self.assertEqual({}, errors)
+        self.assertLess(time.monotonic() - started, 0.55)
+
+    def test_partial_results(self):
+        FakeRpc.delay = {"/gno": 2}
+
+        started = time.monotonic()
+        balances, errors = self.pool.balances_of(HOLDER, self.tokens("eth", "gno", "arb1", "down"))
+
+        # gno is given up on after its own timeout, the failing chain does not fail the others
+        self.assertLess(time.monotonic() - started, 1.5)
+        self.assertEqual({"eth", "arb1"}, set(balances))
+        self.assertEqual({"gno", "down"}, set(errors))
+        self.assertEqual(2, self.pool.metrics()['failures'])
+
+    def test_unknown_chain(self):
+        with self.assertRaises(ValueError):
+            self.pool.web3("polygon")
@@ -0,0 +1,80 @@
+import json
+import os
+import re
+from unittest import TestCase
+
+from commands.command_approve import ApproveCommand
+from commands.command_dailypin import DailyPinCommand
+from commands.command_flair import FlairCommand
+from commands.command_pow import PostOfTheWeekCommand
+from commands.command_post import PostCommand
+from commands.command_register import RegisterCommand
+from commands.command_special_membership import SpecialMembershipCommand
+from commands.command_tip import TipCommand
+from commands.command_topics import TopicCommand
+from commands.dispatcher import CommandDispatcher
+
+
+def legacy_can_handle(command, comment):
+    # the per-command matching that was performed before the dispatcher existed
+    if isinstance(command, SpecialMembershipCommand):
+        return any(item.lower() in comment.lower() for item in command.command_text)
+
+    if isinstance(command.command_text, str):
+        return bool(re.search(f'{command.command_text.lower()}($|\\s)', comment.lower()))
+
+    for cmd in command.command_text:
+        cmd = cmd.replace('[', '\\[').replace(']', '\\]')
+        if re.search(f'{cmd.lower()}($|\\s)', comment.lower().replace('\\[', '[').replace('\\]', ']')):
+            return True
+
+    return False
+
+
+class TestCommandDispatcher(TestCase):
+
+    def setUp(self):
+        with open(os.path.normpath(os.path.join(os.path.dirname(__file__), "../config.json")), 'r') as f:
+            config = json.load(f)
+
+        self.commands = [cls(config, None) for cls in [TipCommand, RegisterCommand, ApproveCommand,
+                                                       SpecialMembershipCommand, FlairCommand,
+                                                       PostOfTheWeekCommand, PostCommand, TopicCommand,
+                                                       DailyPinCommand]]
+        self.dispatcher = CommandDispatcher(self.commands)
+
+    def test_matches_legacy_can_handle(self):
+        bodies = [
+            "!tip 10",
+            "!TIP 10 donut",
+            "great post !tip",
+            "!tip\n!register 0xabc",
+            "!tipping is fun",
+            "!tips",
+            "!register status",
+            "\\[AutoModApprove\\]",
+            "[AutoModApprove] please",
+            "!approve",
+            "!approved",
+            "look at this ![gif](giphy|abc)",
+            "https://giphy.com/xyz",
+            "!membership",
+            "!flair my new flair",
+            "!pow",
+            "!post status",
+            "!post",
+            "!topics",
+            "!dailypin",
+            "!dailypin\n\n!tip 1",
+            "nothing to see here",
+            "",
+        ]
+
+        for body in bodies:
+            expected = [c for c in self.commands if legacy_can_handle(c, body)]
+            self.assertEqual(expected, self.dispatcher.dispatch(body), body)
+            self.assertEqual(bool(expected), any(c.can_handle(body) for c in self.commands), body)
+
+    def test_multiple_commands_in_registration_order(self):
+        result = self.dispatcher.dispatch("!pow !tip 5 .gif")
+        self.assertEqual([TipCommand, SpecialMembershipCommand, PostOfTheWeekCommand], [type(c) for c in result])
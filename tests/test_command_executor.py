@@ -0,0 +1,115 @@
+import threading
+import time
+from unittest import TestCase
+
+from commands.executor import CommandExecutor
+
+
+class FakeComment:
+    def __init__(self, fullname, link_id):
+        self.fullname = fullname
+        self.link_id = link_id
+
+
+class RecordingCommand:
+    def __init__(self, delay=0.0, fail_on=None):
+        self.delay = delay
+        self.fail_on = fail_on
+        self.processed = []
+        self.lock = threading.Lock()
+
+    def process_comment(self, comment):
+        time.sleep(self.delay)
+        if comment.fullname == self.fail_on:
+            raise Exception("boom")
+
+        with self.lock:
+            self.processed.append(comment.fullname)
+
+
+class SlowCommand(RecordingCommand):
+    pass
+
+
+class RegisterCommand(RecordingCommand):
+    pass
+
+
+class TestCommandExecutor(TestCase):
+
+    def test_register_always_runs_on_one_worker(self):
+        executor = CommandExecutor({"default_workers": 4, "workers": {"RegisterCommand": 4}})
+        executor.submit(RegisterCommand(), FakeComment("t1_a", "t3_a"))
+        executor.submit(RecordingCommand(), FakeComment("t1_b", "t3_b"))
+
+        self.assertEqual(1, executor.metrics()["RegisterCommand"]["workers"])
+        self.assertEqual(4, executor.metrics()["RecordingCommand"]["workers"])
+        self.assertTrue(executor.shutdown(timeout=5))
+
+    def test_comments_on_a_submission_keep_their_order(self):
+        executor = CommandExecutor({"default_workers": 4})
+        command = RecordingCommand()
+
+        comments = [FakeComment(f"t1_{i}", f"t3_{i % 3}") for i in range(60)]
+        for comment in comments:
+            executor.submit(command, comment)
+
+        self.assertTrue(executor.shutdown(timeout=5))
+        self.assertEqual(60, len(command.processed))
+
+        for submission in ["t3_0", "t3_1", "t3_2"]:
+            expected = [c.fullname for c in comments if c.link_id == submission]
+            self.assertEqual(expected, [f for f in command.processed if f in expected])
+
+    def test_slow_command_does_not_block_other_commands(self):
+        executor = CommandExecutor()
+        slow = SlowCommand(delay=0.5)
+        fast = RecordingCommand()
+
+        executor.submit(slow, FakeComment("t1_slow", "t3_a"))
+        executor.submit(fast, FakeComment("t1_fast", "t3_a"))
+
+        time.sleep(0.2)
+        self.assertEqual(["t1_fast"], fast.processed)
+        self.assertEqual([], slow.processed)
+        executor.shutdown(timeout=5)
+
+    def test_shutdown_drains_queued_work(self):
+        executor = CommandExecutor({"queue_size": 2})
+        command = RecordingCommand(delay=0.05)
+
+        for i in range(5):
+            executor.submit(command, FakeComment(f"t1_{i}", "t3_a"))
+
+        self.assertTrue(executor.shutdown())
+        self.assertEqual([f"t1_{i}" for i in range(5)], command.processed)
+
+        with self.assertRaises(RuntimeError):
+            executor.submit(command, FakeComment("t1_late", "t3_a"))
+
+    def test_full_queue_blocks_submit(self):
+        executor = CommandExecutor({"queue_size": 1})
+        command = RecordingCommand(delay=0.2)
+
+        started = time.perf_counter()
+        for i in range(3):
+            executor.submit(command, FakeComment(f"t1_{i}", "t3_a"))
+
+        # one comment running, one queued, the third has to wait for the first to finish
+        self.assertGreaterEqual(time.perf_counter() - started, 0.15)
+        executor.shutdown()
+        self.assertGreaterEqual(executor.metrics()["RecordingCommand"]["backpressure"], 1)
+
+    def test_metrics(self):
+        executor = CommandExecutor({"workers": {"RecordingCommand": 2}})
+        command = RecordingCommand(fail_on="t1_1")
+
+        for i in range(3):
+            executor.submit(command, FakeComment(f"t1_{i}", f"t3_{i}"))
+        executor.shutdown()
+
+        metrics = executor.metrics()["RecordingCommand"]
+        self.assertEqual(2, metrics["workers"])
+        self.assertEqual(0, metrics["queue_depth"])
+        self.assertEqual(3, metrics["processed"])
+        self.assertEqual(1, metrics["errors"])
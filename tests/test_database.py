@@ -0,0 +1,70 @@
+import threading
+from unittest import TestCase
+
+from database import connection, database
+from models.offchaintip import OffchainTip
+from tests.scratch_db import create_scratch_db
+
+
+class TestDatabase(TestCase):
+
+    def setUp(self):
+        self.original_path = connection.DB_PATH
+        create_scratch_db()
+
+    def tearDown(self):
+        connection.close_connection()
+        connection.DB_PATH = self.original_path
+
+    def test_connection_is_reused_per_thread(self):
+        db = connection.get_connection()
+        self.assertIs(db, connection.get_connection())
+        self.assertEqual('wal', db.execute("PRAGMA journal_mode;").fetchone()[0])
+
+        other = []
+        thread = threading.Thread(target=lambda: other.append(connection.get_connection()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(db, other[0])
+
+    def test_helpers_return_dict_rows(self):
+        database.insert_or_update_address("donut_user", "0xabc", "t1_abc")
+        user = database.get_user_by_name("DONUT_USER")
+        self.assertEqual("0xabc", user["address"])
+
+        database.set_processed_content("t1_abc", "command_tip")
+        self.assertIsNotNone(database.has_processed_content("t1_abc", "command_tip"))
+        self.assertIsNone(database.has_processed_content("t1_abc", "command_register"))
+
+    def test_faucet_eligible_matches_the_view(self):
+        database.insert_or_update_address("Faucet_User", "0xabc", "t1_abc")
+        database.insert_or_update_address("recent_user", "0xdef", "t1_def")
+
+        with connection.get_connection() as db:
+            db.execute("insert into faucet (username, address, direction, amount, tx_hash, block, created_date) "
+                       "values ('faucet_user', '0xabc', 'OUTBOUND', 1, '0x1', 1, datetime('now', '-40 days'))")
+            db.execute("insert into faucet (username, address, direction, amount, tx_hash, block, created_date) "
+                       "values ('recent_user', '0xdef', 'OUTBOUND', 1, '0x2', 2, datetime('now', 'localtime'))")
+
+        view = connection.dict_cursor(connection.get_connection())
+        for user in ["faucet_user", "recent_user", "nobody"]:
+            expected = view.execute("select * from view_faucet_can_request where username = ?", [user]).fetchone()
+            self.assertEqual(expected, database.get_faucet_eligible(user), user)
+
+        self.assertIsNotNone(database.get_faucet_eligible("FAUCET_USER"))
+        self.assertIsNone(database.get_faucet_eligible("recent_user"))
+
+    def test_process_earn2tips_is_atomic(self):
+        tip = OffchainTip("sender", "recipient", 1, 0.5, "donut", "t1_tip", "t1_parent", "abc", "ethtrader", True, "")
+        self.assertTrue(database.process_earn2tips([tip], "command_tip"))
+        self.assertIsNotNone(database.has_processed_content("t1_tip", "command_tip"))
+
+        # the comment was processed already, its tips are not saved twice
+        self.assertFalse(database.process_earn2tips([tip], "command_tip"))
+
+        db = connection.get_connection()
+        db.execute("CREATE TRIGGER fail_history BEFORE INSERT ON history BEGIN SELECT RAISE(ABORT, 'fail'); END;")
+
+        tip = OffchainTip("sender", "recipient", 1, 0.5, "donut", "t1_tip2", "t1_parent", "abc", "ethtrader", True, "")
+        self.assertFalse(database.process_earn2tips([tip], "command_tip"))
+        self.assertEqual(1, db.execute("select count(*) from earn2tip").fetchone()[0])
@@ -0,0 +1,176 @@
+import threading
+from unittest import TestCase
+
+from database import connection, database
+from events.event_bus import EventBus, COMMENT, SUBMISSION
+from tests.scratch_db import create_scratch_db
+
+
+class FakeItem:
+    def __init__(self, fullname, created_utc):
+        self.fullname = fullname
+        self.created_utc = created_utc
+
+
+class FakeStream:
+    def __init__(self, listings):
+        self.listings = listings
+        self.requests = {COMMENT: 0, SUBMISSION: 0}
+
+    def _stream(self, kind):
+        # like praw with pause_after=-1: every request yields its items (oldest first) and then None
+        while True:
+            self.requests[kind] += 1
+            for item in self.listings[kind]:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+            yield None
+
+    def comments(self, pause_after=None):
+        return self._stream(COMMENT)
+
+    def submissions(self, pause_after=None):
+        return self._stream(SUBMISSION)
+
+
+class FakeReddit:
+    def __init__(self, listings):
+        self.stream = FakeStream(listings)
+
+    def subreddit(self, subs):
+        return self
+
+
+class Recorder:
+    def __init__(self):
+        self.items = []
+        self.lock = threading.Lock()
+
+    def __call__(self, item):
+        with self.lock:
+            self.items.append(item.fullname)
+
+
+class TestEventBus(TestCase):
+
+    def setUp(self):
+        self.original_path = connection.DB_PATH
+        create_scratch_db()
+
+        self.listings = {COMMENT: [FakeItem("t1_a", 100), FakeItem("t1_b", 101)],
+                         SUBMISSION: [FakeItem("t3_a", 100)]}
+
+    def tearDown(self):
+        connection.close_connection()
+        connection.DB_PATH = self.original_path
+
+    def build_bus(self):
+        bus = EventBus(FakeReddit(self.listings), "ethtrader")
+        recorders = {"commands": Recorder(), "posts": Recorder(), "flair": Recorder()}
+        bus.subscribe("commands", recorders["commands"], kinds=[COMMENT])
+        bus.subscribe("posts", recorders["posts"], kinds=[SUBMISSION], skip_backlog=True)
+        bus.subscribe("flair", recorders["flair"])
+        return bus, recorders
+
+    def test_fan_out_and_dedupe(self):
+        bus, recorders = self.build_bus()
+
+        self.assertEqual(3, bus.poll_once())
+
+        # the next poll returns the same listing plus one new comment
+        self.listings[COMMENT].append(FakeItem("t1_c", 102))
+        self.listings[SUBMISSION].append(FakeItem("t3_b", 103))
+        self.assertEqual(2, bus.poll_once())
+        bus.shutdown()
+
+        self.assertEqual(["t1_a", "t1_b", "t1_c"], recorders["commands"].items)
+        self.assertEqual(["t3_b"], recorders["posts"].items)
+        self.assertCountEqual(["t1_a", "t1_b", "t1_c", "t3_a", "t3_b"], recorders["flair"].items)
+
+        # one request per listing per poll
+        self.assertEqual({COMMENT: 2, SUBMISSION: 2}, bus.reddit.stream.requests)
+        self.assertEqual(3, bus.duplicates)
+
+    def test_restart_does_not_replay(self):
+        bus, _ = self.build_bus()
+        bus.poll_once()
+        bus.shutdown()
+
+        self.assertIn('"t1_b"', database.get_setting("event_bus_comment_hwm"))
+
+        self.listings[COMMENT].append(FakeItem("t1_c", 101))
+        restarted, recorders = self.build_bus()
+        self.assertEqual(1, restarted.poll_once())
+        restarted.shutdown()
+
+        self.assertEqual(["t1_c"], recorders["commands"].items)
+        self.assertEqual([], recorders["flair"].items[1:])
+
+        # with a high water mark, new submissions are no longer treated as backlog
+        self.listings[SUBMISSION].append(FakeItem("t3_b", 200))
+        restarted, recorders = self.build_bus()
+        restarted.poll_once()
+        restarted.shutdown()
+        self.assertEqual(["t3_b"], recorders["posts"].items)
+
+    def test_unhandled_items_are_replayed_after_a_crash(self):
+        handled_a = threading.Event()
+        release = threading.Event()
+
+        def handler(item):
+            if item.fullname == "t1_a":
+                handled_a.set()
+            else:
+                release.wait(5)
+
+        bus = EventBus(FakeReddit(self.listings), "ethtrader")
+        bus.subscribe("commands", handler, kinds=[COMMENT])
+        bus.poll_once()
+        self.assertTrue(handled_a.wait(5))
+        bus.poll_once()
+
+        # t1_b is still being handled when the process dies, the saved mark stops before it
+        saved = database.get_setting("event_bus_comment_hwm")
+        self.assertIn('"t1_a"', saved)
+        self.assertNotIn('"t1_b"', saved)
+
+        restarted, recorders = self.build_bus()
+        self.assertEqual(1, restarted.poll_once())
+        restarted.shutdown()
+        release.set()
+
+        self.assertEqual(["t1_b"], recorders["commands"].items)
+
+    def test_stream_error_does_not_restart_the_backlog(self):
+        bus, recorders = self.build_bus()
+        bus.poll_once()
+
+        # the first run has no high water mark, the request fails after a new submission
+        self.listings[SUBMISSION] += [FakeItem("t3_b", 103), ConnectionError("reset by peer")]
+        with self.assertRaises(ConnectionError):
+            bus.poll_once()
+
+        # the recreated stream's first batch is not the backlog
+        self.listings[SUBMISSION][-1] = FakeItem("t3_c", 104)
+        self.assertEqual(1, bus.poll_once())
+        bus.shutdown()
+
+        self.assertEqual(["t3_b", "t3_c"], recorders["posts"].items)
+
+    def test_late_items_are_published(self):
+        bus, recorders = self.build_bus()
+        bus.poll_once()
+
+        # an item older than the newest one shows up late (e.g. approved out of the spam filter)
+        self.listings[COMMENT].append(FakeItem("t1_late", 50))
+        self.assertEqual(1, bus.poll_once())
+        bus.shutdown()
+
+        self.assertEqual(["t1_a", "t1_b", "t1_late"], recorders["commands"].items)
+
+    def test_settings(self):
+        self.assertIsNone(database.get_setting("missing"))
+        database.set_setting("a_setting", "1")
+        database.set_setting("a_setting", "2")
+        self.assertEqual("2", database.get_setting("a_setting"))
@@ -0,0 +1,196 @@
+import json
+import os
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+from eth_utils.abi import event_abi_to_log_topic
+
+from chain.client_pool import ChainClientPool
+from database import connection, database
+from flair.scheduler import FlairScheduler, TransferWatcher, UNREGISTERED, flair_hash
+from tests.fake_node import FakeNode, start_fake_node, transfer_log
+from tests.scratch_db import create_scratch_db
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+TOKEN = '0xF42e2B8bc2aF8B110b65be98dB1321B1ab8D44f5'
+
+
+class FakeWatcher:
+    chain = "arb1"
+
+    def __init__(self):
+        self.changed = set()
+
+    def changed_addresses(self):
+        changed, self.changed = self.changed, set()
+        return changed
+
+
+class TestFlairScheduler(TestCase):
+
+    def setUp(self):
+        self.original_path = connection.DB_PATH
+        create_scratch_db()
+
+        with connection.get_connection() as db:
+            db.execute("insert into users (username, address) values ('alice', '0xAAAA')")
+            db.execute("insert into users (username, address) values ('bob', '0xBBBB')")
+
+        self.balances = {"alice": 10, "bob": 20}
+        self.special = set()
+        self.rendered = []
+        self.applied = []
+        self.watcher = FakeWatcher()
+
+        self.scheduler = FlairScheduler(self.render, self.apply, [self.watcher],
+                                        is_special_member=lambda user, community: user.lower() in self.special)
+
+    def tearDown(self):
+        connection.close_connection()
+        connection.DB_PATH = self.original_path
+
+    def render(self, user, state, community, special_member):
+        # the way flair-bot renders: a special member's flair is the saved text, behind the membership icon
+        self.rendered.append(user)
+        if special_member and state["custom_flair"]:
+            return f":sm: {state['custom_flair'].replace(':sm:', '').strip()}"
+        return f"{':sm: ' if special_member else ''}:donut: {self.balances[user.lower()]}"
+
+    def apply(self, user, community, text):
+        # saves the hash, as the FlairWriter does once the flair is set
+        self.applied.append((user, text))
+        database.save_flairs([[user, flair_hash(text), datetime.now(), text]])
+
+    def test_active_users_cost_nothing_until_something_changes(self):
+        for _ in range(5):
+            self.scheduler.seen("alice", "EthTrader")
+        self.scheduler.run_once()
+
+        self.assertEqual(["alice"], self.rendered)
+        self.assertEqual([("alice", ":donut: 10")], self.applied)
+        self.assertEqual(flair_hash(":donut: 10"), database.get_flair_states(["alice"])[0]["hash"])
+
+        for _ in range(5):
+            self.scheduler.seen("alice", "ethtrader")
+        self.scheduler.run_once()
+        self.assertEqual(["alice"], self.rendered)
+
+        # a transfer to the address
+        self.balances["alice"] = 15
+        self.watcher.changed = {"0xaaaa"}
+        self.scheduler.run_once()
+
+        self.assertEqual(["alice", "alice"], self.rendered)
+        self.assertEqual(("alice", ":donut: 15"), self.applied[-1])
+
+    def test_unchanged_flairs_are_not_applied(self):
+        self.scheduler.seen("bob", "ethtrader")
+        self.scheduler.run_once()
+
+        self.watcher.changed = {"0xbbbb"}
+        self.scheduler.run_once()
+
+        self.assertEqual(["bob", "bob"], self.rendered)
+        self.assertEqual([("bob", ":donut: 20")], self.applied)
+        self.assertEqual(1, self.scheduler.stats()["unchanged"])
+
+    def test_membership_and_custom_flair_changes(self):
+        self.scheduler.seen("alice", "ethtrader")
+        self.scheduler.run_once()
+
+        self.special.add("alice")
+        self.scheduler.run_once()
+        self.assertEqual(("alice", ":sm: :donut: 10"), self.applied[-1])
+
+        # !flair runs in another process and only writes the database
+        database.set_custom_flair("alice", ":sm: hodl")
+        self.scheduler.run_once()
+        self.assertEqual(("alice", ":sm: hodl"), self.applied[-1])
+
+        self.scheduler.run_once()
+        self.assertEqual(3, len(self.applied))
+
+    def test_recent_flairs_are_not_recomputed_after_a_restart(self):
+        database.save_flairs([["alice", flair_hash(":donut: 10"), datetime.now() - timedelta(minutes=5),
+                               ":donut: 10"]])
+
+        self.scheduler.seen("alice", "ethtrader")
+        self.scheduler.run_once()
+
+        self.assertEqual([], self.rendered)
+        self.assertEqual([], self.applied)
+
+    def test_unregistered_users(self):
+        self.scheduler.seen("carol", "ethtrader")
+        self.scheduler.run_once()
+        self.scheduler.run_once()
+
+        self.assertEqual([("carol", UNREGISTERED)], self.applied)
+
+        with connection.get_connection() as db:
+            db.execute("insert into users (username, address) values ('carol', '0xCCCC')")
+        self.balances["carol"] = 1
+        self.scheduler.run_once()
+
+        self.assertEqual(("carol", ":donut: 1"), self.applied[-1])
+
+    def test_flairs_that_were_not_applied_are_recomputed(self):
+        self.scheduler.seen("alice", "ethtrader")
+        self.scheduler.run_once()
+
+        # the writer gave up on it, the flair on reddit is unknown
+        self.scheduler.mark_dirty("Alice", "EthTrader")
+        self.scheduler.run_once()
+
+        self.assertEqual([("alice", ":donut: 10"), ("alice", ":donut: 10")], self.applied)
+
+    def test_render_failures_are_retried(self):
+        render = self.scheduler.render
+        self.scheduler.render = lambda *args: None
+
+        self.scheduler.seen("alice", "ethtrader")
+        self.scheduler.run_once()
+        self.assertEqual([], self.applied)
+
+        self.scheduler.render = render
+        self.scheduler.run_once()
+        self.assertEqual([("alice", ":donut: 10")], self.applied)
+
+
+class TestTransferWatcher(TestCase):
+
+    def setUp(self):
+        self.original_path = connection.DB_PATH
+        create_scratch_db()
+
+        FakeNode.reset()
+        self.server = start_fake_node()
+        self.pool = ChainClientPool(providers={"arb1": f"http://127.0.0.1:{self.server.server_port}"})
+
+        with open(os.path.normpath(os.path.join(SCRIPT_DIR, "../contracts/donut_mainnet_abi.json")), 'r') as f:
+            self.token = self.pool.contract("arb1", TOKEN, json.load(f))
+
+        self.transfer = event_abi_to_log_topic(self.token.events.Transfer().abi)
+        self.watcher = TransferWatcher("arb1", self.pool.web3("arb1"), [self.token])
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+        connection.close_connection()
+        connection.DB_PATH = self.original_path
+
+    def test_changed_addresses_since_the_cursor(self):
+        FakeNode.logs = [transfer_log(TOKEN, 990, "0x" + "01" * 20, "0x" + "02" * 20, self.transfer)]
+
+        # the first run only starts the cursor
+        self.assertEqual(set(), self.watcher.changed_addresses())
+        self.assertEqual("1000", database.get_setting("flair_transfers_arb1_block"))
+
+        FakeNode.block_number = 1100
+        FakeNode.logs.append(transfer_log(TOKEN, 1050, "0x" + "AB" * 20, "0x" + "03" * 20, self.transfer))
+
+        self.assertEqual({"0x" + "ab" * 20, "0x" + "03" * 20}, self.watcher.changed_addresses())
+        self.assertEqual(set(), self.watcher.changed_addresses())
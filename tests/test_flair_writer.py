@@ -0,0 +1,138 @@
+from unittest import TestCase
+
+from bots.loader import load_bot
+from database import connection, database
+from flair.scheduler import FlairScheduler, flair_hash
+from flair.writer import FlairWriter
+from tests.scratch_db import create_scratch_db
+
+TEMPLATE = "da1b88dc-8e17-11ee-8d85-86deef0eb333"
+
+
+class FakeFlair:
+
+    def __init__(self, reddit, community):
+        self.reddit = reddit
+        self.community = community
+
+    def update(self, flair_list):
+        self.reddit.updates.append((self.community, flair_list))
+        if self.reddit.down:
+            raise ConnectionError("reddit is down")
+        return [{"ok": item["user"] not in self.reddit.rejected, "errors": {}} for item in flair_list]
+
+    def set(self, user, text, flair_template_id):
+        self.reddit.sets.append((self.community, user, text, flair_template_id))
+
+
+class FakeReddit:
+
+    def __init__(self):
+        self.updates = []
+        self.sets = []
+        self.rejected = set()
+        self.down = False
+
+    def subreddit(self, community):
+        return type("FakeSubreddit", (), {"flair": FakeFlair(self, community)})()
+
+
+class TestFlairWriter(TestCase):
+
+    def setUp(self):
+        self.original_path = connection.DB_PATH
+        create_scratch_db()
+
+        with connection.get_connection() as db:
+            db.executemany("insert into users (username, address) values (?, ?)",
+                           [[f"user{i}", f"0x{i:040x}"] for i in range(250)])
+
+        self.reddit = FakeReddit()
+        self.failures = []
+        self.writer = FlairWriter(self.reddit, css_classes={TEMPLATE: "default"}, max_attempts=2,
+                                  on_failure=lambda user, community: self.failures.append(user))
+
+    def tearDown(self):
+        connection.close_connection()
+        connection.DB_PATH = self.original_path
+
+    def test_changes_are_sent_100_per_request(self):
+        for i in range(250):
+            self.writer.enqueue(f"user{i}", "ethtrader", f":donut: {i}", TEMPLATE)
+
+        self.assertEqual(250, self.writer.stats()["queue_depth"])
+        self.assertEqual(250, self.writer.flush())
+
+        self.assertEqual([100, 100, 50], [len(flair_list) for _, flair_list in self.reddit.updates])
+        self.assertEqual({"user": "user7", "flair_text": ":donut: 7", "flair_css_class": "default"},
+                         self.reddit.updates[0][1][7])
+
+        stats = self.writer.stats()
+        self.assertEqual((250, 3, 0), (stats["flushed"], stats["requests"], stats["queue_depth"]))
+        self.assertEqual((250, 0), (stats["bulk"], stats["single"]))
+        self.assertEqual(flair_hash(":donut: 7"), database.get_flair_states(["user7"])[0]["hash"])
+
+    def test_the_latest_change_wins(self):
+        self.writer.enqueue("user1", "ethtrader", "old", TEMPLATE)
+        self.writer.enqueue("user1", "EthTrader", "new", TEMPLATE)
+        self.writer.flush()
+
+        self.assertEqual([("ethtrader", [{"user": "user1", "flair_text": "new", "flair_css_class": "default"}])],
+                         self.reddit.updates)
+
+    def test_failed_items_are_retried_then_given_up(self):
+        self.reddit.rejected = {"user2"}
+        self.writer.enqueue("user1", "ethtrader", "one", TEMPLATE)
+        self.writer.enqueue("user2", "ethtrader", "two", TEMPLATE)
+
+        self.assertEqual(1, self.writer.flush())
+        self.assertEqual(1, self.writer.stats()["queue_depth"])
+        self.assertIsNone(database.get_flair_states(["user2"])[0]["hash"])
+
+        self.assertEqual(0, self.writer.flush())
+        self.assertEqual(["user2"], self.failures)
+        self.assertEqual((1, 1, 0), (self.writer.stats()["retried"], self.writer.stats()["dropped"],
+                                     self.writer.stats()["queue_depth"]))
+
+    def test_a_failed_request_is_retried(self):
+        self.reddit.down = True
+        self.writer.enqueue("user1", "ethtrader", "one", TEMPLATE)
+        self.writer.flush()
+
+        self.reddit.down = False
+        self.assertEqual(1, self.writer.flush())
+
+    def test_templates_without_a_css_class_are_set_one_by_one(self):
+        self.writer.enqueue("user1", "ethtrader", "one", "another-template")
+        self.writer.enqueue("not-registered", "ethtrader", "Not Registered", "another-template")
+        self.assertEqual(2, self.writer.flush())
+
+        self.assertEqual([], self.reddit.updates)
+        self.assertEqual([("ethtrader", "user1", "one", "another-template"),
+                          ("ethtrader", "not-registered", "Not Registered", "another-template")], self.reddit.sets)
+        self.assertEqual((0, 2, 2), (self.writer.stats()["bulk"], self.writer.stats()["single"],
+                                     self.writer.stats()["requests"]))
+
+    def test_stop_flushes(self):
+        self.writer.flush_interval = 60
+        self.writer.start()
+        self.writer.enqueue("user1", "ethtrader", "one", TEMPLATE)
+        self.writer.stop(timeout=5)
+
+        self.assertEqual(1, self.writer.stats()["flushed"])
+
+    def test_flair_bot_shutdown_stops_the_scheduler_and_flushes(self):
+        flair_bot = load_bot("flair-bot")
+        flair_bot.writer = self.writer
+        flair_bot.scheduler = FlairScheduler(lambda *args: "one", self.writer.enqueue, interval=60)
+
+        self.writer.flush_interval = 60
+        flair_bot.scheduler.start()
+        self.writer.start()
+        self.writer.enqueue("user1", "ethtrader", "one", TEMPLATE)
+
+        flair_bot.shutdown()
+
+        self.assertFalse(flair_bot.scheduler._thread.is_alive())
+        self.assertFalse(self.writer._thread.is_alive())
+        self.assertEqual(1, self.writer.stats()["flushed"])
@@ -0,0 +1,95 @@
+import threading
+from unittest import TestCase
+
+from liquidity.graph_pager import PositionPager
+from liquidity.positions import Leaderboard, leaderboard
+
+POOL = "0x1a1c8e6c8a3b4a5d5e6f708192a3b4c5d6e7f809"
+MULTISIG = "0x439cee4cc4ecbd75dc08d9a17e92bddcc11cdb8c"
+
+
+def graph_position(n):
+    return {"id": str(n), "owner": f"0x{n % 7:040x}", "liquidity": str(n * 10 ** 18 if n % 4 else 0),
+            "tickLower": {"tickIdx": str(-1000 - n)}, "tickUpper": {"tickIdx": str(1000 + n)}}
+
+
+class FakeSession:
+    """
+    Answers the positions query like the subgraph: ordered by id (a string), after $last_id.
+    """
+
+    def __init__(self, positions, failures=0):
+        self.positions = sorted(positions, key=lambda p: p["id"])
+        self.failures = failures
+        self.requests = []
+        self.requested = threading.Condition()
+
+    def execute(self, document, variable_values):
+        with self.requested:
+            self.requests.append(dict(variable_values))
+            self.requested.notify_all()
+
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("the graph is down")
+
+        after = [p for p in self.positions if p["id"] > variable_values["last_id"]]
+        return {"positions": after[:variable_values["first"]]}
+
+
+class TestPositionPager(TestCase):
+
+    def test_pages_follow_the_last_id(self):
+        session = FakeSession([graph_position(n) for n in range(1, 251)])
+        pager = PositionPager(session, POOL, page_size=100)
+
+        ids = [p["id"] for p in pager]
+
+        self.assertEqual(sorted(str(n) for n in range(1, 251)), ids)
+        self.assertEqual(["", ids[99], ids[199]], [r["last_id"] for r in session.requests])
+        self.assertEqual((3, 250, ids[-1]), (pager.pages, pager.positions, pager.last_id))
+
+    def test_a_full_last_page_ends_on_an_empty_one(self):
+        session = FakeSession([graph_position(n) for n in range(1, 201)])
+        self.assertEqual(200, len(list(PositionPager(session, POOL, page_size=100))))
+        self.assertEqual(3, len(session.requests))
+
+    def test_the_next_page_is_fetched_while_a_page_is_processed(self):
+        session = FakeSession([graph_position(n) for n in range(1, 251)])
+        pages = PositionPager(session, POOL, page_size=100).iter_pages()
+
+        next(pages)
+        with session.requested:
+            self.assertTrue(session.requested.wait_for(lambda: len(session.requests) == 2, timeout=5))
+
+    def test_a_failed_page_is_retried_from_the_checkpoint(self):
+        session = FakeSession([graph_position(n) for n in range(1, 151)])
+        pager = PositionPager(session, POOL, page_size=100, backoff=0)
+
+        pages = pager.iter_pages()
+        first = next(pages)
+        session.failures = 2
+        second = next(pages)
+
+        self.assertEqual(150, len(first) + len(second))
+        self.assertEqual([first[-1]["id"]] * 3, [r["last_id"] for r in session.requests[1:]])
+
+    def test_resumes_after_a_position(self):
+        session = FakeSession([graph_position(n) for n in range(1, 21)])
+        pager = PositionPager(session, POOL, page_size=100, last_id="5")
+
+        self.assertEqual(sorted(str(n) for n in range(1, 21) if str(n) > "5"), [p["id"] for p in pager])
+
+    def test_streamed_leaderboard_matches_a_single_pass(self):
+        positions = [graph_position(n) for n in range(1, 301)]
+        pager = PositionPager(FakeSession(positions), POOL, page_size=64)
+
+        board = Leaderboard(0, 2 ** 96, {}, MULTISIG)
+        for page in pager.iter_pages():
+            board.add(page)
+
+        expected = leaderboard(list(PositionPager(FakeSession(positions), POOL)), 0, 2 ** 96, {}, MULTISIG)
+        self.assertEqual([(o["owner"], o["liquidity"]) for o in expected],
+                         [(o["owner"], o["liquidity"]) for o in board.results()])
+        for streamed, single in zip(board.results(), expected):
+            self.assertAlmostEqual(single["donut_in_lp"], streamed["donut_in_lp"], delta=single["donut_in_lp"] * 1e-12)
@@ -0,0 +1,143 @@
+import random
+from unittest import TestCase
+
+from liquidity.amounts import (MAX_TICK, MIN_TICK, Q96, position_amounts, position_amounts_exact,
+                               sqrt_ratio_at_tick, tick_to_price)
+from liquidity.positions import leaderboard, pool_share_by_owner
+
+MULTISIG = '0x439ceE4cC4EcBD75DC08D9a17E92bDdCc11CDb8C'
+
+
+def scalar_amounts(liquidity, tick_lower, tick_upper, current_tick, current_sqrt_price):
+    """
+    The per position calculation build_liquidity_leaders_v2 used to do.
+    """
+    sa = tick_to_price(tick_lower / 2)
+    sb = tick_to_price(tick_upper / 2)
+
+    if tick_upper <= current_tick:
+        return 0, liquidity * (sb - sa)
+    elif tick_lower < current_tick < tick_upper:
+        return (liquidity * (sb - current_sqrt_price) / (current_sqrt_price * sb),
+                liquidity * (current_sqrt_price - sa))
+    else:
+        return liquidity * (sb - sa) / (sa * sb), 0
+
+
+class TestPositionAmounts(TestCase):
+
+    def test_matches_the_scalar_calculation(self):
+        rng = random.Random(42)
+        current_tick = -60_000
+        current_sqrt_price = tick_to_price(current_tick / 2)
+
+        ranges = []
+        for _ in range(500):
+            lower = rng.randrange(-120_000, 0)
+            ranges.append((rng.randrange(1, 10 ** 24), lower, lower + rng.randrange(1, 60_000)))
+
+        # a range ending at, starting at and straddling the current tick
+        ranges += [(10 ** 20, current_tick - 600, current_tick), (10 ** 20, current_tick, current_tick + 600),
+                   (10 ** 20, current_tick - 600, current_tick + 600)]
+
+        amount0, amount1 = position_amounts(*zip(*ranges), current_tick, current_sqrt_price)
+
+        for (liquidity, lower, upper), a0, a1 in zip(ranges, amount0, amount1):
+            expected0, expected1 = scalar_amounts(liquidity, lower, upper, current_tick, current_sqrt_price)
+            self.assertAlmostEqual(expected0, a0, delta=abs(expected0) * 1e-9)
+            self.assertAlmostEqual(expected1, a1, delta=abs(expected1) * 1e-9)
+
+
+class TestExactAmounts(TestCase):
+
+    def test_sqrt_ratio_at_tick_matches_tick_math(self):
+        # the bounds TickMath.sol defines
+        self.assertEqual(Q96, sqrt_ratio_at_tick(0))
+        self.assertEqual(4295128739, sqrt_ratio_at_tick(MIN_TICK))
+        self.assertEqual(1461446703485210103287273052203988822378723970342, sqrt_ratio_at_tick(MAX_TICK))
+
+        # every bit of the tick, against floating point
+        for tick in [2 ** bit for bit in range(20)] + [-2 ** bit for bit in range(20)]:
+            expected = tick_to_price(tick / 2) * Q96
+            self.assertAlmostEqual(expected, sqrt_ratio_at_tick(tick), delta=expected * 1e-9)
+
+        with self.assertRaises(ValueError):
+            sqrt_ratio_at_tick(MAX_TICK + 1)
+
+    def test_amounts_round_down(self):
+        # a range straddling the price: both amounts round down, the way burning the position would
+        amount0, amount1 = position_amounts_exact([10 ** 18], [-60], [60], Q96)
+
+        self.assertEqual((10 ** 18 << 96) * (sqrt_ratio_at_tick(60) - Q96) // sqrt_ratio_at_tick(60) // Q96,
+                         amount0[0])
+        self.assertEqual(10 ** 18 * (Q96 - sqrt_ratio_at_tick(-60)) // Q96, amount1[0])
+
+    def test_ranges_at_the_price(self):
+        sqrt_price = sqrt_ratio_at_tick(100)
+
+        # the price sits on the lower tick: only token0, on the upper tick: only token1
+        amount0, amount1 = position_amounts_exact([10 ** 18, 10 ** 18], [100, 0], [200, 100], sqrt_price)
+
+        self.assertGreater(amount0[0], 0)
+        self.assertEqual(0, amount1[0])
+        self.assertEqual(0, amount0[1])
+        self.assertGreater(amount1[1], 0)
+
+    def test_matches_floating_point(self):
+        rng = random.Random(7)
+        current_tick = -60_000
+        ranges = []
+        for _ in range(200):
+            lower = rng.randrange(-120_000, 0)
+            ranges.append((rng.randrange(10 ** 12, 10 ** 24), lower, lower + rng.randrange(1, 60_000)))
+
+        # keep the price off the range boundaries, where the two modes legitimately differ
+        sqrt_price_x96 = sqrt_ratio_at_tick(current_tick) + 1
+        exact0, exact1 = position_amounts_exact(*zip(*ranges), sqrt_price_x96)
+        float0, float1 = position_amounts(*zip(*ranges), current_tick, sqrt_price_x96 / Q96)
+
+        for e0, e1, f0, f1 in zip(exact0, exact1, float0, float1):
+            self.assertAlmostEqual(e0, f0, delta=max(e0 * 1e-8, 2))
+            self.assertAlmostEqual(e1, f1, delta=max(e1 * 1e-8, 2))
+
+
+class TestLeaderboard(TestCase):
+
+    def test_positions_are_summed_by_owner(self):
+        positions = [
+            {"id": 1, "owner": "0xAA", "liquidity": 100, "tick_lower": -100, "tick_upper": 100},
+            {"id": 2, "owner": "0xbb", "liquidity": 300, "tick_lower": -100, "tick_upper": 100},
+            {"id": 3, "owner": "0xaa", "liquidity": 50, "tick_lower": -100, "tick_upper": 100},
+            {"id": 4, "owner": None, "liquidity": 0, "tick_lower": -100, "tick_upper": 100},
+            {"id": 5, "owner": MULTISIG, "liquidity": 50, "tick_lower": -100, "tick_upper": 100},
+        ]
+
+        leaders = leaderboard(positions, 0, Q96, {"0xaa": "alice"}, MULTISIG.lower())
+
+        self.assertEqual([2, "1,3", 5], [leader["id"] for leader in leaders])
+        self.assertEqual([300, 150, 50], [leader["liquidity"] for leader in leaders])
+        self.assertEqual([None, "alice", "r/EthTrader Multi-Sig Wallet"], [leader["user"] for leader in leaders])
+        self.assertEqual([60.0, 30.0, 10.0], [leader["percent_of_pool"] for leader in leaders])
+
+        single = leaderboard(positions[1:2], 0, Q96, {}, MULTISIG)[0]
+        self.assertAlmostEqual(single["eth_in_lp"] * 150 / 300, leaders[1]["eth_in_lp"])
+        self.assertAlmostEqual(single["donut_in_lp"] * 150 / 300, leaders[1]["donut_in_lp"])
+
+    def test_exact_mode(self):
+        positions = [{"id": 1, "owner": "0xaa", "liquidity": 10 ** 20, "tick_lower": -600, "tick_upper": 600}]
+
+        exact = leaderboard(positions, 0, Q96, {}, MULTISIG, exact=True)[0]
+        floating = leaderboard(positions, 0, Q96, {}, MULTISIG)[0]
+
+        self.assertAlmostEqual(floating["eth_in_lp"], exact["eth_in_lp"], delta=1e-9)
+        self.assertAlmostEqual(floating["donut_in_lp"], exact["donut_in_lp"], delta=1e-9)
+
+    def test_pool_share_by_owner(self):
+        leaders = [{"owner": "0xAA", "percent_of_pool": 60.0}, {"owner": "0xbb", "percent_of_pool": 40.0}]
+
+        self.assertEqual({"0xaa": 60.0, "0xbb": 40.0}, pool_share_by_owner(leaders))
+        self.assertEqual({}, pool_share_by_owner(None))
+
+    def test_no_liquidity(self):
+        self.assertEqual([], leaderboard([{"id": 4, "owner": None, "liquidity": 0, "tick_lower": -1,
+                                           "tick_upper": 1}], 0, Q96, {}, MULTISIG))
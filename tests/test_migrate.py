@@ -0,0 +1,54 @@
+import sqlite3
+from unittest import TestCase
+
+from ad_hoc.setup import migrate
+from database import connection
+from tests.scratch_db import create_scratch_db
+
+
+class TestMigrate(TestCase):
+
+    def setUp(self):
+        self.original_path = connection.DB_PATH
+        self.db_path = create_scratch_db(migrated=False)
+
+    def tearDown(self):
+        connection.close_connection()
+        connection.DB_PATH = self.original_path
+
+    def get_schema_version(self):
+        with sqlite3.connect(self.db_path) as db:
+            return migrate.get_schema_version(db)
+
+    def test_migrate_records_schema_version(self):
+        latest = migrate.get_migrations()[-1][0]
+
+        self.assertEqual(0, self.get_schema_version())
+        self.assertEqual([v for v, _ in migrate.get_migrations()], migrate.migrate(self.db_path))
+        self.assertEqual(latest, self.get_schema_version())
+
+        with sqlite3.connect(self.db_path) as db:
+            indexes = [r[0] for r in db.execute("select name from sqlite_master where type = 'index';")]
+        self.assertIn("idx_history_content_id_command", indexes)
+
+    def test_migrate_is_idempotent(self):
+        migrate.migrate(self.db_path)
+        self.assertEqual([], migrate.migrate(self.db_path))
+
+        # re-applying over existing objects (e.g. a lost schema_version) must not fail
+        with sqlite3.connect(self.db_path) as db:
+            db.execute("delete from settings where setting = ?;", [migrate.SCHEMA_VERSION_SETTING])
+
+        self.assertEqual([v for v, _ in migrate.get_migrations()], migrate.migrate(self.db_path))
+
+    def test_failed_migration_is_rolled_back(self):
+        original = migrate.get_migrations
+        migrate.get_migrations = lambda: [(1, __file__)]
+
+        try:
+            with self.assertRaises(sqlite3.Error):
+                migrate.migrate(self.db_path)
+        finally:
+            migrate.get_migrations = original
+
+        self.assertEqual(0, self.get_schema_version())
@@ -0,0 +1,83 @@
+import json
+import os
+from unittest import TestCase
+
+from web3 import Web3
+
+from ad_hoc import build_user_weight
+from chain.client_pool import ChainClientPool
+from chain.multicall import Multicall
+from tests.fake_node import FakeNode, balance, start_fake_node
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+TOKEN = '0xC0F9bD5Fa5698B6505F643900FFA515Ea5dF54A9'
+
+
+class TestMulticall(TestCase):
+
+    def setUp(self):
+        self.server = start_fake_node()
+
+        self.pool = ChainClientPool(providers={"eth": f"http://127.0.0.1:{self.server.server_port}"})
+
+        with open(os.path.normpath(os.path.join(SCRIPT_DIR, "../contracts/donut_mainnet_abi.json")), 'r') as f:
+            self.token = self.pool.contract("eth", TOKEN, json.load(f))
+
+        self.addresses = [Web3.to_checksum_address(f"0x{i:040x}") for i in range(1, 1201)]
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_matches_individual_calls(self):
+        multicall = Multicall(self.pool.web3("eth"), batch_size=500)
+        balances = multicall.balances_of(self.token, self.addresses, 1234)
+
+        self.assertEqual({a: balance(a) for a in self.addresses}, balances)
+        for a in self.addresses[::100]:
+            self.assertEqual(self.token.functions.balanceOf(a).call(block_identifier=1234), balances[a])
+
+        # 1200 balances in three aggregate3 calls, all pinned to the block
+        self.assertEqual(3, multicall.aggregate_calls)
+        self.assertEqual(3 + 12, len(FakeNode.calls))
+        self.assertEqual({hex(1234)}, {block for _, block in FakeNode.calls})
+
+    def test_failed_sub_calls_are_retried_individually(self):
+        FakeNode.flaky = {self.addresses[3].lower(), self.addresses[700].lower()}
+
+        multicall = Multicall(self.pool.web3("eth"), batch_size=500, backoff=0)
+        balances = multicall.balances_of(self.token, self.addresses, 1234)
+
+        self.assertEqual(balance(self.addresses[3]), balances[self.addresses[3]])
+        self.assertEqual(balance(self.addresses[700]), balances[self.addresses[700]])
+        self.assertEqual(2, multicall.retried)
+
+        individual = [to for to, _ in FakeNode.calls if to == TOKEN.lower()]
+        self.assertEqual(2, len(individual))
+
+    def test_user_weight_matches_per_user_calculation(self):
+        build_user_weight.mainnet_multiplier = 2.0541832
+        build_user_weight.gno_multiplier = 0.9137
+
+        address = self.addresses[42]
+        sushi_lp = [{"owner": address.lower(), "tokens": "1500"}, {"owner": address, "tokens": "25"}]
+        balances = {"contrib": {address: 12_345 * 10 ** 18 + 1}, "donut_eth": {address: 10 ** 21 + 7},
+                    "staking_eth": {address: 3 * 10 ** 19 + 11}, "donut_gno": {address: 5 * 10 ** 20},
+                    "staking_gno": {address: 10 ** 18 + 3}, "donut_arb1": {address: 987 * 10 ** 17}}
+
+        # the calculation the script made with a balanceOf call per user
+        contrib = int(Web3.from_wei(balances["contrib"][address], "ether"))
+        eth = int(Web3.from_wei(balances["donut_eth"][address] +
+                                balances["staking_eth"][address] * build_user_weight.mainnet_multiplier, "ether"))
+        gno = int(Web3.from_wei(balances["donut_gno"][address] +
+                                balances["staking_gno"][address] * build_user_weight.gno_multiplier, "ether"))
+        arb = int(Web3.from_wei(balances["donut_arb1"][address], "ether") +
+                  sum([int(s["tokens"]) for s in sushi_lp if s["owner"].lower() == address.lower()]))
+
+        indexed_lp = {}
+        for s in sushi_lp:
+            indexed_lp[s["owner"].lower()] = indexed_lp.get(s["owner"].lower(), 0) + int(s["tokens"])
+
+        self.assertEqual((contrib, eth, gno, arb), build_user_weight.calc_user_weight(balances, address, indexed_lp))
@@ -0,0 +1,94 @@
+import json
+import os
+from unittest import TestCase
+
+from web3 import Web3
+
+from chain.client_pool import ChainClientPool
+from chain.multicall import Multicall
+from chain.position_scanner import PositionScanner
+from database import connection, database
+from tests.fake_node import FakeNode, position, start_fake_node
+from tests.scratch_db import create_scratch_db
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+NFT_MANAGER = '0xF0cBce1942A68BEB3d1b73F0dd86C8DCc363eF49'
+DONUT = '0xF42e2B8bc2aF8B110b65be98dB1321B1ab8D44f5'
+WETH = '0x82aF49447D8a07e3bd95BD0d56f35241523fBab1'
+USDC = '0xaf88d065e77c8cC2239327C5EDb3A432268e5831'
+
+
+def owner(n):
+    return Web3.to_checksum_address(f"0x{n:040x}".replace("0x0", "0xa", 1))
+
+
+class TestPositionScanner(TestCase):
+
+    def setUp(self):
+        self.server = start_fake_node()
+        self.pool = ChainClientPool(providers={"arb1": f"http://127.0.0.1:{self.server.server_port}"})
+
+        with open(os.path.normpath(os.path.join(SCRIPT_DIR, "../contracts/sushi_position_manager_abi.json")),
+                  'r') as f:
+            self.nft_contract = self.pool.contract("arb1", NFT_MANAGER, json.load(f))
+
+        self.multicall = Multicall(self.pool.web3("arb1"), batch_size=10, backoff=0)
+
+        # token ids 1 - 40 exist: every third is a weth/donut position, every fifth of those is empty, the rest are
+        # in another pool
+        for i in range(1, 41):
+            if i % 3 == 0:
+                FakeNode.positions[i] = position(WETH, DONUT, -1000 - i, 1000 + i, 0 if i % 5 == 0 else i * 10 ** 18)
+            else:
+                FakeNode.positions[i] = position(WETH, USDC, -10, 10, 10 ** 18)
+            FakeNode.owners[i] = owner(i)
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_scan(self):
+        positions = PositionScanner(self.multicall, self.nft_contract, workers=2).scan(range(1, 51), DONUT, 1234)
+
+        self.assertEqual(list(range(3, 41, 3)), [p["id"] for p in positions])
+        self.assertEqual({"id": 3, "owner": owner(3), "liquidity": 3 * 10 ** 18, "tick_lower": -1003,
+                          "tick_upper": 1003}, positions[0])
+
+        # empty positions are kept, but their owner is not looked up
+        self.assertEqual([15, 30], [p["id"] for p in positions if p["owner"] is None])
+
+        # 50 positions in five aggregate3 calls, the 11 owners in two, all at the same block
+        self.assertEqual(5 + 2, self.multicall.aggregate_calls)
+        self.assertEqual(0, self.multicall.retried)
+        self.assertEqual({hex(1234)}, {block for _, block in FakeNode.calls})
+
+    def test_missing_token_ids_are_skipped(self):
+        positions = PositionScanner(self.multicall, self.nft_contract).positions([39, 40, 41], 1234)
+
+        self.assertIsNone(positions[41])
+        self.assertEqual(DONUT.lower(), positions[39][3].lower())
+
+    def test_token_ids_are_scanned_once(self):
+        positions = PositionScanner(self.multicall, self.nft_contract).scan([3, 6, 3, 6], DONUT, 1234)
+
+        self.assertEqual([3, 6], [p["id"] for p in positions])
+
+
+class TestSaveLiquidityPositions(TestCase):
+
+    def setUp(self):
+        self.original_path = connection.DB_PATH
+        create_scratch_db()
+
+    def tearDown(self):
+        connection.close_connection()
+        connection.DB_PATH = self.original_path
+
+    def test_save(self):
+        database.save_liquidity_positions([3, 6], 40)
+        database.save_liquidity_positions([6, 9], 50)
+
+        self.assertEqual([3, 6, 9], database.get_liquidity_position_ids())
+        self.assertEqual(50, int(database.get_setting("liquidity_max_idx")))
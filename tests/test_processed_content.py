@@ -0,0 +1,81 @@
+from unittest import TestCase
+
+from database import connection, database
+from database.processed_content import ProcessedContentLedger
+from tests.scratch_db import create_scratch_db
+
+
+class TestProcessedContentLedger(TestCase):
+
+    def setUp(self):
+        self.original_path = connection.DB_PATH
+        create_scratch_db()
+
+        with connection.get_connection() as db:
+            db.execute("insert into history (content_id, command) values ('t1_old', 'command_tip')")
+
+        # no background flushes, the tests flush explicitly
+        self.ledger = ProcessedContentLedger(flush_size=3, flush_interval=3600)
+        self.ledger._start = lambda: None
+
+    def tearDown(self):
+        connection.close_connection()
+        connection.DB_PATH = self.original_path
+
+    def count_history(self):
+        return connection.get_connection().execute("select count(*) from history").fetchone()[0]
+
+    def test_unknown_content_is_answered_from_the_bloom_filter(self):
+        self.assertIsNone(self.ledger.has("t1_new", "command_tip"))
+        self.assertEqual(1, self.ledger.counters['negative'])
+        self.assertEqual(0, self.ledger.counters['queries'])
+
+        self.assertIsNotNone(self.ledger.has("t1_old", "command_tip"))
+        self.assertEqual(1, self.ledger.counters['queries'])
+
+        # the second lookup is served from the lru
+        self.assertIsNotNone(self.ledger.has("t1_old", "command_tip"))
+        self.assertEqual(1, self.ledger.counters['queries'])
+        self.assertEqual(1, self.ledger.counters['lru_hits'])
+
+        self.assertIsNone(self.ledger.has("t1_old", "command_register"))
+
+    def test_records_are_written_in_batches(self):
+        self.ledger.record("t1_a", "command_tip")
+        self.ledger.record("t1_b", "command_tip")
+
+        self.assertIsNotNone(self.ledger.has("t1_a", "command_tip"))
+        self.assertEqual(1, self.count_history())
+
+        # the third record fills the batch
+        self.ledger.record("t1_c", "command_tip")
+        self.assertEqual(4, self.count_history())
+        self.assertEqual(1, self.ledger.counters['flushes'])
+        self.assertEqual(0, self.ledger.stats()['pending'])
+
+    def test_duplicate_records_are_ignored(self):
+        self.ledger.record("t1_old", "command_tip")
+        self.ledger.record("t1_a", "command_tip")
+        self.ledger.record("t1_a", "command_tip")
+        self.ledger.flush()
+
+        rows = connection.get_connection().execute(
+            "select content_id, count(*) from history group by content_id order by content_id").fetchall()
+        self.assertEqual([("t1_a", 1), ("t1_old", 1)], rows)
+
+    def test_close_flushes_and_checkpoints(self):
+        self.ledger.record("t1_a", "command_flair")
+        self.ledger.close()
+
+        self.assertEqual(2, self.count_history())
+        self.assertEqual(0, self.ledger.stats()['pending'])
+
+        # a fresh ledger (a restart) knows the record from the database
+        restarted = ProcessedContentLedger()
+        self.assertIsNotNone(restarted.has("t1_a", "command_flair"))
+
+    def test_database_helpers_use_the_ledger(self):
+        self.assertIsNone(database.has_processed_content("t1_x", "command_post"))
+        self.assertEqual({'content_id': "t1_x", 'command': "command_post"},
+                         database.set_processed_content("t1_x", "command_post"))
+        self.assertIsNotNone(database.has_processed_content("t1_x", "command_post"))
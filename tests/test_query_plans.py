@@ -0,0 +1,106 @@
+import ast
+import os
+import re
+import sqlite3
+from unittest import TestCase
+
+from database import connection
+from tests.scratch_db import create_scratch_db
+
+ROOT = os.path.normpath(os.path.join(os.path.dirname(__file__), ".."))
+
+# modules whose queries run on the bots' hot paths
+SOURCES = ["database/database.py", "database/processed_content.py", "bots/post-bot.py", "bots/flair-bot.py"]
+
+# queries that read a whole (small or index-only) table on purpose, e.g. to load a cache at startup.  Every other
+# table access must be a SEARCH, an index scan reads the whole index just like a table scan reads the table.
+INTENTIONAL_INDEX_SCANS = {
+    ("database/database.py", "get_liquidity_position_ids"),
+    ("database/database.py", "get_topic_occupancy"),
+    ("database/database.py", "get_processed_submission_ids"),
+    ("database/processed_content.py", "load"),
+}
+
+SQL_REGEX = re.compile(r'(select\s.*\sfrom|insert\s+(or\s+\w+\s+)?into|update\s.*\sset|delete\s+from)\s', re.S)
+
+
+def strip_comments(sql):
+    return re.sub(r'--[^\n]*', '', sql)
+
+
+def extract_queries(path):
+    """
+    Returns the SQL string literals in a python source file and the function they are in.  f-string placeholders
+    are replaced with 1 and %s placeholders with ?, which is enough for sqlite to plan the query.
+    """
+    with open(path, 'r') as f:
+        tree = ast.parse(f.read())
+
+    functions = [node for node in ast.walk(tree) if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))]
+
+    def function_of(lineno):
+        # the innermost function the line is in
+        enclosing = [f for f in functions if f.lineno <= lineno <= f.end_lineno]
+        return max(enclosing, key=lambda f: f.lineno).name if enclosing else None
+
+    fstring_parts = {id(v) for node in ast.walk(tree) if isinstance(node, ast.JoinedStr) for v in node.values}
+    queries = []
+
+    for node in ast.walk(tree):
+        if id(node) in fstring_parts:
+            continue
+
+        if isinstance(node, ast.Constant) and isinstance(node.value, str):
+            text = node.value
+        elif isinstance(node, ast.JoinedStr):
+            text = ''.join(v.value if isinstance(v, ast.Constant) else '1' for v in node.values)
+        else:
+            continue
+
+        if SQL_REGEX.match(strip_comments(text).strip().lower()):
+            queries.append((node.lineno, function_of(node.lineno), text.replace('%s', '?')))
+
+    return queries
+
+
+class TestQueryPlans(TestCase):
+
+    def setUp(self):
+        self.original_path = connection.DB_PATH
+        self.db = sqlite3.connect(create_scratch_db())
+
+    def tearDown(self):
+        self.db.close()
+        connection.close_connection()
+        connection.DB_PATH = self.original_path
+
+    def test_hot_queries_do_not_scan_tables(self):
+        checked = 0
+
+        for source in SOURCES:
+            for lineno, function, sql in extract_queries(os.path.join(ROOT, source)):
+                params = [None] * strip_comments(sql).count('?')
+                plan = [row[3] for row in self.db.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()]
+
+                # views and subqueries are planned as co-routines or materialized results; scanning those is
+                # fine, as long as the tables underneath them are searched
+                subqueries = {m.group(2) for m in map(re.compile(r'^(CO-ROUTINE|MATERIALIZE) (\S+)').match, plan)
+                              if m}
+
+                for detail in plan:
+                    m = re.match(r'^(SCAN|SEARCH) (\S+)', detail)
+                    if not m or m.group(2) in subqueries or m.group(2).startswith(('CONSTANT', '(subquery')):
+                        continue
+
+                    with self.subTest(source=source, line=lineno, detail=detail):
+                        if (source, function) in INTENTIONAL_INDEX_SCANS:
+                            self.assertFalse(m.group(1) == 'SCAN' and 'USING' not in detail,
+                                             f"full table scan in {source}:{lineno}")
+                        else:
+                            self.assertEqual('SEARCH', m.group(1), f"scan in {source}:{lineno} ({function})")
+                        self.assertNotIn('AUTOMATIC', detail, f"transient index in {source}:{lineno}")
+
+                checked += 1
+
+        # guard against the extractor silently finding nothing
+        self.assertGreater(checked, 30)
@@ -0,0 +1,114 @@
+import json
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+
+from cache.refreshing_cache import RefreshingCache
+
+
+class FakeGitHub(BaseHTTPRequestHandler):
+    document = {"version": 1}
+    etag = '"v1"'
+    status = 200
+    requests = []
+
+    def do_GET(self):
+        FakeGitHub.requests.append(dict(self.headers))
+
+        if self.status != 200:
+            self.send_response(self.status)
+            self.end_headers()
+            return
+
+        if self.headers.get("If-None-Match") == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        body = json.dumps(self.document).encode()
+        self.send_response(200)
+        self.send_header("ETag", self.etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestRefreshingCache(TestCase):
+
+    def setUp(self):
+        FakeGitHub.document = {"version": 1}
+        FakeGitHub.etag = '"v1"'
+        FakeGitHub.status = 200
+        FakeGitHub.requests = []
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeGitHub)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.location = f"http://127.0.0.1:{self.server.server_port}/doc.json"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def wait_for(self, cache, value):
+        for _ in range(100):
+            if cache._value == value:
+                break
+            time.sleep(0.02)
+
+    def test_conditional_get(self):
+        cache = RefreshingCache("doc", self.location, timedelta(minutes=5), snapshot_dir=None)
+
+        self.assertEqual({"version": 1}, cache.get())
+        self.assertTrue(cache.refresh())
+
+        self.assertEqual('"v1"', FakeGitHub.requests[-1].get("If-None-Match"))
+        self.assertEqual(1, cache.stats()['not_modified'])
+        self.assertEqual({"version": 1}, cache.get())
+
+    def test_stale_value_is_served_while_refreshing(self):
+        cache = RefreshingCache("doc", self.location, timedelta(0), snapshot_dir=None)
+        cache.get()
+
+        FakeGitHub.document = {"version": 2}
+        FakeGitHub.etag = '"v2"'
+
+        self.assertEqual({"version": 1}, cache.get())
+        self.wait_for(cache, {"version": 2})
+        self.assertEqual({"version": 2}, cache.get())
+
+        stats = cache.stats()
+        self.assertEqual(1, stats['misses'])
+        self.assertGreaterEqual(stats['stale_hits'], 2)
+
+    def test_failed_refresh_keeps_value_and_stays_stale(self):
+        cache = RefreshingCache("doc", self.location, timedelta(minutes=5), snapshot_dir=None)
+        cache.get()
+        cache._updated_at -= 600
+
+        FakeGitHub.status = 500
+        self.assertFalse(cache.refresh())
+
+        self.assertTrue(cache.is_stale())
+        self.assertEqual({"version": 1}, cache._value)
+        self.assertEqual(1, cache.stats()['failures'])
+
+    def test_snapshot_is_served_on_cold_start(self):
+        snapshot_dir = tempfile.mkdtemp()
+        RefreshingCache("doc", self.location, timedelta(minutes=5), snapshot_dir=snapshot_dir).get()
+
+        FakeGitHub.status = 500
+        cache = RefreshingCache("doc", self.location, timedelta(minutes=5), snapshot_dir=snapshot_dir)
+
+        self.assertEqual({"version": 1}, cache.get())
+        self.assertEqual(0, cache.stats()['misses'])
+
+    def test_transform(self):
+        cache = RefreshingCache("doc", self.location, timedelta(minutes=5), transform=lambda d: d["version"],
+                                snapshot_dir=None)
+        self.assertEqual(1, cache.get())
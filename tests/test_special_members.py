@@ -0,0 +1,48 @@
+import time
+from datetime import timedelta
+from unittest import TestCase
+
+from cache import cache
+from cache.refreshing_cache import RefreshingCache
+
+
+class TestSpecialMembers(TestCase):
+
+    def setUp(self):
+        now = int(time.time())
+        members = [
+            {"redditor": "Member_One", "community": "EthTrader", "expires": now + 3600},
+            {"redditor": "lapsed", "community": "ethtrader", "expires": now - 60},
+            {"redditor": "renewed", "community": "ethtrader", "expires": now + 60},
+            {"redditor": "renewed", "community": "ethtrader", "expires": now - 3600},
+            {"redditor": "everywhere", "community": "all", "expires": now + 3600},
+            {"redditor": "no_expiry", "community": "donut"},
+            {"redditor": None, "community": "ethtrader", "expires": now + 3600},
+        ]
+
+        self.original = cache.SPECIAL_MEMBERS
+        cache.SPECIAL_MEMBERS = RefreshingCache("special_members", "http://localhost/members.json",
+                                                timedelta(minutes=10), transform=cache.index_members,
+                                                snapshot_dir=None)
+        cache.SPECIAL_MEMBERS.set(members)
+
+    def tearDown(self):
+        cache.SPECIAL_MEMBERS = self.original
+
+    def test_lookup_ignores_case(self):
+        self.assertEqual("Member_One", cache.get_special_member("member_ONE", "ETHTRADER")["redditor"])
+        self.assertTrue(cache.is_special_member("no_expiry", "donut"))
+        self.assertFalse(cache.is_special_member("member_one", "donut"))
+
+    def test_all_communities(self):
+        self.assertTrue(cache.is_special_member("everywhere", "ethtrader"))
+        self.assertTrue(cache.is_special_member("Everywhere", "donut"))
+
+    def test_expired_members(self):
+        self.assertFalse(cache.is_special_member("lapsed", "ethtrader"))
+        self.assertGreater(cache.get_special_member("renewed", "ethtrader")["expires"], time.time())
+
+    def test_membership_lapses_between_refreshes(self):
+        member = cache.get_special_member("member_one", "ethtrader")
+        self.assertTrue(cache.is_expired(member, member["expires"]))
+        self.assertFalse(cache.is_expired(member, member["expires"] - 1))
@@ -0,0 +1,99 @@
+import time
+from types import SimpleNamespace
+from unittest import TestCase
+
+from praw.models import MoreComments
+
+from bots.loader import load_bot
+from cache.bloom_filter import BloomFilter
+from cache.submission_ledger import SubmissionLedger
+from database import connection, database
+from tests.scratch_db import create_scratch_db
+
+
+class FakeSubmission:
+
+    def __init__(self, fullname, created_utc, comments=()):
+        self.fullname = fullname
+        self.created_utc = created_utc
+        self._comments = list(comments)
+        self.fetches = 0
+
+    @property
+    def comments(self):
+        self.fetches += 1
+        return self._comments
+
+
+def comment(author):
+    return SimpleNamespace(author=SimpleNamespace(name=author) if author else None)
+
+
+class TestBloomFilter(TestCase):
+
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(10_000, 0.01)
+        keys = [f"t3_{i:x}" for i in range(10_000)]
+        for key in keys:
+            bloom.add(key)
+
+        self.assertTrue(all(key in bloom for key in keys))
+        self.assertEqual(10_000, len(bloom))
+
+        false_positives = sum(f"t1_{i:x}" in bloom for i in range(10_000))
+        self.assertLess(false_positives, 300)
+
+
+class TestSubmissionLedger(TestCase):
+
+    def setUp(self):
+        self.original_path = connection.DB_PATH
+        create_scratch_db()
+
+        with connection.get_connection() as db:
+            db.execute("insert into post (submission_id, author) values ('t3_abc', 'alice')")
+        database.insert_rejected_post("t3_def", "bob", "media", "ethtrader")
+
+        self.post_bot = load_bot("post-bot")
+        self.post_bot.ledger = SubmissionLedger()
+        self.post_bot.ledger.load()
+
+    def tearDown(self):
+        connection.close_connection()
+        connection.DB_PATH = self.original_path
+
+    def test_recorded_submissions(self):
+        ledger = self.post_bot.ledger
+
+        self.assertTrue(ledger.might_contain("t3_abc"))
+        self.assertTrue(ledger.might_contain("T3_DEF"))
+        self.assertFalse(ledger.might_contain("t3_xyz"))
+
+        ledger.record("t3_xyz")
+        self.assertTrue(ledger.might_contain("t3_xyz"))
+
+    def test_processed_from_the_database(self):
+        post = FakeSubmission("t3_abc", 0)
+        self.assertEqual("alice", self.post_bot.previously_processed(post, "donut-bot")["author"])
+
+        rejected = FakeSubmission("t3_def", 0)
+        self.assertTrue(self.post_bot.previously_processed(rejected, "donut-bot"))
+
+        self.assertEqual(0, post.fetches + rejected.fetches)
+
+    def test_new_submissions_are_not_fetched(self):
+        submission = FakeSubmission("t3_new", time.time() + 1, [comment("donut-bot")])
+
+        self.assertFalse(self.post_bot.previously_processed(submission, "donut-bot"))
+        self.assertEqual(0, submission.fetches)
+
+    def test_old_submissions_fetch_the_top_level_once(self):
+        more = MoreComments(None, {"children": [], "count": 0, "parent_id": "t3_old"})
+        replied = FakeSubmission("t3_old", 0, [comment(None), comment("someone"), comment("donut-bot"), more])
+        self.assertTrue(self.post_bot.previously_processed(replied, "donut-bot"))
+        self.assertEqual(1, replied.fetches)
+        self.assertEqual(self.post_bot.FALLBACK_COMMENT_LIMIT, replied.comment_limit)
+
+        not_replied = FakeSubmission("t3_old2", 0, [comment("someone"), more])
+        self.assertFalse(self.post_bot.previously_processed(not_replied, "donut-bot"))
+        self.assertEqual(1, not_replied.fetches)
@@ -0,0 +1,110 @@
+import json
+import os
+from datetime import datetime
+from unittest import TestCase
+
+from eth_utils.abi import event_abi_to_log_topic
+
+from chain.client_pool import ChainClientPool
+from chain.tip_indexer import TipIndexer
+from database import connection, database
+from tests.fake_node import FakeNode, block_timestamp, start_fake_node, tip_log
+from tests.scratch_db import create_scratch_db
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+TIPPING_CONTRACT = "0x403EB731A37cf9e41d72b9A97aE6311ab44bE7b9"
+DONUT = "0xF42e2B8bc2aF8B110b65be98dB1321B1ab8D44f5"
+SENDER = "0x95D9bED31423eb7d5B68511E0352Eae39a3CDD20"
+RECEIVER = "0x0000000000000000000000000000000000000042"
+CURSOR = "onchain_tip_arb1_block"
+
+
+def tx_hash(n):
+    return "0x" + f"{n:064x}"
+
+
+class TestTipIndexer(TestCase):
+
+    def setUp(self):
+        self.original_path = connection.DB_PATH
+        create_scratch_db()
+
+        self.server = start_fake_node()
+        self.pool = ChainClientPool(providers={"arb1": f"http://127.0.0.1:{self.server.server_port}"})
+
+        with open(os.path.normpath(os.path.join(SCRIPT_DIR, "../contracts/tipping_contract_abi.json")), 'r') as f:
+            self.contract = self.pool.contract("arb1", TIPPING_CONTRACT, json.load(f))
+
+        self.topic = event_abi_to_log_topic(self.contract.events.Tip().abi)
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+        connection.close_connection()
+        connection.DB_PATH = self.original_path
+
+    def indexer(self, **kwargs):
+        return TipIndexer(self.pool.web3("arb1"), self.contract, CURSOR, **kwargs)
+
+    def tip(self, n, block_number, content_id="t1_abc"):
+        return tip_log(TIPPING_CONTRACT, block_number, tx_hash(n), SENDER, RECEIVER, 5 * 10 ** 18, DONUT,
+                       content_id, self.topic)
+
+    def save(self, events):
+        database.insert_onchain_tips([
+            (e.args["from"], e.args["to"], e.transactionHash.hex(), 42161, e.blockNumber, 5, "donut", "t1_abc",
+             datetime.fromtimestamp(timestamp), 0) for e, timestamp in events])
+
+    def test_first_run_scans_the_initial_window(self):
+        FakeNode.logs = [self.tip(1, 100), self.tip(2, 600), self.tip(3, 950), self.tip(4, 950)]
+        FakeNode.statuses = {tx_hash(3): 0}
+
+        events = self.indexer(initial_window=500).scan(1000)
+
+        # the reverted tip is left out, the two tips of block 950 share a single block lookup
+        self.assertEqual([tx_hash(2), tx_hash(4)], [e.transactionHash.hex() for e, _ in events])
+        self.assertEqual([block_timestamp(600), block_timestamp(950)], [t for _, t in events])
+        self.assertEqual(5 * 10 ** 18, events[0][0].args["amount"])
+        self.assertEqual(SENDER, events[0][0].args["from"])
+
+        # the receipts and the blocks are looked up in one batch each
+        self.assertEqual([["eth_getTransactionReceipt"] * 3, ["eth_getBlockByNumber"] * 2], FakeNode.batches)
+
+    def test_only_new_tips_after_the_cursor(self):
+        indexer = self.indexer(initial_window=500)
+        FakeNode.logs = [self.tip(1, 900)]
+        events = indexer.scan(1000)
+        self.save(events)
+        indexer.save_cursor(1000)
+
+        FakeNode.logs.append(self.tip(2, 1500))
+        FakeNode.calls = []
+
+        events = self.indexer().scan(2000)
+
+        # the scan picks up just before the cursor, the tip that is already saved is not returned again
+        self.assertEqual([tx_hash(2)], [e.transactionHash.hex() for e, _ in events])
+        scans = [int(c[1], 16) for c in FakeNode.calls if c[0] == "eth_getLogs"]
+        self.assertEqual(981, scans[0])
+        self.assertEqual([("eth_getTransactionReceipt", tx_hash(2)), ("eth_getBlockByNumber", hex(1500))],
+                         [c for c in FakeNode.calls if c[0] != "eth_getLogs"])
+
+    def test_adaptive_ranges(self):
+        self.indexer().save_cursor(1_019)
+
+        events = self.indexer(block_range=1_000, max_block_range=8_000).scan(30_999)
+
+        # the range doubles after every request, up to the maximum
+        self.assertEqual([], events)
+        sizes = [int(c[2], 16) - int(c[1], 16) + 1 for c in FakeNode.calls if c[0] == "eth_getLogs"]
+        self.assertEqual([1_000, 2_000, 4_000, 8_000, 8_000, 7_000], sizes)
+
+    def test_timestamps_are_cached(self):
+        indexer = self.indexer()
+        indexer.block_timestamps([10, 11])
+        indexer.block_timestamps([11, 12])
+
+        self.assertEqual([["eth_getBlockByNumber"] * 2, ["eth_getBlockByNumber"]], FakeNode.batches)
@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+from ad_hoc import rebuild_tip_round_totals
+from database import connection, database
+from models.offchaintip import OffchainTip
+from tests.scratch_db import create_scratch_db
+
+# the queries !tip status used before the totals were materialized
+REFERENCE_SENT = """
+    SELECT from_user, token, count(tip.id) 'count', sum(amount) 'amount'
+    FROM earn2tip tip inner join distribution_rounds dr
+    WHERE tip.created_date BETWEEN dr.from_date and dr.to_date and from_user = ?
+      and DATETIME() between dr.from_date and dr.to_date
+    GROUP BY from_user, token;
+"""
+
+REFERENCE_SUB = """
+    SELECT tip.community, tip.token, dr.distribution_round, count(tip.id) 'tip_count', sum(amount) 'amount',
+           avg(amount) 'average_tip_amount'
+    FROM earn2tip tip inner join distribution_rounds dr
+    WHERE tip.created_date BETWEEN dr.from_date and dr.to_date and tip.community = ?
+      and DATETIME() between dr.from_date and dr.to_date
+    GROUP BY tip.community, tip.token, dr.distribution_round;
+"""
+
+
+def tip(sender, recipient, amount, token="donut", community="ethtrader", content_id="t1_a"):
+    return OffchainTip(sender, recipient, amount, 0, token, content_id, "t1_parent", "abc", community, True, "")
+
+
+class TestTipRoundTotals(TestCase):
+
+    def setUp(self):
+        self.original_path = connection.DB_PATH
+        create_scratch_db()
+
+        with connection.get_connection() as db:
+            db.execute("insert into distribution_rounds (from_date, to_date, community, distribution_round) "
+                       "values (?, ?, 'ethtrader', 140)",
+                       [datetime.now() - timedelta(days=10), datetime.now() + timedelta(days=10)])
+            # a previous round, its tips are not part of the status
+            db.execute("insert into distribution_rounds (from_date, to_date, community, distribution_round) "
+                       "values (?, ?, 'ethtrader', 139)",
+                       [datetime.now() - timedelta(days=40), datetime.now() - timedelta(days=10, seconds=1)])
+            db.execute("insert into earn2tip (from_user, to_user, amount, token, community, created_date) "
+                       "values ('alice', 'bob', 100, 'donut', 'ethtrader', ?)", [datetime.now() - timedelta(days=20)])
+
+        self.assertTrue(database.process_earn2tips([tip("alice", "bob", 10), tip("alice", "carol", 2.5)],
+                                                   "command_tip"))
+        self.assertTrue(database.process_earn2tips([tip("Alice", "bob", 1, content_id="t1_b")], "command_tip"))
+        self.assertTrue(database.process_earn2tips([tip("bob", "alice", 3, token="contrib", content_id="t1_c"),
+                                                    tip("bob", "alice", 4, community="ethfinance",
+                                                        content_id="t1_c")], "command_tip"))
+
+    def tearDown(self):
+        connection.close_connection()
+        connection.DB_PATH = self.original_path
+
+    def reference(self, sql, param):
+        cur = connection.dict_cursor(connection.get_connection())
+        return cur.execute(sql, [param]).fetchall()
+
+    def test_status_matches_earn2tip(self):
+        sent = database.get_tips_sent_for_current_round_by_user("alice")
+        self.assertEqual([("donut", 3, 13.5)], [(r["token"], r["count"], r["amount"]) for r in sent])
+        self.assertEqual(self.reference(REFERENCE_SENT, "alice"), sent)
+
+        received = {r["token"]: (r["count"], r["amount"])
+                    for r in database.get_tips_received_for_current_round_by_user("ALICE")}
+        self.assertEqual({"contrib": (1, 3), "donut": (1, 4)}, received)
+
+        self.assertEqual([], database.get_tips_sent_for_current_round_by_user("carol"))
+
+    def test_sub_status_matches_earn2tip(self):
+        sub = database.get_sub_status_for_current_round("EthTrader")
+        self.assertEqual(sorted(self.reference(REFERENCE_SUB, "ethtrader"), key=lambda r: r["token"]),
+                         sorted(sub, key=lambda r: r["token"]))
+
+        donut = next(r for r in sub if r["token"] == "donut")
+        self.assertEqual((140, 3, 13.5, 4.5), (donut["distribution_round"], donut["tip_count"], donut["amount"],
+                                               donut["average_tip_amount"]))
+
+    def test_rebuild_matches_incremental(self):
+        sql = "select * from tip_round_totals order by distribution_round, username, direction, community, token"
+        db = connection.get_connection()
+        incremental = db.execute(sql).fetchall()
+
+        db.execute("delete from tip_round_totals")
+        db.commit()
+
+        rebuild_tip_round_totals.rebuild(connection.DB_PATH)
+        rebuilt = db.execute(sql).fetchall()
+
+        # the tip of the previous round is only known to the rebuild
+        self.assertIn((139, "alice", "sent", "ethtrader", "donut", 1, 100), rebuilt)
+        self.assertEqual(incremental, [r for r in rebuilt if r[0] == 140])
+
+    def test_rebuild_adds_up_case_variants(self):
+        with connection.get_connection() as db:
+            # an earn2tip that predates the NOCASE columns (create table as select keeps no collation)
+            db.execute("alter table earn2tip rename to earn2tip_nocase")
+            db.execute("create table earn2tip as select * from earn2tip_nocase")
+            db.execute("insert into earn2tip (id, from_user, to_user, amount, token, community, created_date) "
+                       "values (1001, 'Carol', 'Bob', 5, 'Donut', 'EthTrader', ?)", [datetime.now()])
+            db.execute("insert into earn2tip (id, from_user, to_user, amount, token, community, created_date) "
+                       "values (1002, 'carol', 'BOB', 1, 'donut', 'ethtrader', ?)", [datetime.now()])
+
+        rebuild_tip_round_totals.rebuild(connection.DB_PATH)
+
+        # one row per user, community and token, whichever spelling it keeps
+        received = database.get_tips_received_for_current_round_by_user("bob")
+        self.assertEqual([("donut", 4, 17)], [(r["token"].lower(), r["count"], r["amount"]) for r in received])
+
+        sent = database.get_tips_sent_for_current_round_by_user("carol")
+        self.assertEqual([("donut", 2, 6)], [(r["token"].lower(), r["count"], r["amount"]) for r in sent])
+
+        sub = database.get_sub_status_for_current_round("ethtrader")
+        donut = next(r for r in sub if r["token"].lower() == "donut")
+        self.assertEqual((5, 19.5), (donut["tip_count"], donut["amount"]))
@@ -0,0 +1,128 @@
+from types import SimpleNamespace
+from unittest import TestCase
+from unittest.mock import patch
+
+from cache import user_registry
+from cache.user_registry import UserRegistry
+from commands.command_tip import TipCommand
+from database import connection, database
+from tests.scratch_db import create_scratch_db
+
+USERS_LOCATION = "file:///tip-service-users.json"
+
+CONFIG = {
+    "community_tokens": [{"community": "r/ethtrader", "tokens": [{"name": "donut", "is_default": True}]}],
+    "e2t_post": "https://reddit.com/e2t",
+    "users_location": USERS_LOCATION,
+    "comment2vote": {"max_weight": 20000, "min_tip_to_avoid_archive": 5, "min_chars_needed_to_avoid_archive": 13,
+                     "archive_url": "https://archive/#y#/#m#/#d#/#f#"},
+}
+
+
+class FakeComment:
+
+    def __init__(self, body, author="alice", parent_author="bob"):
+        self.body = body
+        self.id = "c1"
+        self.fullname = "t1_c1"
+        self.created_utc = 1700000000
+        self.author = SimpleNamespace(name=author)
+        self.subreddit = SimpleNamespace(display_name="EthTrader")
+        self.submission = SimpleNamespace(id="s1", fullname="t3_s1")
+        self._parent = SimpleNamespace(fullname="t1_p1", author=SimpleNamespace(name=parent_author))
+        self.parent_calls = 0
+        self.replies = []
+        self.removed = False
+        self.mod = SimpleNamespace(remove=lambda spam: setattr(self, "removed", True))
+
+    def parent(self):
+        self.parent_calls += 1
+        return self._parent
+
+    def reply(self, text):
+        self.replies.append(text)
+
+
+class TestTipService(TestCase):
+
+    def setUp(self):
+        self.original_path = connection.DB_PATH
+        create_scratch_db()
+
+        for user in ["alice", "Bob", "Carol"]:
+            database.insert_or_update_address(user, f"0x{user.lower()}", "t1_register")
+
+        registry = UserRegistry(USERS_LOCATION, snapshot_dir=None)
+        registry.load([{"username": "alice", "address": "0xalice", "weight": 10000}])
+        user_registry.REGISTRIES[USERS_LOCATION] = registry
+
+        self.tip_thread_replies = []
+        reddit = SimpleNamespace(comment=lambda _: SimpleNamespace(reply=self.tip_thread_replies.append))
+        self.command = TipCommand(CONFIG, reddit)
+
+        # nothing is written to tip_archive/
+        self.command.archive_comment = lambda comment, max_tip: {
+            'should_remove': False, 'year': 2023, 'month': '11', 'day': '14', 'filename': "t1_c1.txt"}
+
+    def tearDown(self):
+        user_registry.REGISTRIES.pop(USERS_LOCATION, None)
+        connection.close_connection()
+        connection.DB_PATH = self.original_path
+
+    def test_multi_tip_comment_resolves_users_once(self):
+        comment = FakeComment("!tip 10\n!tip u/carol 2 donuts\n!tip u/dave 1\n!tip u/alice 3")
+
+        with patch.object(database, "get_users_by_name", wraps=database.get_users_by_name) as lookup:
+            tips = self.command.parse_comments_for_tips(comment)
+
+        self.assertEqual(1, lookup.call_count)
+        self.assertEqual(1, comment.parent_calls)
+
+        self.assertEqual(["Bob", "Carol", "dave", "alice"], [t.recipient_name for t in tips])
+        self.assertEqual([True, True, True, False], [t.is_valid for t in tips])
+        self.assertEqual(0.5, tips[0].weight)
+        self.assertIn("not currently registered", tips[2].message)
+        self.assertIn("cannot tip yourself", tips[3].message)
+        self.assertTrue(all(t.parent_content_id == "t1_p1" and t.submission_content_id == "s1" for t in tips))
+
+    def test_unregistered_sender(self):
+        comment = FakeComment("!tip 10", author="mallory")
+        tips = self.command.parse_comments_for_tips(comment)
+
+        self.assertFalse(tips[0].is_valid)
+        self.assertIn("you are not registered", tips[0].message)
+
+    def test_tips_history_and_tip_thread_in_one_transaction(self):
+        with connection.get_connection() as db:
+            db.execute("insert into post (submission_id, author, tip_comment_id) values ('t3_s1', 'bob', 't1_thread')")
+
+        comment = FakeComment("!tip 10 donut for this great comment")
+        self.command.process_comment(comment)
+
+        db = connection.get_connection()
+        self.assertEqual(1, db.execute("select count(*) from earn2tip where content_id = 't1_c1'").fetchone()[0])
+        self.assertEqual(1, db.execute("select count(*) from history where content_id = 't1_c1'").fetchone()[0])
+        self.assertIsNotNone(database.has_processed_content("t1_c1", "command_tip"))
+
+        # the confirmation went to the tip thread read in the transaction
+        self.assertEqual([], comment.replies)
+        self.assertEqual(1, len(self.tip_thread_replies))
+        self.assertIn("u/alice has tipped u/Bob 10.0 donut", self.tip_thread_replies[0])
+
+        stats = self.command.tip_service.stats()
+        for stage in ["prefetch", "resolve_users", "parse", "commit", "archive", "reply"]:
+            self.assertEqual(1, stats[stage]["count"], stage)
+
+        # a second delivery of the comment is ignored
+        self.command.process_comment(comment)
+        self.assertEqual(1, db.execute("select count(*) from earn2tip").fetchone()[0])
+
+    def test_failed_commit_saves_nothing(self):
+        db = connection.get_connection()
+        db.execute("CREATE TRIGGER fail_history BEFORE INSERT ON history BEGIN SELECT RAISE(ABORT, 'fail'); END;")
+
+        comment = FakeComment("!tip 10")
+        self.command.process_comment(comment)
+
+        self.assertEqual(0, db.execute("select count(*) from earn2tip").fetchone()[0])
+        self.assertIn("unable to process your tip", comment.replies[0])
@@ -0,0 +1,84 @@
+import copy
+import json
+import os
+import re
+from unittest import TestCase
+
+from topics.topic_classifier import TopicClassifier
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def load(name):
+    with open(os.path.join(SCRIPT_DIR, "data", name), 'r') as f:
+        return json.load(f)
+
+
+def reference_topic(fullname, title, topics, community):
+    """
+    The loop post-bot and build_topic_limiting used before the classifier, kept to check it gives the same answers.
+    """
+    for topic in [t for t in topics if t["community"].lower() == community.lower()]:
+        topic_ignore = [i if i.startswith("t3_") else "t3_" + i for i in topic["overrides"]["ignore"]]
+        topic_include = [i if i.startswith("t3_") else "t3_" + i for i in topic["overrides"]["include"]]
+
+        if fullname in topic_ignore:
+            continue
+
+        if fullname in topic_include:
+            return topic
+
+        for pattern in topic["patterns"]:
+            if re.search(pattern, title.lower()):
+                return topic
+
+
+def display_name(topic):
+    return topic["display_name"] if topic else None
+
+
+class TestTopicClassifier(TestCase):
+
+    def setUp(self):
+        self.topics = load("topic_meta.json")
+        self.titles = load("topic_titles.json")
+        self.classifier = TopicClassifier(self.topics)
+
+    def test_golden_titles(self):
+        for t in self.titles:
+            with self.subTest(title=t["title"]):
+                topic = self.classifier.classify(t["fullname"], t["title"], t["community"])
+                self.assertEqual(t["topic"], display_name(topic))
+
+    def test_matches_the_reference_loop(self):
+        for t in self.titles:
+            with self.subTest(title=t["title"]):
+                expected = reference_topic(t["fullname"], t["title"], self.topics, t["community"])
+                self.assertIs(expected, self.classifier.classify(t["fullname"], t["title"], t["community"]))
+
+    def test_patterns_are_combined(self):
+        for community in self.classifier.communities.values():
+            self.assertIsNotNone(community.combined)
+
+    def test_falls_back_per_topic(self):
+        topics = copy.deepcopy(self.topics)
+        # a global flag in the middle of the combined regex does not compile, a back reference would be renumbered
+        topics[1]["patterns"].append("(?i)halving")
+        topics[4]["patterns"].append(r"(\w+) vs \1")
+        classifier = TopicClassifier(topics)
+
+        for community in classifier.communities.values():
+            self.assertIsNone(community.combined)
+
+        titles = self.titles + [
+            {"fullname": "t3_1c0001", "community": "EthTrader", "title": "Halving in 3 days"},
+            {"fullname": "t3_1c0002", "community": "ethereum", "title": "rollup vs rollup"},
+        ]
+        for t in titles:
+            with self.subTest(title=t["title"]):
+                expected = reference_topic(t["fullname"], t["title"], topics, t["community"])
+                self.assertIs(expected, classifier.classify(t["fullname"], t["title"], t["community"]))
+
+    def test_unknown_community(self):
+        self.assertIsNone(self.classifier.classify("t3_1", "solana", "CryptoCurrency"))
+        self.assertIsNone(TopicClassifier(None).classify("t3_1", "solana", "EthTrader"))
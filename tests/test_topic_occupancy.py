@@ -0,0 +1,127 @@
+import json
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+from unittest import TestCase
+
+from cache import cache
+from database import connection, database
+from tests.scratch_db import create_scratch_db
+from topics.occupancy import TopicOccupancy
+from topics.topic_classifier import TopicClassifier
+
+TOPICS = [
+    {"display_name": "Solana", "community": "ethtrader", "limit": 2, "patterns": [r"\bsolana\b"],
+     "overrides": {"ignore": [], "include": []}},
+    {"display_name": "Ripple", "community": "ethtrader", "limit": 1, "patterns": [r"\bxrp\b"],
+     "overrides": {"ignore": [], "include": []}},
+]
+
+
+def submission(fullname, title):
+    return SimpleNamespace(fullname=fullname, title=title, shortlink=f"https://redd.it/{fullname[3:]}")
+
+
+class FakeSubreddit:
+
+    def __init__(self, reddit, name):
+        self.reddit = reddit
+        self.name = name
+
+    def hot(self, limit):
+        self.reddit.fetches += 1
+        return iter(self.reddit.listings[self.name][:limit])
+
+
+class FakeReddit:
+
+    def __init__(self):
+        self.listings = {}
+        self.fetches = 0
+
+    def subreddit(self, name):
+        return FakeSubreddit(self, name)
+
+
+class CountingClassifier(TopicClassifier):
+
+    def __init__(self, topics):
+        super().__init__(topics)
+        self.classified = []
+
+    def classify(self, fullname, title, community):
+        self.classified.append(fullname)
+        return super().classify(fullname, title, community)
+
+
+class TestTopicOccupancy(TestCase):
+
+    def setUp(self):
+        self.original_path = connection.DB_PATH
+        create_scratch_db()
+
+        self.reddit = FakeReddit()
+        self.classifier = CountingClassifier(TOPICS)
+        self.export_path = os.path.join(tempfile.mkdtemp(), "topic_limits.json")
+        self.occupancy = TopicOccupancy(self.reddit, ["EthTrader"], lambda: self.classifier,
+                                        export_path=self.export_path)
+
+    def tearDown(self):
+        connection.close_connection()
+        connection.DB_PATH = self.original_path
+
+    def counts(self):
+        return {t["display_name"]: t["current"] for t in self.occupancy.limits()["data"]}
+
+    def test_counts_follow_the_hot_listing(self):
+        self.reddit.listings["EthTrader"] = [submission("t3_1", "Solana is down"), submission("t3_2", "gm"),
+                                             submission("t3_3", "XRP pumps"), submission("t3_4", "solana again")]
+        self.assertTrue(self.occupancy.poll_once())
+        self.assertEqual({"Solana": 2, "Ripple": 1}, self.counts())
+
+        # t3_1 and t3_3 fell out, t3_5 came in: only the new submission is classified
+        self.classifier.classified.clear()
+        self.reddit.listings["EthTrader"] = [submission("t3_4", "solana again"), submission("t3_2", "gm"),
+                                             submission("t3_5", "Solana ETF?")]
+        self.assertTrue(self.occupancy.poll_once())
+        self.assertEqual(["t3_5"], self.classifier.classified)
+        self.assertEqual({"Solana": 2, "Ripple": 0}, self.counts())
+
+        # nothing about the topics changed
+        self.reddit.listings["EthTrader"] = [submission("t3_2", "gm"), submission("t3_4", "solana again"),
+                                             submission("t3_5", "Solana ETF?"), submission("t3_6", "wen moon")]
+        self.assertFalse(self.occupancy.poll_once())
+
+    def test_new_topic_meta_reclassifies(self):
+        self.reddit.listings["EthTrader"] = [submission("t3_1", "Solana is down"), submission("t3_2", "XRP")]
+        self.occupancy.poll_once()
+
+        self.classifier = CountingClassifier(TOPICS[1:])
+        self.occupancy.poll_once()
+
+        self.assertEqual(["t3_1", "t3_2"], self.classifier.classified)
+        self.assertEqual({"Ripple": 1}, self.counts())
+
+    def test_limits_are_saved_and_exported(self):
+        self.reddit.listings["EthTrader"] = [submission("t3_1", "Solana is down"), submission("t3_2", "XRP")]
+        self.occupancy.poll_once()
+
+        with open(self.export_path, 'r') as f:
+            exported = json.load(f)
+
+        self.assertEqual(self.occupancy.limits(), exported)
+        self.assertEqual(["https://redd.it/1"], exported["data"][0]["submissions"])
+
+        # another process, without a tracker of its own, reads the counts from the database
+        saved = cache.get_topic_limits()
+        self.assertEqual([("Ripple", 1, 1), ("Solana", 2, 1)],
+                         [(t["display_name"], t["limit"], t["current"]) for t in saved["data"]])
+        self.assertEqual(["https://redd.it/1"], saved["data"][1]["submissions"])
+
+    def test_stale_counts_are_not_used(self):
+        self.reddit.listings["EthTrader"] = [submission("t3_1", "Solana is down")]
+        self.occupancy.poll_once()
+
+        self.assertTrue(self.occupancy.is_current())
+        self.assertIsNone(database.get_topic_occupancy(time.time() + 1))
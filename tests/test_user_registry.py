@@ -0,0 +1,75 @@
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+from unittest import TestCase
+
+from cache.user_registry import UserRegistry
+
+USERS = [
+    {"username": "Donut_Fan", "address": "0xAbC0000000000000000000000000000000000001", "weight": "25000"},
+    {"username": "another_user", "address": "0xabc0000000000000000000000000000000000002", "weight": 10},
+    {"username": "no_address", "address": "", "weight": 5},
+]
+
+
+class TestUserRegistry(TestCase):
+
+    def setUp(self):
+        self.users_file = os.path.join(tempfile.mkdtemp(), "users.json")
+        with open(self.users_file, 'w') as f:
+            json.dump(USERS, f)
+
+        self.registry = UserRegistry(Path(self.users_file).as_uri(), snapshot_dir=None)
+
+    def test_lookups_ignore_case(self):
+        self.assertTrue(self.registry.refresh())
+
+        self.assertEqual("Donut_Fan", self.registry.by_name("DONUT_fan")["username"])
+        self.assertEqual("Donut_Fan", self.registry.by_address("0xabc0000000000000000000000000000000000001")["username"])
+        self.assertEqual(25000, self.registry.weight_of("donut_fan"))
+        self.assertEqual(10, self.registry.weight_of("Another_User"))
+
+    def test_unknown_users(self):
+        self.registry.refresh()
+
+        self.assertIsNone(self.registry.by_name("nobody"))
+        self.assertIsNone(self.registry.by_name(None))
+        self.assertIsNone(self.registry.by_address(""))
+        self.assertEqual(0, self.registry.weight_of("nobody"))
+
+    def test_failed_refresh_keeps_previous_users(self):
+        self.registry.refresh()
+        os.remove(self.users_file)
+
+        self.assertFalse(self.registry.refresh())
+        self.assertEqual(25000, self.registry.weight_of("donut_fan"))
+
+    def test_add(self):
+        self.registry.refresh()
+        self.registry.add({"username": "new_user", "address": "0xdef", "weight": 0})
+
+        self.assertEqual("new_user", self.registry.by_address("0xDEF")["username"])
+        self.assertEqual(4, len(self.registry.users))
+
+    def test_refresh_swaps_index_atomically(self):
+        self.registry.refresh()
+        stop = threading.Event()
+        errors = []
+
+        def read():
+            while not stop.is_set():
+                # a reader must never see a user in one index but not the other
+                user = self.registry.by_name("donut_fan")
+                if user is None or self.registry.by_address(user["address"]) is None:
+                    errors.append(user)
+
+        reader = threading.Thread(target=read)
+        reader.start()
+        for _ in range(200):
+            self.registry.load(json.loads(json.dumps(USERS)))
+        stop.set()
+        reader.join()
+
+        self.assertEqual([], errors)
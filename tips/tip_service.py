@@ -0,0 +1,93 @@
+import threading
+import time
+from contextlib import contextmanager
+from functools import cached_property
+
+from database import database
+
+# the stages of a !tip, in the order they run
+STAGES = ["prefetch", "resolve_users", "parse", "commit", "archive", "reply"]
+
+
+class TipContext:
+    """
+    What a !tip needs from reddit, read once per comment: the parent and the submission.  The parent's author is
+    what makes praw fetch the parent, it is read on first use (only a tip without u/recipient needs it).
+    """
+
+    def __init__(self, comment):
+        self.sender = comment.author.name
+        self.community = comment.subreddit.display_name.lower()
+
+        self.parent = comment.parent()
+        self.parent_fullname = self.parent.fullname
+
+        submission = comment.submission
+        self.submission_id = submission.id
+        self.submission_fullname = submission.fullname
+
+    @cached_property
+    def parent_author(self):
+        # None when the parent was deleted
+        author = self.parent.author
+        return author.name if author else None
+
+
+class TipService:
+    """
+    The database side of a !tip.  The senders and recipients of every tip line are looked up in one query, and the
+    tips, the history record and the lookup of the submission's tip thread share one transaction.
+
+    Each stage is timed, stats() has the count, average and maximum of every stage so tip latency can be profiled.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.timings = {stage: {'count': 0, 'total': 0.0, 'max': 0.0} for stage in STAGES}
+
+    @contextmanager
+    def timed(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                timing = self.timings.setdefault(stage, {'count': 0, 'total': 0.0, 'max': 0.0})
+                timing['count'] += 1
+                timing['total'] += elapsed
+                timing['max'] = max(timing['max'], elapsed)
+
+    def prefetch(self, comment):
+        """
+        :return: the TipContext of the comment
+        """
+        with self.timed("prefetch"):
+            return TipContext(comment)
+
+    def resolve_users(self, names):
+        """
+        :param names: the senders and recipients, as typed
+        :return: the users rows of the registered ones, by lowercase username
+        """
+        names = list(dict.fromkeys(name.lower() for name in names if name))
+        if not names:
+            return {}
+
+        with self.timed("resolve_users"):
+            return {user["username"].lower(): user for user in database.get_users_by_name(names)}
+
+    def commit(self, tips, command, submission_fullname):
+        """
+        Saves the valid tips of a comment and marks the comment as processed, in one transaction.
+        :return: (True, the tip thread of the submission or None) on success, (False, None) if nothing was saved
+        """
+        with self.timed("commit"):
+            return database.process_tip_comment(tips, command, submission_fullname)
+
+    def stats(self):
+        with self._lock:
+            return {stage: {'count': t['count'],
+                            'avg_ms': round(1000 * t['total'] / t['count'], 3) if t['count'] else 0.0,
+                            'max_ms': round(1000 * t['max'], 3)}
+                    for stage, t in self.timings.items()}
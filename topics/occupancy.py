@@ -0,0 +1,205 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from database import database
+
+HOT_LIMIT = 50
+POLL_INTERVAL = 30
+
+EXPORT_PATH = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../temp/topic_limits.json"))
+
+
+class TopicOccupancy:
+    """
+    Counts the submissions of every limited topic in the hot 50 of each community, the way build_topic_limiting.py
+    does, but in process and incrementally: each poll only classifies the submissions that entered the hot listing
+    since the previous poll and drops the ones that left it.  Everything is reclassified when topic_meta.json
+    changes.
+
+    The counts are kept in memory for post-bot, saved to the topic_occupancy table for the other processes and
+    exported in the topic_limits.json format for the dashboard.
+    """
+
+    logger = logging.getLogger("donut_bot")
+
+    def __init__(self, reddit, communities, topic_meta, poll_interval=POLL_INTERVAL, export_path=EXPORT_PATH,
+                 save=True):
+        """
+        :param reddit: a praw instance
+        :param communities: the subreddits to track, without r/
+        :param topic_meta: returns the current TopicClassifier, e.g. cache.TOPIC_META.get
+        :param poll_interval: seconds between polls of the hot listings
+        :param export_path: where the topic_limits.json document is written, None to disable the export
+        :param save: whether to save the counts to the database
+        """
+        self.reddit = reddit
+        self.communities = communities
+        self.topic_meta = topic_meta
+        self.poll_interval = poll_interval
+        self.export_path = export_path
+        self.save = save
+
+        # by community: the hot submissions from the previous poll {fullname: (display_name or None, shortlink)} and
+        # the submissions counted against each topic {display_name: {fullname: shortlink}}
+        self._hot = {}
+        self._submissions = {}
+        self._classifier = None
+        self._updated_at = 0
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.counters = {
+            'polls': 0,
+            'failures': 0,
+            'entered': 0,
+            'left': 0,
+            'last_poll_seconds': 0.0,
+        }
+
+    def poll_once(self):
+        """
+        Fetches the hot listings and applies the difference to the counts.
+        :return: True if any count changed
+        """
+        started = time.perf_counter()
+        classifier = self.topic_meta()
+        if classifier is None:
+            return False
+
+        if classifier is not self._classifier:
+            # a new topic_meta.json, the topics or their patterns may have changed
+            self._hot = {}
+            self._submissions = {}
+            self._classifier = classifier
+
+        changed = False
+        for community in self.communities:
+            hot = list(self.reddit.subreddit(community).hot(limit=HOT_LIMIT))
+            changed |= self.update(community, hot)
+
+        self._updated_at = int(time.time())
+        self.counters['polls'] += 1
+        self.counters['last_poll_seconds'] = time.perf_counter() - started
+
+        # written every poll (not only on changes), the timestamp tells readers the counts are current
+        document = self.limits()
+        if self.save:
+            database.save_topic_occupancy(document['data'], self._updated_at)
+        self.export(document)
+
+        return changed
+
+    def update(self, community, hot):
+        """
+        Applies a hot listing of a community to the counts.
+        :param community: the subreddit, without r/
+        :param hot: the submissions in the hot listing
+        :return: True if any count changed
+        """
+        key = community.lower()
+        previous = self._hot.get(key, {})
+        current = {}
+        entered = []
+
+        for submission in hot:
+            if submission.fullname in previous:
+                current[submission.fullname] = previous[submission.fullname]
+                continue
+
+            topic = self._classifier.classify(submission.fullname, submission.title, community)
+            current[submission.fullname] = (topic["display_name"] if topic else None, submission.shortlink)
+            entered.append(submission.fullname)
+
+        left = [fullname for fullname in previous if fullname not in current]
+
+        with self._lock:
+            submissions = self._submissions.setdefault(key, {})
+            for fullname in left:
+                display_name, _ = previous[fullname]
+                if display_name:
+                    submissions[display_name].pop(fullname, None)
+
+            for fullname in entered:
+                display_name, shortlink = current[fullname]
+                if display_name:
+                    submissions.setdefault(display_name, {})[fullname] = shortlink
+
+            self._hot[key] = current
+
+        self.counters['entered'] += len(entered)
+        self.counters['left'] += len(left)
+
+        return any(current[f][0] for f in entered) or any(previous[f][0] for f in left)
+
+    def is_current(self):
+        """
+        :return: True if the counts are from a recent poll
+        """
+        return self._classifier is not None and time.time() - self._updated_at < 3 * self.poll_interval
+
+    def limits(self):
+        """
+        :return: the counts as a topic_limits.json document
+        """
+        topics = self._classifier.topics if self._classifier else []
+
+        with self._lock:
+            data = []
+            for topic in topics:
+                submissions = self._submissions.get(topic["community"].lower(), {}).get(topic["display_name"], {})
+                data.append({
+                    "display_name": topic["display_name"],
+                    "limit": topic["limit"],
+                    "current": len(submissions),
+                    "submissions": list(submissions.values()),
+                    "community": topic["community"]
+                })
+
+        return {'last_update': self._updated_at, 'data': data}
+
+    def export(self, document):
+        if not self.export_path:
+            return
+
+        try:
+            os.makedirs(os.path.dirname(self.export_path), exist_ok=True)
+
+            # the dashboard may read it at any time, write then rename
+            temp_path = f"{self.export_path}.{os.getpid()}.tmp"
+            with open(temp_path, 'w') as f:
+                json.dump(document, f, indent=4)
+            os.replace(temp_path, self.export_path)
+        except OSError as e:
+            self.logger.warning(f"  unable to export topic limits | {e}")
+
+    def start(self):
+        """
+        Polls the hot listings from a background thread, the first poll starts right away.
+        """
+        if self._thread and self._thread.is_alive():
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._poll_loop, name="topic-occupancy", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _poll_loop(self):
+        while not self._stop.is_set():
+            try:
+                self.poll_once()
+            except Exception as e:
+                self.counters['failures'] += 1
+                self.logger.error(f"  failed to poll the hot listings for topic limits | {e}")
+
+            self._stop.wait(self.poll_interval)
+
+    def stats(self):
+        return dict(self.counters)
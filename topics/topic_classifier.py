@@ -0,0 +1,106 @@
+import re
+
+# a pattern that refers to its own groups cannot be folded into the combined regex, the group numbers would shift
+GROUP_REFERENCE = re.compile(r'\\[1-9]|\(\?P=|\(\?P<')
+
+
+def to_fullname(submission_id):
+    return submission_id if submission_id.startswith("t3_") else "t3_" + submission_id
+
+
+class CommunityTopics:
+    """
+    The topics of a single community, compiled.  All the patterns are folded into one regex with a named group per
+    topic, each topic is an anchored lookahead so the alternatives are tried in topic order: the first topic with a
+    pattern anywhere in the title wins, the same as testing the topics one after another.
+    """
+
+    def __init__(self, topics):
+        self.topics = topics
+
+        # the topics (by position) that ignore / include a submission, by fullname
+        self.ignore = {}
+        self.include = {}
+        for idx, topic in enumerate(topics):
+            overrides = topic.get("overrides") or {}
+            for submission_id in overrides.get("ignore") or []:
+                self.ignore.setdefault(to_fullname(submission_id), set()).add(idx)
+            for submission_id in overrides.get("include") or []:
+                self.include.setdefault(to_fullname(submission_id), []).append(idx)
+
+        self.patterns = [[re.compile(p) for p in topic.get("patterns") or []] for topic in topics]
+        self.combined = self._combine(topics)
+
+    @staticmethod
+    def _combine(topics):
+        alternatives = []
+        for idx, topic in enumerate(topics):
+            patterns = topic.get("patterns") or []
+            if not patterns:
+                continue
+            if any(GROUP_REFERENCE.search(p) for p in patterns):
+                return None
+
+            alternatives.append(f"(?=.*?(?:{'|'.join(f'(?:{p})' for p in patterns)}))(?P<topic_{idx}>)")
+
+        if not alternatives:
+            return None
+
+        try:
+            return re.compile(f"^(?:{'|'.join(alternatives)})", re.DOTALL)
+        except re.error:
+            # e.g. an inline flag in the middle of a pattern, the topics are tested one by one instead
+            return None
+
+    def _first_match(self, title, ignored):
+        if self.combined is not None and not ignored:
+            match = self.combined.match(title)
+            return int(match.lastgroup[len("topic_"):]) if match else None
+
+        for idx, patterns in enumerate(self.patterns):
+            if idx not in ignored and any(p.search(title) for p in patterns):
+                return idx
+
+        return None
+
+    def classify(self, fullname, title):
+        ignored = self.ignore.get(fullname, set())
+        included = next((idx for idx in self.include.get(fullname, []) if idx not in ignored), None)
+
+        # an include override only wins over the patterns of the topics after it
+        matched = self._first_match(title.lower(), ignored)
+        candidates = [idx for idx in (included, matched) if idx is not None]
+        return self.topics[min(candidates)] if candidates else None
+
+
+class TopicClassifier:
+    """
+    Finds the limited topic a submission belongs to, from topic_meta.json.  The topics are compiled once (per
+    community) when the classifier is built, classify() then costs a set lookup and a single regex match.
+
+    post-bot and the topic limiter both classify with this, so a post counts against the same topic in both.
+    """
+
+    def __init__(self, topics):
+        """
+        :param topics: the topic_meta.json document
+        """
+        self.topics = topics or []
+
+        by_community = {}
+        for topic in self.topics:
+            by_community.setdefault(topic["community"].lower(), []).append(topic)
+
+        self.communities = {community: CommunityTopics(t) for community, t in by_community.items()}
+
+    def classify(self, fullname, title, community):
+        """
+        Returns the first topic of the community that the submission belongs to: either the topic includes it by
+        override, or one of the topic's patterns is found in the (lowercased) title, unless the topic ignores it.
+        :param fullname: the submission's fullname (t3_...)
+        :param title: the submission's title
+        :param community: the subreddit, without r/
+        :return: the topic from topic_meta.json, or None
+        """
+        topics = self.communities.get(community.lower())
+        return topics.classify(fullname, title) if topics else None
@@ -5,32 +5,37 @@
 #  the newest code, chmods the scripts to executable, and then starts all bots
 #
 
-PID=$( cat ../pid.txt )
+# asks a process to stop (SIGTERM) so that queued work can finish, and only kills it if it has not
+# exited after STOP_TIMEOUT seconds
+STOP_TIMEOUT=60
 
-if ps -p $PID > /dev/null; then
-   echo "donut-bot is running, stopping process..."
-   kill -9 $PID
-else
-   echo "donut-bot not running..."
-fi
+stop_process() {
+  local NAME=$1
+  local PID=$2
 
-FLAIR_PID=$( cat ../bots/flair.pid )
+  if [ -n "$PID" ] && ps -p $PID > /dev/null; then
+     echo "$NAME is running, stopping process..."
+     kill $PID
 
-if ps -p $FLAIR_PID > /dev/null; then
-   echo "flair-bot is running, stopping process..."
-   kill -9 $FLAIR_PID
-else
-   echo "flair-bot not running..."
-fi
+     for (( i=0; i<STOP_TIMEOUT; i++ )); do
+       if ! ps -p $PID > /dev/null; then
+         break
+       fi
+       sleep 1
+     done
 
-POST_PID=$( cat ../bots/post.pid )
+     if ps -p $PID > /dev/null; then
+       echo "$NAME did not stop within $STOP_TIMEOUT seconds, killing process..."
+       kill -9 $PID
+     fi
+  else
+     echo "$NAME not running..."
+  fi
+}
 
-if ps -p $POST_PID > /dev/null; then
-   echo "post-bot is running, stopping process..."
-   kill -9 $POST_PID
-else
-   echo "post-bot not running..."
-fi
+stop_process "donut-bot" $( cat ../pid.txt )
+stop_process "flair-bot" $( cat ../bots/flair.pid 2>/dev/null )
+stop_process "post-bot" $( cat ../bots/post.pid 2>/dev/null )
 
 #LS_STATUS="$(systemctl is-active litestream)"
 #if [ "$LS_STATUS" == "active" ]; then
@@ -61,10 +66,14 @@ git pull
 #echo "restarting database replication..."
 #sudo systemctl start litestream
 
+echo "applying database migrations..."
+python3.11 ad_hoc/setup/migrate.py
+
 echo "chmoding scripts to executable..."
 chmod +x donut-bot.sh
 chmod +x utils/*
 
 echo "completed successfully"
 echo "starting bots..."
-./donut-bot.sh
\ No newline at end of file
+# pass 'bus' / 'async' through to restart in single process mode (e.g. ./update.sh bus)
+./donut-bot.sh "$@"
\ No newline at end of file